@@ -0,0 +1,196 @@
+"""End-to-end agent loop benchmark using scripted, offline models.
+
+Runs `run_agent_loop` for 10/50/200 loops against synthetic workspaces of
+different sizes and reports, per run:
+  * orchestrator overhead per loop (wall time minus tool time and simulated LLM latency),
+  * total time spent inside tools,
+  * memory growth (tracemalloc current/peak) and final prompt-state size.
+
+Usage:
+    python benchmarks/loop.py [--loops 10,50,200] [--sizes small,medium,large] [--latency 0] [--structured] [--json]
+"""
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from g_wave import main
+from g_wave.cache import configure_cache
+from g_wave.fakes import ScriptedChatModel, install_fakes
+
+# name -> (number of files, lines per file)
+WORKSPACE_SIZES = {
+    "small": (20, 50),
+    "medium": (200, 200),
+    "large": (1000, 500),
+}
+
+
+def make_workspace(root: str, n_files: int, lines_per_file: int) -> list:
+    """Writes a synthetic Python package under `root` and returns the relative file paths."""
+    files = []
+    for i in range(n_files):
+        rel = os.path.join("src", f"pkg_{i // 50}", f"module_{i}.py")
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for n in range(lines_per_file):
+                f.write(f"def function_{i}_{n}(value):\n    return value * {n} + {i}\n" if n % 2 == 0 else "\n")
+        files.append(rel)
+    return files
+
+
+def make_fakes(files: list, latency: float, structured: bool = False) -> dict:
+    """Scripted planner/actor/coder that cycle through reads, listings, shell commands and writes.
+
+    With `structured`, the planner answers with JSON tool calls instead of prose for the actor.
+    """
+    step = {"n": 0}
+
+    def plan(prompt: str) -> str:
+        if "comprehensive summary" in prompt:
+            return "Summary: benchmark run complete."
+        n = step["n"]
+        step["n"] += 1
+        if n % 5 == 4:
+            tool, args = "save_file", {"filename": f"bench_out/out_{n}.py"}
+        elif n % 5 == 3:
+            tool, args = "list_files", {"path": os.path.dirname(files[n % len(files)])}
+        elif n % 5 == 2:
+            tool, args = "run_command", {"command": f"ls {os.path.dirname(files[n % len(files)])}"}
+        else:
+            tool, args = "read_file", {"filename": files[n % len(files)]}
+        if structured:
+            return json.dumps({"thoughts": f"step {n}", "tool": tool, "args": args})
+        return "Next: " + "|".join([tool] + [f"{k}={v}" for k, v in args.items()])
+
+    def act(prompt: str) -> str:
+        match = re.search(r"Next: (\S+)", prompt)
+        return match.group(1) if match else "finish|reason=no plan"
+
+    code = "def generated(value):\n    return value + 1\n"
+    return {
+        "planner": ScriptedChatModel(model_name="bench-planner", script=plan, latency=latency),
+        "coder": ScriptedChatModel(model_name="bench-coder", responses=[code], latency=latency),
+        "fallback_coder": ScriptedChatModel(model_name="bench-fallback", responses=[code], latency=latency),
+        "actor": ScriptedChatModel(model_name="bench-actor", script=act, latency=latency),
+    }
+
+
+def instrument_tools() -> dict:
+    """Wraps every tool in main.TOOLS with a timer; returns the accumulator and originals."""
+    stats = {"seconds": 0.0, "calls": 0, "originals": dict(main.TOOLS)}
+
+    def timed(fn):
+        # Coroutine tools (run_command) need a coroutine wrapper: the loop awaits them rather than
+        # sending them to a worker thread, and a sync wrapper would time only the coroutine's creation
+        if inspect.iscoroutinefunction(fn):
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    stats["seconds"] += time.perf_counter() - start
+                    stats["calls"] += 1
+            return async_wrapper
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stats["seconds"] += time.perf_counter() - start
+                stats["calls"] += 1
+        return wrapper
+
+    for name, fn in stats["originals"].items():
+        main.TOOLS[name] = timed(fn)
+    return stats
+
+
+def run_case(size: str, loops: int, latency: float, structured: bool = False) -> dict:
+    n_files, lines = WORKSPACE_SIZES[size]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"g_wave_bench_{size}_") as root:
+        files = make_workspace(root, n_files, lines)
+        os.chdir(root)
+        fakes = make_fakes(files, latency, structured)
+        install_fakes(fakes)
+        tools = instrument_tools()
+        try:
+            tracemalloc.start()
+            mem_before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                # Never self-heal here: that would copy, promote or delete the package's own main.py
+                state = main.run_agent_loop("benchmark task", max_loops=loops, original_task="benchmark task",
+                                            structured=structured, self_heal=False)
+            wall = time.perf_counter() - start
+            mem_after, mem_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            main.TOOLS.update(tools["originals"])
+            os.chdir(cwd)
+
+    llm_calls = sum(f.calls for f in fakes.values())
+    if structured:
+        # Planner, then the coder only for writes; plus the summary call.
+        llm_wait = latency * (fakes["planner"].calls + fakes["coder"].calls)
+    else:
+        # Planner, then coder || actor: two latencies on the critical path per loop, plus the summary call.
+        llm_wait = latency * (2 * loops + 1)
+    overhead = max(wall - tools["seconds"] - llm_wait, 0.0)
+    state_bytes = sum(len(h) for h in state["history"]) + sum(len(c) for c in state["files_content"].values())
+    return {
+        "size": size,
+        "files": n_files,
+        "loops": loops,
+        "status": state["status"],
+        "wall_s": round(wall, 4),
+        "overhead_ms_per_loop": round(overhead / loops * 1000, 3),
+        "tool_s": round(tools["seconds"], 4),
+        "tool_calls": tools["calls"],
+        "llm_calls": llm_calls,
+        "mem_growth_kb": round((mem_after - mem_before) / 1024, 1),
+        "mem_peak_kb": round(mem_peak / 1024, 1),
+        "state_kb": round(state_bytes / 1024, 1),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loops", default="10,50,200", help="Comma-separated loop counts.")
+    parser.add_argument("--sizes", default="small,medium,large", help=f"Comma-separated workspace sizes {list(WORKSPACE_SIZES)}.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per LLM call.")
+    parser.add_argument("--structured", action="store_true", help="Benchmark the structured tool-call mode (no actor calls).")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines.")
+    args = parser.parse_args()
+
+    configure_cache(enabled=False)
+    # Warm-up run so lazy imports (langchain, prompt templates) are not billed to the first case.
+    run_case("small", 1, 0.0)
+    results = []
+    for size in args.sizes.split(","):
+        for loops in (int(n) for n in args.loops.split(",")):
+            result = run_case(size, loops, args.latency, args.structured)
+            results.append(result)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{size:>6} {result['files']:>5} files {loops:>4} loops | "
+                      f"overhead {result['overhead_ms_per_loop']:8.3f} ms/loop | "
+                      f"tools {result['tool_s']:7.3f} s ({result['tool_calls']} calls) | "
+                      f"mem +{result['mem_growth_kb']:9.1f} KB (peak {result['mem_peak_kb']:9.1f} KB) | "
+                      f"state {result['state_kb']:8.1f} KB")
+            sys.stdout.flush()
+    return results
+
+
+if __name__ == "__main__":
+    main_cli()
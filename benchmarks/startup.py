@@ -0,0 +1,94 @@
+"""Startup benchmark for the g_wave CLI.
+
+Tracks two numbers:
+  * the `python -X importtime` cost of importing `g_wave.main`, and
+  * how long the `app` Typer CLI takes to answer `--help`.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--json] [--max-help-ms 1500]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Provider SDKs that must not be imported just to start the CLI.
+PROVIDER_MODULES = ("langchain_google_genai", "langchain_openai", "langchain_anthropic")
+
+
+def measure_importtime(module: str = "g_wave.main") -> dict:
+    """Imports `module` under `-X importtime` and parses the per-module timings."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = next((cum for name, _, cum in timings if name == module), 0)
+    slowest = sorted(timings, key=lambda t: t[1], reverse=True)[:10]
+    imported = {name for name, _, _ in timings}
+    return {
+        "total_ms": total_us / 1000,
+        "slowest_self_ms": [(name, self_us / 1000) for name, self_us, _ in slowest],
+        "provider_sdks_imported": [m for m in PROVIDER_MODULES if m in imported],
+    }
+
+
+def measure_cli_help() -> float:
+    """Returns the wall-clock time (ms) for `python -m g_wave.main --help`."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "g_wave.main", "--help"], capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"`g_wave --help` failed:\n{result.stderr}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of repetitions per measurement.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    parser.add_argument("--max-help-ms", type=float, default=None, help="Exit non-zero if median --help time exceeds this.")
+    args = parser.parse_args()
+
+    imports = [measure_importtime() for _ in range(args.runs)]
+    helps = [measure_cli_help() for _ in range(args.runs)]
+
+    report = {
+        "runs": args.runs,
+        "import_ms_median": statistics.median(r["total_ms"] for r in imports),
+        "import_ms_min": min(r["total_ms"] for r in imports),
+        "help_ms_median": statistics.median(helps),
+        "help_ms_min": min(helps),
+        "provider_sdks_imported": imports[-1]["provider_sdks_imported"],
+        "slowest_imports_ms": imports[-1]["slowest_self_ms"],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import g_wave.main : median {report['import_ms_median']:.1f} ms (min {report['import_ms_min']:.1f} ms)")
+        print(f"g_wave --help      : median {report['help_ms_median']:.1f} ms (min {report['help_ms_min']:.1f} ms)")
+        print(f"provider SDKs imported at startup: {report['provider_sdks_imported'] or 'none'}")
+        print("slowest imports (self time):")
+        for name, ms in report["slowest_imports_ms"]:
+            print(f"  {ms:8.1f} ms  {name}")
+
+    if report["provider_sdks_imported"]:
+        sys.exit(1)
+    if args.max_help_ms is not None and report["help_ms_median"] > args.max_help_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from g_wave.workspace import reset_root, reset_workspace, use_root, use_workspace
+
+# --- Per-task Output Capture ---
+# Tasks share one process, so their `print` output is routed to a log file in
+# each task's workspace instead of being interleaved on the console.
+_task_log: contextvars.ContextVar = contextvars.ContextVar("g_wave_task_log", default=None)
+
+
+class ContextStdout:
+    """sys.stdout stand-in that writes to the current task's log, or the real stdout outside tasks."""
+
+    def __init__(self, console):
+        self.console = console
+
+    def _target(self):
+        return _task_log.get() or self.console
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.console, name)
+
+
+# --- Task Files ---
+def load_tasks(path: str) -> List[Dict[str, Any]]:
+    """Reads a tasks JSONL file. Lines may be objects with a "task" key or bare JSON strings."""
+    tasks = []
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"task": record}
+            if "task" not in record:
+                raise ValueError(f"{path}:{line_no}: missing 'task'")
+            record.setdefault("id", f"line-{line_no}")
+            record["id"] = str(record["id"])
+            tasks.append(record)
+    ids = [t["id"] for t in tasks]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"{path}: task ids must be unique")
+    return tasks
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids of tasks that already have a result line, so an interrupted batch can resume."""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                continue  # tolerate a partially written last line
+    return done
+
+
+def workspace_for(root: str, task_id: str) -> str:
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", task_id))
+
+
+# --- Runner ---
+async def arun_batch(run_loop: Callable[..., Awaitable[Dict[str, Any]]], tasks_file: str, output: str,
+                     workers: int = 4, max_loops: int = 20, workspace_root: str = "g_wave_batch",
+                     max_cost: Optional[float] = None, structured: bool = False,
+                     plan_ahead: bool = False, patch: bool = False,
+                     rollback_on_error: bool = False, persistent_shell: bool = False,
+                     retrieval: bool = False) -> List[Dict[str, Any]]:
+    """Runs every pending task in `tasks_file` with at most `workers` in flight.
+
+    `run_loop` is the agent entry point (arun_agent_loop). Results are appended to
+    `output` as each task finishes.
+    """
+    tasks = load_tasks(tasks_file)
+    done = completed_ids(output)
+    pending = [t for t in tasks if t["id"] not in done]
+    print(f"Batch: {len(tasks)} tasks, {len(done & {t['id'] for t in tasks})} already done, "
+          f"{len(pending)} to run with {workers} workers.")
+
+    semaphore = asyncio.Semaphore(max(workers, 1))
+    write_lock = asyncio.Lock()
+    results: List[Dict[str, Any]] = []
+    console = sys.stdout
+
+    async def run_one(record: Dict[str, Any]) -> None:
+        async with semaphore:
+            workspace = workspace_for(workspace_root, record["id"])
+            os.makedirs(workspace, exist_ok=True)
+            # The workspace is also the task's working directory: reads, listings, searches,
+            # retrieval and shell commands resolve there rather than in the shared process cwd
+            token, root_token = use_workspace(workspace), use_root(workspace)
+            start = time.perf_counter()
+            result = {"id": record["id"], "task": record["task"], "workspace": workspace}
+            with open(os.path.join(workspace, "agent.log"), "a") as log:
+                _task_log.set(log)
+                try:
+                    state = await run_loop(record["task"], max_loops=int(record.get("max_loops", max_loops)),
+                                           original_task=record["task"], max_cost=record.get("max_cost", max_cost),
+                                           self_heal=False, structured=structured, plan_ahead=plan_ahead, patch=patch,
+                                           rollback_on_error=rollback_on_error, persistent_shell=persistent_shell,
+                                           retrieval=retrieval)
+                    usage = state.get("usage", {})
+                    result.update(status=state["status"], run_id=state.get("run_id"), loops_used=state["loops_used"],
+                                  tokens={"input": usage.get("input_tokens", 0), "output": usage.get("output_tokens", 0)},
+                                  cost=usage.get("cost", 0.0))
+                except Exception as e:
+                    result.update(status="crashed", error=f"{type(e).__name__}: {e}")
+                finally:
+                    _task_log.set(None)
+                    reset_root(root_token)
+                    reset_workspace(token)
+            result["duration_s"] = round(time.perf_counter() - start, 3)
+
+            async with write_lock:
+                with open(output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+                results.append(result)
+                console.write(f"[{len(results)}/{len(pending)}] {result['id']}: {result['status']} "
+                              f"in {result['duration_s']}s ({result.get('loops_used', 0)} loops)\n")
+                console.flush()
+
+    sys.stdout = ContextStdout(console)
+    try:
+        await asyncio.gather(*(run_one(t) for t in pending))
+    finally:
+        sys.stdout = console
+    return results
+
+
+def run_batch(run_loop, tasks_file: str, output: str, **kwargs) -> List[Dict[str, Any]]:
+    """Blocking wrapper around arun_batch."""
+    try:
+        return asyncio.run(arun_batch(run_loop, tasks_file, output, **kwargs))
+    except KeyboardInterrupt:
+        print(f"\nBatch interrupted. Re-run the same command to resume; finished tasks are recorded in {output}.")
+        return []
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+# --- Cache Configuration ---
+# Overridable via environment so staging subprocesses inherit the same settings.
+DEFAULT_CACHE_PATH = os.getenv("G_WAVE_CACHE_PATH", str(Path.home() / ".cache" / "g_wave" / "responses.sqlite3"))
+DEFAULT_MAX_BYTES = int(float(os.getenv("G_WAVE_CACHE_MAX_MB", "200")) * 1024 * 1024)
+DEFAULT_MAX_AGE = float(os.getenv("G_WAVE_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+CACHEABLE_ROLES = ("planner", "coder", "actor")
+
+# Run eviction every N writes rather than on every put.
+EVICT_EVERY = 50
+
+
+class ReplayMiss(Exception):
+    """Raised in replay-only mode when a prompt has no cached response."""
+
+
+class ResponseCache:
+    """Content-addressed, on-disk (SQLite) store of LLM responses with LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE, roles: Iterable[str] = CACHEABLE_ROLES,
+                 replay_only: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.roles = set(roles)
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,"
+            " created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        """Content address for a (model, rendered prompt) pair."""
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def enabled_for(self, role: str) -> bool:
+        return role in self.roles
+
+    def get(self, model_name: str, prompt: str) -> Optional[str]:
+        """Returns the cached response and marks it as recently used, or None."""
+        key = self.key(model_name, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, model_name: str, prompt: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(model_name, prompt), model_name, response,
+                 len(prompt.encode("utf-8")) + len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drops entries unused for longer than max_age, then least-recently-used ones beyond max_bytes."""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM responses WHERE last_used < ?", (time.time() - self.max_age,)
+            ).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                stale = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- Active Cache ---
+_cache: Optional[ResponseCache] = None
+_settings = {
+    "enabled": os.getenv("G_WAVE_CACHE", "1") not in ("0", "false", "off"),
+    "roles": tuple(r for r in os.getenv("G_WAVE_CACHE_ROLES", ",".join(CACHEABLE_ROLES)).split(",") if r),
+    "replay_only": os.getenv("G_WAVE_CACHE_REPLAY", "0") in ("1", "true", "on"),
+    "path": DEFAULT_CACHE_PATH,
+}
+
+
+def configure_cache(enabled: bool = True, roles: Iterable[str] = CACHEABLE_ROLES,
+                    replay_only: bool = False, path: str = None) -> None:
+    """Sets how the shared response cache behaves for subsequent model calls."""
+    global _cache
+    _settings.update(enabled=enabled or replay_only, roles=tuple(roles), replay_only=replay_only,
+                     path=path or _settings["path"])
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Returns the shared cache (opened on first use), or None when caching is disabled."""
+    global _cache
+    if not _settings["enabled"]:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(_settings["path"], roles=_settings["roles"], replay_only=_settings["replay_only"])
+    return _cache
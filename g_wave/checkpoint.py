@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from g_wave.journal import prune_run_dirs
+from g_wave.workspace import resolve_read_path
+
+# --- Checkpoint Configuration ---
+# After every completed loop a run appends what changed in its state to CHECKPOINT_DIR/<run id>/log.jsonl,
+# and every SNAPSHOT_EVERY loops it writes the whole state to snapshot.json, so `g_wave resume <run id>`
+# can pick up after a crash, Ctrl-C or self-improvement exit. Only the newest KEEP_CHECKPOINTS are kept.
+CHECKPOINT_DIR = os.getenv("G_WAVE_CHECKPOINT_DIR", os.path.join(".g_wave", "runs"))
+SNAPSHOT_EVERY = int(os.getenv("G_WAVE_SNAPSHOT_EVERY", "5"))
+KEEP_CHECKPOINTS = int(os.getenv("G_WAVE_KEEP_CHECKPOINTS", "20"))
+META_FILE, LOG_FILE, SNAPSHOT_FILE = "meta.json", "log.jsonl", "snapshot.json"
+
+# State lists that only ever grow during a run: the log stores just their new items
+APPEND_KEYS = ("history", "context_usage")
+
+
+def file_mtime(filename: str) -> Optional[int]:
+    try:
+        return os.stat(resolve_read_path(filename)).st_mtime_ns
+    except OSError:
+        return None
+
+
+class RunCheckpoint:
+    """Append-only log of a run's state after each completed loop, plus periodic full snapshots."""
+
+    def __init__(self, run_id: str, root: str = CHECKPOINT_DIR):
+        self.run_id = run_id
+        self.dir = Path(root) / run_id
+        self.meta: Dict[str, Any] = {}
+        self.seen = {key: 0 for key in APPEND_KEYS}
+        self.files: Dict[str, str] = {}
+        self.mtimes: Dict[str, Optional[int]] = {}
+        self.since_snapshot = 0
+        self.loop = 0
+        self.status = "running"
+
+    def start(self, meta: Dict[str, Any]) -> None:
+        """Records how the run was started (task, loop limit, options) for resuming it."""
+        from g_wave.writes import write_atomic
+
+        self.meta = {"run_id": self.run_id, "started": time.time(), **meta}
+        self.dir.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.dir / META_FILE, json.dumps(self.meta, indent=1))
+
+    def record(self, state: Dict[str, Any]) -> None:
+        """Appends the changes since the last record; writes a snapshot every SNAPSHOT_EVERY loops."""
+        if any(len(state.get(key, [])) < self.seen[key] for key in APPEND_KEYS):
+            self.snapshot(state)  # a list was rewritten rather than appended to; the log can't express that
+            return
+        files = state["files_content"]
+        changed = {name: body for name, body in files.items() if self.files.get(name) is not body}
+        entry = {
+            "loop": state["loops_used"],
+            **{key: state.get(key, [])[self.seen[key]:] for key in APPEND_KEYS},
+            "files_content": changed,
+            "removed_files": [name for name in self.files if name not in files],
+            "mtimes": {name: file_mtime(name) for name in changed},
+            "state": self._scalars(state),
+        }
+        with open(self.dir / LOG_FILE, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.utime(self.dir)  # appending doesn't touch the directory; pruning goes by its mtime
+        self._mark(state)
+        self.mtimes.update(entry["mtimes"])
+        for name in entry["removed_files"]:
+            self.mtimes.pop(name, None)
+        self.since_snapshot += 1
+        if self.since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot(state)
+
+    def snapshot(self, state: Dict[str, Any]) -> None:
+        from g_wave.writes import write_atomic
+
+        self.mtimes = {name: self.mtimes.get(name) if self.files.get(name) is body else file_mtime(name)
+                       for name, body in state["files_content"].items()}
+        snapshot = {"loop": state["loops_used"], "state": state, "mtimes": self.mtimes}
+        write_atomic(self.dir / SNAPSHOT_FILE, json.dumps(snapshot, default=str))
+        self._mark(state)
+        self.since_snapshot = 0
+
+    def _scalars(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in state.items() if key not in APPEND_KEYS and key != "files_content"}
+
+    def _mark(self, state: Dict[str, Any]) -> None:
+        self.seen = {key: len(state.get(key, [])) for key in APPEND_KEYS}
+        self.files = dict(state["files_content"])
+        self.loop = state["loops_used"]
+        self.status = state.get("status", "running")
+
+    def restore(self) -> Dict[str, Any]:
+        """Rebuilds the state after the last completed loop: the snapshot plus the log records after it."""
+        state: Dict[str, Any] = {"history": [], "files_content": {}, "context_usage": [], "loops_used": 0}
+        snapshot_loop = -1
+        try:
+            with open(self.dir / SNAPSHOT_FILE) as f:
+                snapshot = json.load(f)
+            state, snapshot_loop, self.mtimes = snapshot["state"], snapshot["loop"], snapshot["mtimes"]
+        except (OSError, ValueError, KeyError):
+            pass
+        for entry in self._log_entries():
+            if entry["loop"] <= snapshot_loop:
+                continue
+            for key in APPEND_KEYS:
+                state.setdefault(key, []).extend(entry[key])
+            state["files_content"].update(entry["files_content"])
+            for name in entry["removed_files"]:
+                state["files_content"].pop(name, None)
+                self.mtimes.pop(name, None)
+            self.mtimes.update(entry["mtimes"])
+            state.update(entry["state"])
+        self._mark(state)
+        return state
+
+    def _log_entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        try:
+            with open(self.dir / LOG_FILE) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # a record cut short by a crash; everything before it is intact
+        except OSError:
+            pass
+        return entries
+
+    def revalidate(self, state: Dict[str, Any], reread) -> List[str]:
+        """Re-reads (with `reread(name)`) cached files whose mtime changed since they were checkpointed,
+        drops ones that no longer exist, and returns a note per file touched."""
+        notes = []
+        for name in list(state["files_content"]):
+            mtime = file_mtime(name)
+            if mtime is None:
+                del state["files_content"][name]
+                notes.append(f"{name} no longer exists; dropped from File Contents")
+            elif mtime != self.mtimes.get(name):
+                state["files_content"][name] = reread(name)
+                notes.append(f"{name} changed on disk since the checkpoint; re-read")
+            self.mtimes[name] = mtime
+        return notes
+
+
+def load_checkpoint(run_id: str, root: str = CHECKPOINT_DIR) -> RunCheckpoint:
+    """Reopens a run's checkpoint from disk for `g_wave resume`."""
+    checkpoint = RunCheckpoint(run_id, root)
+    try:
+        with open(checkpoint.dir / META_FILE) as f:
+            checkpoint.meta = json.load(f)
+    except (OSError, ValueError):
+        raise FileNotFoundError(f"No checkpoint for run '{run_id}' in {root}.")
+    return checkpoint
+
+
+def prune_checkpoints(root: str = CHECKPOINT_DIR, keep: int = KEEP_CHECKPOINTS) -> None:
+    """Deletes all but the `keep` most recently modified checkpoints of runs not in progress here."""
+    prune_run_dirs(root, keep)
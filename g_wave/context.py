@@ -0,0 +1,143 @@
+import os
+from typing import Any, Dict, List, Optional
+
+# --- Budget Configuration ---
+# Token budgets per role for the context sections (task, history, file contents)
+# placed into each prompt. Override with e.g. G_WAVE_PLANNER_TOKEN_BUDGET=12000.
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "planner": 8000,
+    "coder": 16000,
+}
+
+# History entries newer than this are kept verbatim; older ones are compacted.
+RECENT_HISTORY = int(os.getenv("G_WAVE_RECENT_HISTORY", "5"))
+COMPACT_ENTRY_CHARS = 200
+# File bodies shorter than this are cheap enough to leave in history as-is.
+MIN_DEDUPE_CHARS = 80
+
+
+def get_budget(role: str, overrides: Optional[Dict[str, int]] = None) -> int:
+    """Returns the token budget for a role, honouring explicit overrides and environment variables."""
+    if overrides and role in overrides:
+        return overrides[role]
+    env_value = os.getenv(f"G_WAVE_{role.upper()}_TOKEN_BUDGET")
+    if env_value:
+        return int(env_value)
+    return DEFAULT_BUDGETS.get(role, DEFAULT_BUDGETS["planner"])
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, dependency-free token estimate (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` down to roughly `max_tokens`, leaving a marker with the number of dropped characters."""
+    max_chars = max(max_tokens, 0) * 4
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}\n... [truncated {len(text) - max_chars} chars]"
+
+
+# --- History ---
+def dedupe_history(history: List[str], files_content: Dict[str, str]) -> List[str]:
+    """Replaces file bodies already present in File Contents with a short reference."""
+    deduped = []
+    for entry in history:
+        for filename, body in files_content.items():
+            if len(body) >= MIN_DEDUPE_CHARS and body in entry:
+                entry = entry.replace(body, f"[contents of {filename} shown in File Contents]")
+        deduped.append(entry)
+    return deduped
+
+
+def compact_entry(entry: str) -> str:
+    """Shrinks an old history entry to its first line, capped at COMPACT_ENTRY_CHARS."""
+    first_line = entry.strip().splitlines()[0] if entry.strip() else ""
+    if len(first_line) > COMPACT_ENTRY_CHARS:
+        first_line = first_line[:COMPACT_ENTRY_CHARS] + "..."
+    elif first_line != entry.strip():
+        first_line += " ..."
+    return first_line
+
+
+def fit_history(history: List[str], files_content: Dict[str, str], max_tokens: int) -> str:
+    """Formats history within `max_tokens`: recent entries verbatim, older ones compacted, oldest dropped."""
+    if not history:
+        return ""
+    entries = dedupe_history(history, files_content)
+    cutoff = max(len(entries) - RECENT_HISTORY, 0)
+    entries = [compact_entry(e) for e in entries[:cutoff]] + entries[cutoff:]
+
+    kept: List[str] = []
+    used = 0
+    for entry in reversed(entries):
+        cost = estimate_tokens(entry) + 1
+        if used + cost > max_tokens:
+            if not kept:
+                kept.append(truncate_to_tokens(entry, max_tokens))
+            break
+        kept.append(entry)
+        used += cost
+    kept.reverse()
+
+    omitted = len(entries) - len(kept)
+    if omitted:
+        kept.insert(0, f"[{omitted} earlier actions omitted]")
+    return "\n".join(kept)
+
+
+# --- File Contents ---
+def fit_files(files_content: Dict[str, str], max_tokens: int) -> str:
+    """Formats known files within `max_tokens`, preferring the most recently read ones."""
+    if not files_content:
+        return ""
+    blocks: List[str] = []
+    used = 0
+    for filename, body in reversed(list(files_content.items())):
+        header = f"--- {filename} ---\n"
+        remaining = max_tokens - used - estimate_tokens(header)
+        if remaining <= 0:
+            blocks.append(f"--- {filename} --- [omitted: token budget exhausted]")
+            continue
+        block = header + truncate_to_tokens(body, remaining)
+        blocks.append(block)
+        used += estimate_tokens(block)
+    blocks.reverse()
+    return "\n".join(blocks)
+
+
+# --- Builder ---
+def build_context(role: str, state: Dict[str, Any], reserved: str = "",
+                  budgets: Optional[Dict[str, int]] = None, files: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Builds the history and file-content prompt sections for `role` within its token budget.
+
+    `reserved` is other prompt text (task, plan) that counts against the budget. `files`
+    replaces the run's known file contents (e.g. with a scoped subset for the coder).
+    Returns the formatted sections plus a per-section token usage report.
+    """
+    budget = get_budget(role, budgets)
+    remaining = max(budget - estimate_tokens(reserved), 0)
+    files_content = state.get("files_content", {}) if files is None else files
+    history = state.get("history", []) if role == "planner" else []
+
+    history_full = fit_history(history, files_content, remaining) if history else ""
+    files_budget = max(remaining - estimate_tokens(history_full), int(remaining * 0.6))
+    files_text = fit_files(files_content, files_budget)
+    history_text = fit_history(history, files_content, remaining - estimate_tokens(files_text)) if history else ""
+
+    usage = {
+        "role": role,
+        "budget": budget,
+        "reserved": estimate_tokens(reserved),
+        "history": estimate_tokens(history_text),
+        "files_content": estimate_tokens(files_text),
+    }
+    usage["total"] = usage["reserved"] + usage["history"] + usage["files_content"]
+    return {"history": history_text, "files_content": files_text, "usage": usage}
+
+
+def format_usage(usage: Dict[str, Any]) -> str:
+    """One-line summary of a context usage report."""
+    return (f"Context ({usage['role']}): task/plan={usage['reserved']} history={usage['history']} "
+            f"files={usage['files_content']} total={usage['total']}/{usage['budget']} tokens")
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from g_wave.models import resolve, set_model
+from g_wave.ratelimit import set_limits
+
+# A response is either canned text or a function of the rendered prompt.
+Response = Union[str, Callable[[str], str]]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that replies from a script instead of the network.
+
+    `responses` are served in order (wrapping around when `cycle` is set);
+    `script`, if given, is called with the prompt text and takes precedence.
+    `recorded` maps exact prompt text to a response and is checked first.
+    `latency` seconds are slept per call to emulate network round trips; when streamed,
+    the reply arrives in `chunk_size`-character pieces spread over that latency.
+    """
+
+    model_name: str = "scripted"
+    responses: List[Response] = []
+    script: Optional[Callable[[str], str]] = None
+    recorded: Dict[str, str] = {}
+    latency: float = 0.0
+    cycle: bool = True
+    chunk_size: int = 16
+    calls: int = 0
+    last_prompt: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @classmethod
+    def from_recording(cls, path: str, role: str, **kwargs) -> "ScriptedChatModel":
+        """Builds a model from a JSONL recording of {"role", "response"[, "prompt"]} records."""
+        responses, recorded = [], {}
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("role") != role:
+                    continue
+                if "prompt" in record:
+                    recorded[record["prompt"]] = record["response"]
+                else:
+                    responses.append(record["response"])
+        return cls(responses=responses, recorded=recorded, **kwargs)
+
+    def _next_response(self, prompt: str) -> str:
+        self.last_prompt = prompt
+        self.calls += 1
+        if prompt in self.recorded:
+            return self.recorded[prompt]
+        if self.script is not None:
+            return self.script(prompt)
+        if not self.responses:
+            raise ValueError(f"{self.model_name}: no scripted responses left.")
+        index = self.calls - 1
+        if self.cycle:
+            index %= len(self.responses)
+        elif index >= len(self.responses):
+            raise ValueError(f"{self.model_name}: script exhausted after {len(self.responses)} responses.")
+        response = self.responses[index]
+        return response(prompt) if callable(response) else response
+
+    def _result(self, prompt: str, text: str) -> ChatResult:
+        input_tokens, output_tokens = (len(prompt) + 3) // 4, (len(text) + 3) // 4
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @staticmethod
+    def _prompt_text(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(prompt, self._next_response(prompt))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(prompt, self._next_response(prompt))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        text = self._next_response(prompt)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for piece in pieces:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        usage = self._result(prompt, text).generations[0].message.usage_metadata
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+
+def install_fakes(fakes: Dict[str, BaseChatModel]) -> None:
+    """Injects stand-in models for roles (planner, coder, ...) or providers (grok, gemini, ...).
+
+    Stand-ins never reach the provider, so its rate limits are lifted too.
+    """
+    for name, model in fakes.items():
+        set_model(name, model)
+        set_limits(resolve(name))
+
+
+def install_default_fakes(latency: float = 0.0) -> Dict[str, ScriptedChatModel]:
+    """Injects a trivial fake for every role that immediately finishes the task."""
+    fakes = {
+        # Answers structured-mode prompts (which ask for a "tool" key) with a JSON tool call
+        "planner": ScriptedChatModel(model_name="fake-planner", latency=latency, script=lambda prompt: (
+            '{"tool": "finish", "args": {"reason": "scripted run"}}' if '"tool"' in prompt else "finish: nothing to do")),
+        "coder": ScriptedChatModel(model_name="fake-coder", responses=["print('hello from fake coder')"], latency=latency),
+        "fallback_coder": ScriptedChatModel(model_name="fake-fallback-coder", responses=["print('hello')"], latency=latency),
+        "actor": ScriptedChatModel(model_name="fake-actor", responses=["finish|reason=scripted run"], latency=latency),
+    }
+    install_fakes(fakes)
+    return fakes
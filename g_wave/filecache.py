@@ -0,0 +1,148 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# --- Read Limits ---
+# A single read_file result never exceeds MAX_READ_BYTES; files larger than MMAP_THRESHOLD
+# are memory-mapped and only the requested lines are decoded. Decoded text of smaller files
+# is kept in an LRU cache of at most CACHE_BYTES, keyed by path + mtime + size.
+MAX_READ_BYTES = int(os.getenv("G_WAVE_MAX_READ_BYTES", str(128 * 1024)))
+MMAP_THRESHOLD = int(os.getenv("G_WAVE_MMAP_THRESHOLD", str(1024 * 1024)))
+CACHE_BYTES = int(os.getenv("G_WAVE_READ_CACHE_BYTES", str(32 * 1024 * 1024)))
+BINARY_SNIFF_BYTES = 8192
+
+
+class BinaryFileError(ValueError):
+    """The file looks binary (it contains NUL bytes), so it is not returned as text."""
+
+
+def _decode(data: bytes) -> str:
+    # Same newline handling as open(..., "r"), without failing on stray non-UTF-8 bytes
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def is_binary(sample: bytes) -> bool:
+    return b"\0" in sample
+
+
+# --- Cache ---
+class FileCache:
+    """LRU cache of decoded file text, invalidated whenever a file's mtime or size changes."""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # batched reads run on a thread pool
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, stat: os.stat_result, text: str) -> None:
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old:
+                self.used -= len(old[2])
+            if len(text) > self.max_bytes:
+                return
+            self.entries[path] = (stat.st_mtime_ns, stat.st_size, text)
+            self.used += len(text)
+            while self.used > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.used -= len(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+
+_cache = FileCache()
+
+
+def file_cache() -> FileCache:
+    return _cache
+
+
+# --- Reading ---
+def _load(path: str, stat: os.stat_result) -> str:
+    text = _cache.get(path, stat)
+    if text is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        if is_binary(data[:BINARY_SNIFF_BYTES]):
+            raise BinaryFileError(f"{path} is a binary file ({stat.st_size} bytes); not shown.")
+        text = _decode(data)
+        _cache.put(path, stat, text)
+    return text
+
+
+def _mapped_lines(path: str, stat: os.stat_result, first: int, limit: Optional[int], max_bytes: int) -> Tuple[str, int, bool]:
+    """Lines `first`.. (0-based) of a large file via mmap, without reading what precedes or follows them.
+
+    Returns (text, lines returned, whether the file continues past them).
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if is_binary(mm[:BINARY_SNIFF_BYTES]):
+            raise BinaryFileError(f"{path} is a binary file ({stat.st_size} bytes); not shown.")
+        start = 0
+        for _ in range(first):
+            start = mm.find(b"\n", start) + 1
+            if start == 0:
+                return "", 0, False
+        end, count = start, 0
+        while end < len(mm) and (limit is None or count < limit) and end - start <= max_bytes:
+            newline = mm.find(b"\n", end)
+            end = len(mm) if newline == -1 else newline + 1
+            count += 1
+        return _decode(mm[start:end]), count, end < len(mm)
+
+
+def read_view(path: str, offset: int = 1, limit: Optional[int] = None, max_bytes: int = MAX_READ_BYTES) -> str:
+    """Returns lines `offset`..`offset + limit - 1` (1-based) of `path` as text, at most `max_bytes` long.
+
+    Anything cut off (by `limit` or the byte cap) is replaced with a marker saying which lines
+    were shown and how to read on.
+    """
+    offset = max(int(offset or 1), 1)
+    limit = int(limit) if limit else None
+    stat = os.stat(path)
+    if stat.st_size > MMAP_THRESHOLD:
+        text, count, more = _mapped_lines(path, stat, offset - 1, limit, max_bytes)
+        total = None
+    else:
+        text = _load(path, stat)
+        if offset == 1 and limit is None and stat.st_size <= max_bytes:
+            return text
+        lines = text.splitlines(keepends=True)
+        total = len(lines)
+        selected = lines[offset - 1:offset - 1 + limit] if limit else lines[offset - 1:]
+        text, count = "".join(selected), len(selected)
+        more = offset - 1 + count < total
+
+    if len(text.encode("utf-8")) > max_bytes:
+        cut = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+        if "\n" in cut:
+            cut = cut[:cut.rindex("\n") + 1]
+        count = cut.count("\n") or 1
+        text, more = cut, True
+    if count == 0 and offset > 1:
+        return f"[{path} has no line {offset}" + (f"; it has {total} lines]" if total is not None else "]")
+    if not more and offset == 1:
+        return text
+    last = offset + count - 1
+    of_total = f" (of {total})" if total is not None else ""
+    marker = f"[showing lines {offset}-{last}{of_total} from {path}, {stat.st_size} bytes"
+    marker += f"; read more with offset={last + 1}]" if more else "]"
+    return text + ("" if text.endswith("\n") or not text else "\n") + marker
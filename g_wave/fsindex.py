@@ -0,0 +1,370 @@
+import fnmatch
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# --- Index Configuration ---
+# Directories never indexed, whatever .gitignore says, and the most entries one index holds.
+ALWAYS_IGNORED = {".git", ".hg", ".svn", ".g_wave"}
+MAX_ENTRIES = int(os.getenv("G_WAVE_INDEX_MAX_ENTRIES", "200000"))
+
+
+# --- Ignore Rules ---
+def glob_to_regex(pattern: str) -> str:
+    """Regex for a gitignore-style glob: `*` and `?` stay within a path segment, `**` spans segments."""
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        c = pattern[i]
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+@dataclass
+class IgnoreRule:
+    regex: "re.Pattern"
+    negate: bool
+    dir_only: bool
+    anchored: bool  # matched against the path below `base`, else against the basename
+    base: str       # directory of the .gitignore, relative to the index root ("" for the root)
+
+
+def parse_gitignore(text: str, base: str) -> List[IgnoreRule]:
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if line:
+            rules.append(IgnoreRule(re.compile(f"^{glob_to_regex(line)}$"), negate, dir_only, anchored, base))
+    return rules
+
+
+def is_ignored(rel_path: str, is_dir: bool, rules: List[IgnoreRule]) -> bool:
+    """Applies `rules` (outermost .gitignore first) to `rel_path`; the last matching rule wins."""
+    ignored = False
+    name = rel_path.rsplit("/", 1)[-1]
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if rule.base:
+            if not rel_path.startswith(rule.base + "/"):
+                continue
+            below = rel_path[len(rule.base) + 1:]
+        else:
+            below = rel_path
+        if rule.regex.match(below if rule.anchored else name):
+            ignored = not rule.negate
+    return ignored
+
+
+# --- Index ---
+@dataclass
+class Entry:
+    path: str      # relative to the index root, "/"-separated
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+def _join(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+class WorkspaceIndex:
+    """Every non-ignored file and directory under `root`, with size, mtime and type.
+
+    Built once with os.scandir, then kept current by `refresh()`, which re-lists only the
+    directories whose mtime changed, and by `update()` for individual files.
+    """
+
+    def __init__(self, root: str, max_entries: int = MAX_ENTRIES):
+        self.root = os.path.abspath(root)
+        self.max_entries = max_entries
+        self.entries: Dict[str, Entry] = {}
+        self.children: Dict[str, Set[str]] = {}
+        self.dir_mtimes: Dict[str, int] = {}
+        self.rules: Dict[str, List[IgnoreRule]] = {}
+        self.ignore_mtimes: Dict[str, int] = {}
+        self.truncated = False
+        self.on_demand = False  # root is ignored by the enclosing workspace's .gitignore
+        self.lock = threading.Lock()  # batched tools run on a thread pool
+        self.build()
+
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.root, rel) if rel else self.root
+
+    def _rules_for(self, rel_dir: str) -> List[IgnoreRule]:
+        rules, prefix = list(self.rules.get("", [])), ""
+        for part in rel_dir.split("/") if rel_dir else []:
+            prefix = _join(prefix, part)
+            rules.extend(self.rules.get(prefix, []))
+        return rules
+
+    def _load_rules(self, rel_dir: str) -> None:
+        path = os.path.join(self._abs(rel_dir), ".gitignore")
+        try:
+            stat = os.stat(path)
+            with open(path, "r", errors="replace") as f:
+                self.rules[rel_dir] = parse_gitignore(f.read(), rel_dir)
+            self.ignore_mtimes[rel_dir] = stat.st_mtime_ns
+        except OSError:
+            self.rules.pop(rel_dir, None)
+            self.ignore_mtimes.pop(rel_dir, None)
+
+    def _remove(self, rel: str) -> None:
+        entry = self.entries.pop(rel, None)
+        if entry and entry.is_dir:
+            for child in self.children.pop(rel, set()):
+                self._remove(_join(rel, child))
+            self.dir_mtimes.pop(rel, None)
+            self.rules.pop(rel, None)
+            self.ignore_mtimes.pop(rel, None)
+
+    def _scan(self, rel_dir: str) -> None:
+        """(Re-)lists `rel_dir` and scans any subdirectory not indexed yet."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                self.dir_mtimes[current] = os.stat(self._abs(current)).st_mtime_ns
+                with os.scandir(self._abs(current)) as it:
+                    listing = list(it)
+            except OSError:
+                continue
+            self._load_rules(current)
+            rules = self._rules_for(current)
+            seen, complete = set(), True
+            for item in listing:
+                rel = _join(current, item.name)
+                try:
+                    is_dir = item.is_dir(follow_symlinks=False)
+                    if item.name in ALWAYS_IGNORED or is_ignored(rel, is_dir, rules):
+                        continue
+                    stat = item.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if rel not in self.entries and len(self.entries) >= self.max_entries:
+                    self.truncated, complete = True, False
+                    break
+                seen.add(item.name)
+                known = self.entries.get(rel)
+                if known is not None and known.is_dir != is_dir:
+                    self._remove(rel)
+                    known = None
+                self.entries[rel] = Entry(rel, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime)
+                if is_dir and known is None:
+                    self.children.setdefault(rel, set())
+                    stack.append(rel)
+            if complete:
+                for gone in self.children.get(current, set()) - seen:
+                    self._remove(_join(current, gone))
+                self.children[current] = seen
+            else:
+                self.children.setdefault(current, set()).update(seen)
+
+    def build(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.children.clear()
+            self.dir_mtimes.clear()
+            self.rules.clear()
+            self.ignore_mtimes.clear()
+            self.truncated = False
+            self._scan("")
+
+    def refresh(self) -> int:
+        """Re-lists directories whose mtime changed; rebuilds if a .gitignore changed. Returns dirs re-listed."""
+        for rel_dir, mtime in list(self.ignore_mtimes.items()):
+            try:
+                changed = os.stat(os.path.join(self._abs(rel_dir), ".gitignore")).st_mtime_ns != mtime
+            except OSError:
+                changed = True
+            if changed:
+                self.build()
+                return len(self.dir_mtimes)
+        rescanned, rules_changed = 0, False
+        with self.lock:
+            for rel_dir, mtime in list(self.dir_mtimes.items()):
+                if rel_dir not in self.dir_mtimes:
+                    continue  # removed along with a parent
+                try:
+                    current = os.stat(self._abs(rel_dir)).st_mtime_ns
+                except OSError:
+                    self._remove(rel_dir)
+                    continue
+                if current != mtime:
+                    had_rules = self.ignore_mtimes.get(rel_dir)
+                    self._scan(rel_dir)
+                    rescanned += 1
+                    rules_changed |= self.ignore_mtimes.get(rel_dir) != had_rules
+        if rules_changed:
+            # A .gitignore appeared or was replaced; entries below it may now be (un)ignored
+            self.build()
+            return len(self.dir_mtimes)
+        return rescanned
+
+    def update(self, path: str) -> None:
+        """Re-stats one file after it was written (in-place writes don't change the directory's mtime)."""
+        rel = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+        if rel.startswith(".."):
+            return
+        with self.lock:
+            entry = self.entries.get(rel)
+            if entry is None or entry.is_dir:
+                return
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            entry.size, entry.mtime = stat.st_size, stat.st_mtime
+
+    def walk(self, rel_dir: str = "", max_depth: Optional[int] = None) -> List[Entry]:
+        """Entries below `rel_dir`, at most `max_depth` levels down (1 = direct children)."""
+        found, stack = [], [(rel_dir, 1)]
+        with self.lock:
+            while stack:
+                current, depth = stack.pop()
+                for name in self.children.get(current, ()):
+                    entry = self.entries[_join(current, name)]
+                    found.append(entry)
+                    if entry.is_dir and (max_depth is None or depth < max_depth):
+                        stack.append((entry.path, depth + 1))
+        return found
+
+
+_indexes: Dict[str, WorkspaceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: str = ".") -> WorkspaceIndex:
+    """The shared index for `root`: built on first use, refreshed incrementally afterwards."""
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = WorkspaceIndex(key)
+            return index
+    index.refresh()
+    return index
+
+
+_listeners: List[Callable[[str], None]] = []
+
+
+def on_file_changed(listener: Callable[[str], None]) -> None:
+    """Registers `listener(path)` to run after the agent writes a file (e.g. to update a search index)."""
+    _listeners.append(listener)
+
+
+def file_changed(path: str) -> None:
+    """Tells every index containing `path` that the file was just written."""
+    for index in list(_indexes.values()):
+        index.update(path)
+    for listener in _listeners:
+        listener(path)
+
+
+def index_for(path: str) -> Tuple[WorkspaceIndex, str]:
+    """(index, directory relative to its root) for listing `path`: the cwd's index when `path` is inside it.
+
+    A directory the cwd's index leaves out (build/, venv/ and the like, via .gitignore) gets an
+    index of its own, scanned on demand, since the caller asked for it by name.
+    """
+    target = os.path.abspath(path)
+    cwd = os.getcwd()
+    if target == cwd or target.startswith(cwd + os.sep):
+        rel = os.path.relpath(target, cwd).replace(os.sep, "/")
+        index = get_index(cwd)
+        if rel == ".":
+            return index, ""
+        with index.lock:
+            indexed = rel in index.children
+        if indexed or index.truncated:
+            return index, rel
+        index = get_index(target)
+        index.on_demand = True
+        return index, ""
+    return get_index(target), ""
+
+
+# --- Listing ---
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def matches(entry: Entry, pattern: str, rel_dir: str) -> bool:
+    """Glob match against the basename, or the path below `rel_dir` for patterns with a '/'."""
+    if "/" in pattern:
+        below = entry.path[len(rel_dir) + 1:] if rel_dir else entry.path
+        return re.match(f"^{glob_to_regex(pattern)}$", below) is not None
+    return fnmatch.fnmatchcase(entry.path.rsplit("/", 1)[-1], pattern)
+
+
+def list_entries(path: str = ".", recursive: bool = False, pattern: Optional[str] = None,
+                 max_depth: Optional[int] = None, sort: str = "name", limit: int = 200) -> str:
+    """Formats a listing of `path` from the workspace index: one entry per line, directories with a '/'."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"'{path}' does not exist.")
+    if not os.path.isdir(path):
+        raise NotADirectoryError(f"'{path}' is a file; use read_file to read it.")
+    if sort not in ("name", "size", "mtime"):
+        raise ValueError(f"sort must be 'name', 'size' or 'mtime', got {sort!r}.")
+    index, rel_dir = index_for(path)
+    # A pattern with a '/' or '**' names files below subdirectories, so it implies recursion
+    recursive = recursive or bool(pattern and ("/" in pattern or "**" in pattern))
+    depth = max_depth if max_depth else (None if recursive else 1)
+    entries = index.walk(rel_dir, depth)
+    if pattern:
+        entries = [e for e in entries if not e.is_dir and matches(e, pattern, rel_dir)]
+    if sort == "size":
+        entries.sort(key=lambda e: (-e.size, e.path))
+    elif sort == "mtime":
+        entries.sort(key=lambda e: (-e.mtime, e.path))
+    else:
+        entries.sort(key=lambda e: e.path)
+    if not entries:
+        return "No matching files." if pattern else "No files in directory."
+
+    lines = [f"[{path} is ignored by .gitignore; listed from an on-demand scan]"] if index.on_demand else []
+    for entry in entries[:limit]:
+        shown = entry.path[len(rel_dir) + 1:] if rel_dir else entry.path
+        lines.append(f"{shown}/" if entry.is_dir else f"{shown} ({format_size(entry.size)})")
+    if len(entries) > limit:
+        lines.append(f"... and {len(entries) - limit} more (narrow with pattern or max_depth, or raise limit)")
+    if index.truncated:
+        lines.append(f"[index stopped at {index.max_entries} entries; some files are not listed]")
+    return "\n".join(lines)
@@ -0,0 +1,136 @@
+import contextvars
+import json
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# --- Journal Configuration ---
+# Each run records the original content of every file it writes under JOURNAL_DIR/<run id>,
+# so its changes can be undone with `g_wave rollback <run id>`. Only the newest KEEP_JOURNALS
+# journals are kept.
+JOURNAL_DIR = os.getenv("G_WAVE_JOURNAL_DIR", os.path.join(".g_wave", "journal"))
+KEEP_JOURNALS = int(os.getenv("G_WAVE_KEEP_JOURNALS", "20"))
+ENTRIES_FILE = "entries.jsonl"
+
+
+class RunJournal:
+    """Append-only record of the files a run changed, with a backup of each file's original content."""
+
+    def __init__(self, run_id: Optional[str] = None, root: str = JOURNAL_DIR):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.dir = Path(root) / self.run_id
+        self.recorded: Dict[str, Optional[str]] = {}
+        self.failed: Dict[str, str] = {}  # path -> error, from the last rollback
+        self.lock = threading.Lock()  # batched tools run on a thread pool
+
+    def record(self, path: Path) -> None:
+        """Backs up `path` before its first change in this run (or notes that it didn't exist)."""
+        key = os.path.abspath(path)
+        with self.lock:
+            if key in self.recorded:
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            backup = None
+            if os.path.isfile(key):
+                backup = f"{len(self.recorded):06d}.orig"
+                shutil.copy2(key, self.dir / backup)
+            with open(self.dir / ENTRIES_FILE, "a") as f:
+                f.write(json.dumps({"path": key, "backup": backup}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.utime(self.dir)  # appending doesn't touch the directory; pruning goes by its mtime
+            self.recorded[key] = backup
+
+    @property
+    def changed(self) -> List[str]:
+        return list(self.recorded)
+
+    def rollback(self) -> List[str]:
+        """Restores every recorded file to its original content (deleting files the run created).
+
+        A file that can't be restored is left in `failed` (path -> error) and stays journaled,
+        so the rollback can be retried; the other files are restored regardless.
+        """
+        from g_wave.writes import copy_atomic
+
+        restored = []
+        self.failed = {}
+        for key, backup in reversed(list(self.recorded.items())):
+            path = Path(key)
+            try:
+                if backup is None:
+                    if path.exists():
+                        path.unlink()
+                else:
+                    copy_atomic(self.dir / backup, path)
+            except OSError as e:
+                self.failed[key] = f"{type(e).__name__}: {e}"
+                continue
+            restored.append(key)
+            del self.recorded[key]
+        if not self.failed:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        else:
+            # Keep only the files still to restore, so a retry doesn't redo the others
+            from g_wave.writes import write_atomic
+
+            write_atomic(self.dir / ENTRIES_FILE, "".join(json.dumps({"path": key, "backup": backup}) + "\n"
+                                                         for key, backup in self.recorded.items()))
+        return restored
+
+
+def load_journal(run_id: str, root: str = JOURNAL_DIR) -> RunJournal:
+    """Reopens a run's journal from disk, e.g. to roll back a run that has already exited."""
+    journal = RunJournal(run_id, root)
+    entries = journal.dir / ENTRIES_FILE
+    if not entries.is_file():
+        raise FileNotFoundError(f"No journal for run '{run_id}' in {root}.")
+    with open(entries) as f:
+        for line in f:
+            if line.strip():
+                entry: Dict[str, Any] = json.loads(line)
+                journal.recorded.setdefault(entry["path"], entry["backup"])
+    return journal
+
+
+_journal: contextvars.ContextVar = contextvars.ContextVar("g_wave_journal", default=None)
+# Ids of the runs in progress in this process (e.g. the tasks of a batch); never pruned
+_active_runs: Set[str] = set()
+
+
+def active_runs() -> Set[str]:
+    return set(_active_runs)
+
+
+def prune_run_dirs(root: str, keep: int) -> None:
+    """Deletes all but the `keep` most recently modified run directories under `root`, sparing active runs."""
+    if not os.path.isdir(root):
+        return
+    active = active_runs()
+    dirs = sorted((entry for entry in os.scandir(root) if entry.is_dir() and entry.name not in active),
+                  key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in dirs[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def prune_journals(root: str = JOURNAL_DIR, keep: int = KEEP_JOURNALS) -> None:
+    """Deletes all but the `keep` most recently modified journals of finished runs."""
+    prune_run_dirs(root, keep)
+
+
+def current_journal() -> Optional[RunJournal]:
+    return _journal.get()
+
+
+def start_journal(journal: RunJournal):
+    """Makes `journal` current for this context; returns a token for stop_journal()."""
+    _active_runs.add(journal.run_id)
+    return _journal.set(journal)
+
+
+def stop_journal(token) -> None:
+    _active_runs.discard(_journal.get().run_id)
+    _journal.reset(token)
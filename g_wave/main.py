@@ -1,60 +1,92 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import os
-import subprocess
 import typer
+from typer.core import TyperGroup
 import re
 import json
 import shutil
-import sys
-from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
+from g_wave.cache import ReplayMiss, configure_cache
+from g_wave.checkpoint import RunCheckpoint, load_checkpoint, prune_checkpoints
+from g_wave.context import build_context, estimate_tokens, format_usage
+from g_wave.filecache import BinaryFileError, read_view
+from g_wave.fsindex import list_entries
+from g_wave.journal import RunJournal, current_journal, load_journal, prune_journals, start_journal, stop_journal
+from g_wave.models import ainvoke, get_model
+from g_wave.patching import PatchError, patch_file
+from g_wave.prompts import PLAN_AHEAD_PROMPT, TOOL_CALL_PROMPT
+from g_wave.retrieval import retrieve
+from g_wave.scope import scope_files
+from g_wave.search import search_workspace
+from g_wave.shell import ShellSession, current_session, run_shell, start_session, stop_session
+from g_wave.ratelimit import TransportError
+from g_wave.staging import validate_staging
+from g_wave.streaming import FenceStripper, write_stdout
+from g_wave.toolbatch import MAX_BATCH_CALLS, run_tool_batch
+from g_wave.toolcall import check_tool_call, extract_json, parse_tool_calls, tool_schemas
+from g_wave.tracing import annotate, configure_tracing, span
+from g_wave.usage import BudgetExceeded, UsageTracker, current_tracker, load_pricing, start_tracking, stop_tracking
+from g_wave.workspace import (WORKSPACE_DIR, current_root, current_workspace, reset_root, reset_workspace, resolve_path,
+                              resolve_read_path, use_root, use_workspace)
+from g_wave.writes import read_current, write_text
 
-# Import langchain modules for use throughout the module
-import langchain.prompts
-import langchain.schema
+class DefaultCommandGroup(TyperGroup):
+    """Routes `g_wave "task"` (no sub-command given) to the `chat` command."""
 
-app = typer.Typer(help="G-Wave: A simplified, more robust AI agent.")
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ("--help", "--install-completion", "--show-completion")):
+            args = ["chat"] + list(args)
+        return super().parse_args(ctx, args)
 
-# --- Workspace Configuration ---
-WORKSPACE_DIR = "g_wave_workspace"
+app = typer.Typer(help="G-Wave: A simplified, more robust AI agent.", cls=DefaultCommandGroup)
+trace_app = typer.Typer(help="Inspect JSONL trace files written with --trace.")
+app.add_typer(trace_app, name="trace")
 
 # --- Agent Initialization ---
-gemini = ChatGoogleGenerativeAI(model="gemini-2.5-pro", api_key=os.getenv("GEMINI_API_KEY"))
-claude = ChatAnthropic(model="claude-3-5-sonnet-20241022", api_key=os.getenv("CLAUDE_API_KEY"))
-try:
-    grok = ChatOpenAI(model="grok-2-1212", base_url="https://api.x.ai/v1", api_key=os.getenv("XAI_API_KEY"))
-except Exception as e:
-    print(f"⚠️ Grok initialization failed: {e}. Using Claude as fallback for planning")
-    grok = claude
-kimi = ChatOpenAI(model="moonshot-v1-8k", base_url="https://api.moonshot.ai/v1", api_key=os.getenv("MOONSHOT_API_KEY"))
+# Provider SDKs and clients are created lazily by g_wave.models the first time a
+# role needs them, so `g_wave --help` and staging subprocesses start quickly.
+def __getattr__(name: str):
+    """Keeps `main.gemini`, `main.claude`, `main.grok` and `main.kimi` working lazily."""
+    if name in ("gemini", "claude", "grok", "kimi"):
+        return get_model(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Agentic Tools ---
-def list_files(path: str = '.', directory: str = None) -> str:
-    """Lists files in the specified directory."""
+def list_files(path: str = '.', directory: str = None, recursive: bool = False, pattern: str = None,
+               max_depth: int = None, sort: str = "name", limit: int = 200) -> str:
+    """Lists a directory (skipping .gitignore'd files). `recursive` or `max_depth` descend into subdirectories, `pattern` is a glob such as '*.py' or 'src/**/*.ts', and `sort` is 'name', 'size' (largest first) or 'mtime' (newest first)."""
     safe_path = path or directory or '.'
-    # If the path doesn't exist, default to current directory
-    if not os.path.exists(safe_path):
-        safe_path = '.'
     try:
-        files = os.listdir(safe_path)
-        return "\n".join(files) if files else "No files in directory."
+        return list_entries(resolve_read_path(safe_path), recursive=recursive, pattern=pattern, max_depth=max_depth, sort=sort, limit=limit)
+    except (FileNotFoundError, NotADirectoryError, ValueError) as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error listing files: {e}"
 
-def read_file(filename: str) -> str:
-    """Reads the content of a file."""
+def read_file(filename: str, offset: int = 1, limit: int = None) -> str:
+    """Reads the content of a file. For large files, `offset` (first line, 1-based) and `limit` (number of lines) read a part of it."""
     try:
-        with open(filename, "r") as f:
-            return f.read()
+        return read_view(resolve_read_path(filename), offset, limit)
+    except BinaryFileError as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error reading file: {e}"
 
+def search(query: str, regex: bool = False, path: str = '.', files: str = None, case_sensitive: bool = True,
+           context: int = 1, max_results: int = 50) -> str:
+    """Searches file contents under `path` for `query` (literal text, or a regular expression with `regex`), returning matching lines with line numbers and `context` lines around them. `files` is an optional glob such as '*.py'."""
+    try:
+        return search_workspace(query, regex=regex, path=resolve_read_path(path), files=files, case_sensitive=case_sensitive,
+                                context=context, max_results=max_results)
+    except (FileNotFoundError, ValueError) as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error searching files: {e}"
+
 def save_file(filename: str = None, file_name: str = None, path: str = None, file_path: str = None, code: str = None, content: str = None) -> str:
     """Saves or overwrites a file. Can access files outside workspace if absolute path is provided."""
     filepath = filename or file_name or path or file_path
@@ -64,17 +96,10 @@ def save_file(filename: str = None, file_name: str = None, path: str = None, fil
     if not file_content or file_content.isspace():
         return "Error: Attempted to save empty content. Aborting."
     try:
-        # Allow absolute paths for files outside workspace
-        if os.path.isabs(filepath):
-            safe_path = Path(filepath)
-        elif not filepath.startswith(WORKSPACE_DIR):
-            # Default to workspace for relative paths
-            safe_path = Path(WORKSPACE_DIR) / filepath
-        else:
-            safe_path = Path(filepath)
+        # Absolute paths reach outside the workspace; relative paths default to it
+        safe_path = resolve_path(filepath)
         safe_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(safe_path, "w") as f:
-            f.write(file_content)
+        write_text(safe_path, file_content)
         return f"Successfully saved code to {safe_path}"
     except Exception as e:
         return f"Error saving file: {e}"
@@ -82,77 +107,369 @@ def save_file(filename: str = None, file_name: str = None, path: str = None, fil
 def replace_in_file(filename: str, old_code: str, new_code: str) -> str:
     """Replaces a specific block of code in a file. Can access files outside workspace if absolute path is provided."""
     try:
-        # Allow absolute paths for files outside workspace
-        if os.path.isabs(filename):
-            safe_path = Path(filename)
-        elif not filename.startswith(WORKSPACE_DIR):
-            # Default to workspace for relative paths
-            safe_path = Path(WORKSPACE_DIR) / filename
-        else:
-            safe_path = Path(filename)
-            
-        with open(safe_path, "r") as f:
-            content = f.read()
+        # Absolute paths reach outside the workspace; relative paths default to it
+        safe_path = resolve_path(filename)
+
+        content = read_current(safe_path).replace("\r\n", "\n")
         if old_code not in content:
             return f"Error: The specified 'old_code' was not found in {safe_path}."
         
         new_content = content.replace(old_code, new_code)
         
-        with open(safe_path, "w") as f:
-            f.write(new_content)
+        write_text(safe_path, new_content)
         return f"Successfully replaced code in {safe_path}."
     except Exception as e:
         return f"Error replacing code in file: {e}"
 
+def apply_patch(filename: str, patch: str) -> str:
+    """Applies unified-diff or SEARCH/REPLACE hunks to an existing file; either every hunk applies or the file is left unchanged."""
+    try:
+        # Absolute paths reach outside the workspace; relative paths default to it
+        return patch_file(resolve_path(filename), patch)
+    except PatchError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error applying patch: {e}"
+
 def finish(reason: str) -> str:
     """Signals that the task is complete."""
     return f"Task finished: {reason}"
 
-def run_command(command: str) -> str:
-    """Executes a shell command."""
+async def run_command(command: str, timeout: int = None) -> str:
+    """Executes a shell command, killing it after `timeout` seconds (default G_WAVE_COMMAND_TIMEOUT)."""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return f"STDOUT:\n{result.stdout}\nSTDERR:\n{result.stderr}"
+        # With --persistent-shell, cwd and environment carry over from earlier commands
+        session = current_session()
+        result = await (session.run(command, timeout=timeout) if session
+                        else run_shell(command, timeout=timeout, cwd=current_root()))
+        return result.format()
     except Exception as e:
         return f"Error executing command: {e}"
 
 TOOLS = {
     "list_files": list_files,
     "read_file": read_file,
+    "search": search,
     "save_file": save_file,
     "replace_in_file": replace_in_file,
+    "apply_patch": apply_patch,
     "run_command": run_command,
     "finish": finish,
 }
 
-# --- New, Simplified Orchestrator ---
-def run_agent_loop(task: str, max_loops: int = 20, is_self_improvement=False, original_task=""):
-    """Runs the stateful agent loop with a self-improvement mechanism."""
-    
-    state = {"task": task, "history": [], "files_content": {}}
+# Arguments left out of structured tool schemas: aliases, and code the coder writes
+SCHEMA_EXCLUDED_ARGS = {
+    "list_files": ["directory"],
+    "save_file": ["file_name", "path", "file_path", "code", "content"],
+    "replace_in_file": ["new_code"],
+    "apply_patch": ["patch"],
+}
+CODE_TOOLS = ("save_file", "replace_in_file", "apply_patch")
 
-    for i in range(max_loops):
-        print(f"\n\n==================== LOOP {i+1}/{max_loops} ====================")
-        
-        # --- Display Current State ---
-        print(">> Reviewing current state...")
-        history_log = "\n".join(f"  - {h}" for h in state['history']) if state['history'] else "  - No actions taken yet."
-        print(f"History:\n{history_log}")
-        if state['files_content']:
-            print("\nKnown File Contents:")
-            for filename, content in state['files_content'].items():
-                print(f"  --- {filename} ---")
-                print(f"  {content[:200]}..." if len(content) > 200 else content)
-                print(f"  --------------------")
-        print("======================================================")
-        
-        action_str = ""
+# Most steps the planner may lay out at once in plan-ahead mode
+PLAN_AHEAD_STEPS = int(os.getenv("G_WAVE_PLAN_AHEAD_STEPS", "6"))
+# Final statuses after which `rollback_on_error` restores the files a run changed
+ROLLBACK_STATUSES = ("error", "transport_error", "budget_exceeded", "replay_miss")
+
+# --- Action Parsing ---
+def split_actions(action_str: str) -> List[str]:
+    """Splits actor output into one action per tool call.
+
+    A new action starts on a line beginning with `TOOL_NAME|`; other lines continue the
+    previous action, since values such as `old_code` may span lines.
+    """
+    actions: List[str] = []
+    for line in action_str.strip().splitlines():
+        if line.split('|', 1)[0].strip() in TOOLS and '|' in line:
+            actions.append(line.strip())
+        elif actions:
+            actions[-1] += "\n" + line
+    return actions or [action_str]
+
+def parse_action(action_str: str, implementation: str = "") -> tuple:
+    """Parses a `TOOL_NAME|key=value|...` action into (tool_name, args), repairing common argument mistakes."""
+    if not action_str or '|' not in action_str:
+        raise ValueError("Kimi failed to provide a valid action.")
+
+    parts = action_str.strip().split('|')
+    tool_name = parts[0]
+
+    if tool_name == "finish":
+        reason = "No reason given."
+        if len(parts) > 1 and '=' in parts[1]:
+            reason = parts[1].split('=', 1)[1]
+        return tool_name, {"reason": reason}
+
+    if tool_name not in TOOLS:
+        raise ValueError(f"Tool '{tool_name}' not found.")
+
+    args = {}
+    for part in parts[1:]:
+        if '=' in part:
+            key, value = part.split('=', 1)
+            args[key] = value
+        else:
+            # Handle positional arguments for specific tools
+            if tool_name == 'list_files':
+                args['path'] = part
+            elif tool_name == 'read_file':
+                args['filename'] = part
+            elif tool_name == 'run_command':
+                args['command'] = part
+
+    return tool_name, repair_args(tool_name, args, implementation)
+
+def repair_args(tool_name: str, args: Dict[str, Any], implementation: str = "") -> Dict[str, Any]:
+    """Validates and corrects a tool's arguments, filling in generated code where the tool takes it."""
+    if tool_name == "finish":
+        return {"reason": args.get("reason") or "No reason given."}
+
+    if tool_name == "run_command":
+        # Remove invalid parameters
+        args = {k: v for k, v in args.items() if k in ['command', 'timeout']}
+        if 'command' not in args:
+            raise ValueError(f"run_command requires 'command' parameter")
+        if 'timeout' in args:
+            try:
+                args['timeout'] = float(args['timeout'])
+            except (TypeError, ValueError):
+                raise ValueError(f"run_command 'timeout' must be a number of seconds, got {args['timeout']!r}")
+
+    elif tool_name == "read_file":
+        # Ensure correct parameter name - handle multiple possible parameter names
+        if 'path' in args and 'filename' not in args:
+            args['filename'] = args.pop('path')
+        if 'file_path' in args and 'filename' not in args:
+            args['filename'] = args.pop('file_path')
+        if 'file' in args and 'filename' not in args:
+            args['filename'] = args.pop('file')
+        args = {k: v for k, v in args.items() if k in ['filename', 'offset', 'limit']}
+        if 'filename' not in args:
+            raise ValueError(f"read_file requires 'filename' parameter")
+        for key in ('offset', 'limit'):
+            if key in args:
+                try:
+                    args[key] = int(args[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f"read_file '{key}' must be a line number, got {args[key]!r}")
+
+        # Handle cases where filename has a non-existent directory prefix
+        if 'filename' in args and not os.path.exists(args['filename']):
+            # Try removing directory prefixes like "project_directory/"
+            filename = args['filename']
+            if '/' in filename:
+                basename = os.path.basename(filename)
+                if os.path.exists(basename):
+                    args['filename'] = basename
+
+    elif tool_name == "save_file":
+        args['code'] = implementation
+        # Validate save_file parameters
+        valid_params = ['filename', 'file_name', 'path', 'file_path', 'code', 'content']
+        args = {k: v for k, v in args.items() if k in valid_params}
+
+    elif tool_name == "replace_in_file":
+        args['new_code'] = implementation
+        # Validate replace_in_file parameters
+        valid_params = ['filename', 'old_code', 'new_code']
+        args = {k: v for k, v in args.items() if k in valid_params}
+        if 'filename' not in args or 'old_code' not in args:
+            raise ValueError(f"replace_in_file requires 'filename' and 'old_code' parameters")
+
+    elif tool_name == "apply_patch":
+        for alias in ('path', 'file_path', 'file_name', 'file'):
+            if alias in args and 'filename' not in args:
+                args['filename'] = args.pop(alias)
+        args['patch'] = implementation
+        args = {k: v for k, v in args.items() if k in ['filename', 'patch']}
+        if 'filename' not in args:
+            raise ValueError(f"apply_patch requires 'filename' parameter")
+
+    elif tool_name == "search":
+        for alias in ('pattern', 'regex_pattern', 'text', 'q', 'term'):
+            if alias in args and 'query' not in args:
+                args['query'] = args.pop(alias)
+        args = {k: v for k, v in args.items() if k in ['query', 'regex', 'path', 'files', 'case_sensitive', 'context', 'max_results']}
+        if 'query' not in args:
+            raise ValueError(f"search requires 'query' parameter")
+        for key in ('regex', 'case_sensitive'):
+            if isinstance(args.get(key), str):
+                args[key] = args[key].strip().lower() in ('true', '1', 'yes')
+        for key in ('context', 'max_results'):
+            if key in args:
+                try:
+                    args[key] = int(args[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f"search '{key}' must be an integer, got {args[key]!r}")
+
+    elif tool_name == "list_files":
+        # Validate list_files parameters
+        valid_params = ['path', 'directory', 'recursive', 'pattern', 'max_depth', 'sort', 'limit']
+        args = {k: v for k, v in args.items() if k in valid_params}
+        if isinstance(args.get('recursive'), str):
+            args['recursive'] = args['recursive'].strip().lower() in ('true', '1', 'yes')
+        for key in ('max_depth', 'limit'):
+            if key in args:
+                try:
+                    args[key] = int(args[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f"list_files '{key}' must be an integer, got {args[key]!r}")
+
+    return args
+
+# --- Coder Step ---
+async def agenerate_code(impl_prompt_template: str, inputs: Dict[str, Any], stream: bool = False) -> str:
+    """Generates code with the coder route (Gemini, with Claude for failover and hedging).
+
+    With `stream`, code is printed as it arrives (minus ```python fences).
+    """
+    stripper = FenceStripper() if stream else None
+    print(">> Coder generating code...")
+    if stream:
+        print("Generated Code:")
+    implementation = await ainvoke("coder", impl_prompt_template, inputs, stage="code",
+                                   on_chunk=stripper.feed if stream else None)
+
+    implementation = re.sub(r"```python\n(.*?)\n```", r"\1", implementation, flags=re.DOTALL).strip()
+    if stream:
+        stripper.close()
+    else:
+        print(f"Generated Code:\n{implementation}")
+    return implementation
+
+# --- Planning Steps ---
+async def _implement(plan: str, state: Dict[str, Any], loop: int, options: Dict[str, Any],
+                     tool_name: str = "save_file", target: str = None) -> str:
+    """Builds the coder context for `plan` and generates the code a write tool needs.
+
+    For apply_patch the coder writes SEARCH/REPLACE hunks against `target` instead of a whole file.
+    """
+    if tool_name == "apply_patch":
+        return await _implement_patch(plan, state, loop, options, target)
+    _, files, scope = _scoped_files(plan, state, target)
+    impl_prompt_template = """
+You are a world-class programmer. Your task is to generate the code for a file based on a plan.
+If the plan is to modify an existing file, you must output the entire, final version of the file.
+Output ONLY the raw code, with no commentary or markdown.
+
+Plan: {plan}
+Existing File Contents (for context): {files_content}
+
+Generate the complete code for the file now.
+"""
+    coder_context = build_context("coder", state, reserved=plan, budgets=options["token_budgets"], files=files)
+    print(f">> {format_usage(coder_context['usage'])}")
+    state["context_usage"].append({"loop": loop, **coder_context["usage"], "scope": scope})
+    return await agenerate_code(impl_prompt_template, {
+        "plan": plan,
+        "files_content": coder_context["files_content"] or "N/A"
+    }, stream=options["stream"])
+
+async def _implement_patch(plan: str, state: Dict[str, Any], loop: int, options: Dict[str, Any], target: str = None) -> str:
+    patch_prompt_template = """
+You are a world-class programmer. Your task is to change an existing file based on a plan, by writing a patch.
+Output ONLY SEARCH/REPLACE blocks, with no commentary. Each block has this form:
+<<<<<<< SEARCH
+<exact lines currently in the file, with a few lines of context>
+=======
+<the lines that replace them>
+>>>>>>> REPLACE
+Use as many blocks as needed, in file order. Keep each SEARCH section short but unique within the file.
+
+Plan: {plan}
+Target File: {target}
+{target_content}
+Existing File Contents (for context): {files_content}
+
+Write the patch now.
+"""
+    target, files, scope = _scoped_files(plan, state, target)
+    target_content = ""
+    if target and resolve_path(target).is_file():
+        with open(resolve_path(target), "r") as f:
+            target_content = f"Current content of {target}:\n{f.read()}"
+        files.pop(target, None)  # already shown in full above
+    coder_context = build_context("coder", state, reserved=plan + target_content, budgets=options["token_budgets"],
+                                  files=files)
+    print(f">> {format_usage(coder_context['usage'])}")
+    state["context_usage"].append({"loop": loop, **coder_context["usage"], "scope": scope})
+    print(">> Coder generating patch...")
+    patch = await ainvoke("coder", patch_prompt_template, stage="code", inputs={
+        "plan": plan,
+        "target": target or "(see plan)",
+        "target_content": target_content,
+        "files_content": coder_context["files_content"] or "N/A"
+    }, on_chunk=write_stdout if options["stream"] else None)
+    if options["stream"]:
+        print()
+    else:
+        print(f"Generated Patch:\n{patch}")
+    return patch
+
+def _scoped_files(plan: str, state: Dict[str, Any], target: str = None) -> tuple:
+    """Narrows the coder's file context to the plan's target file plus related files, logging what was dropped.
+
+    Returns (target, files, scope) where scope records the kept and dropped files.
+    """
+    with span("scope_context") as scope_span:
+        target, files = scope_files(plan, state["files_content"], target)
+        dropped = [name for name in state["files_content"] if name not in files]
+        scope_span.update(target=target, kept=list(files), dropped=dropped)
+    scope = {"target": target, "related": [name for name in files if name != target], "dropped": dropped}
+    if not target:
+        print(">> Coder context: no target file identified in the plan; sending all known files")
+        return target, files, scope
+    related = [name for name in files if name != target]
+    message = f">> Coder context: {target}" + (f" + {len(related)} related ({', '.join(related)})" if related else "")
+    if dropped:
+        dropped_tokens = sum(estimate_tokens(state["files_content"][name]) for name in dropped)
+        message += f"; dropped {len(dropped)} unrelated file(s), ~{dropped_tokens} tokens ({', '.join(dropped)})"
+    print(message)
+    return target, files, scope
+
+def _tool_names(options: Dict[str, Any]) -> List[str]:
+    """Tools offered to the planner and actor: patch mode swaps replace_in_file for apply_patch."""
+    hidden = "replace_in_file" if options["patch"] else "apply_patch"
+    return [name for name in TOOLS if name != hidden]
+
+def _retrieval_query(state: Dict[str, Any]) -> str:
+    """The task plus the step in progress: the current planned step, or else the latest result."""
+    step = (state.get("current_step") or {}).get("step")
+    if not step and state["history"]:
+        step = state["history"][-1][:300]
+    return f"{state['task']}\n{step or ''}"
+
+async def _planner_context(state: Dict[str, Any], loop: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    retrieved, picked = "", []
+    if options["retrieval"]:
         try:
-            print("\n>> Planning next action...")
-            # Step 1: Plan - Grok decides the next step
-            plan_prompt_template = """
+            with span("retrieve"):
+                retrieved, picked = await asyncio.to_thread(retrieve, _retrieval_query(state),
+                                                            [resolve_read_path(f) for f in state["files_content"]],
+                                                            root=current_root() or ".")
+        except Exception as e:
+            print(f">> Retrieval skipped: {e}")
+    planner_context = build_context("planner", state, reserved=state["task"] + retrieved, budgets=options["token_budgets"])
+    if retrieved:
+        planner_context["files_content"] = "\n\n".join(filter(None, [planner_context["files_content"], retrieved]))
+        planner_context["usage"]["reserved"] -= estimate_tokens(retrieved)
+        planner_context["usage"]["files_content"] += estimate_tokens(retrieved)
+        print(f">> Retrieved {len(picked)} chunk(s): " + ", ".join(f"{p['path']}:{p['lines'][0]}-{p['lines'][1]}" for p in picked))
+    print(f">> {format_usage(planner_context['usage'])}")
+    state["context_usage"].append({"loop": loop, **planner_context["usage"], "retrieved": picked})
+    return planner_context
+
+async def _plan_and_act(state: Dict[str, Any], loop: int, options: Dict[str, Any]) -> List[tuple]:
+    """Text mode: Grok plans in prose, Kimi turns the plan into `TOOL|key=value` actions.
+
+    Returns (tool_name, args, action_str) for each action.
+    """
+    stream = options["stream"]
+    # Step 1: Plan - Grok decides the next step
+    plan_prompt_template = """
 You are a master planner. Your primary directive is to fulfill the user's task by breaking it down into small, incremental steps.
 **Focus only on the single next best action to take.** Do not plan multiple steps ahead.
+If the next step needs several independent reads or listings (e.g. reading multiple files), name them all; they run together.
 Your available tools are: {tool_names}.
 Based on the current state, what is the single next best action to take?
 
@@ -162,171 +479,403 @@ File Contents: {files_content}
 
 Decision:
 """
-            plan_prompt = langchain.prompts.PromptTemplate.from_template(plan_prompt_template)
-            planner_chain = plan_prompt | grok | langchain.schema.StrOutputParser()
-            next_step = planner_chain.invoke({
-                "task": state["task"],
-                "history": "\n".join(state["history"]) or "No history yet.",
-                "files_content": state["files_content"] or "No files read yet.",
-                "tool_names": ", ".join(TOOLS.keys())
-            })
-            print(f"Grok's Plan: {next_step}")
-
-            # Step 2: Implement (if coding is the next step)
-            implementation = ""
-            if "replace_in_file" in next_step.lower() or "save_file" in next_step.lower():
-                impl_prompt_template = """
-You are a world-class programmer. Your task is to generate the code for a file based on a plan.
-If the plan is to modify an existing file, you must output the entire, final version of the file.
-Output ONLY the raw code, with no commentary or markdown.
-
-Plan: {plan}
-Existing File Contents (for context): {files_content}
+    planner_context = await _planner_context(state, loop, options)
+    if stream:
+        print("Grok's Plan: ", end="", flush=True)
+    next_step = await ainvoke("planner", plan_prompt_template, stage="plan", on_chunk=write_stdout if stream else None, inputs={
+        "task": state["task"],
+        "history": planner_context["history"] or "No history yet.",
+        "files_content": planner_context["files_content"] or "No files read yet.",
+        "tool_names": ", ".join(_tool_names(options))
+    })
+    state["planner_calls"] += 1
+    if stream:
+        print()
+    else:
+        print(f"Grok's Plan: {next_step}")
+    return await _act(next_step, state, loop, options)
 
-Generate the complete code for the file now.
-"""
-                impl_prompt = langchain.prompts.PromptTemplate.from_template(impl_prompt_template)
-                
-                # --- Coder chain with fallback ---
-                try:
-                    print(">> Gemini attempting to generate code...")
-                    coder_chain = impl_prompt | gemini | langchain.schema.StrOutputParser()
-                    implementation = coder_chain.invoke({
-                        "plan": next_step,
-                        "files_content": state["files_content"] or "N/A"
-                    })
-                except Exception as e:
-                    print(f"Gemini failed: {e}. Falling back to Claude.")
-                    coder_chain = impl_prompt | claude | langchain.schema.StrOutputParser()
-                    implementation = coder_chain.invoke({
-                        "plan": next_step,
-                        "files_content": state["files_content"] or "N/A"
-                    })
-
-                implementation = re.sub(r"```python\n(.*?)\n```", r"\1", implementation, flags=re.DOTALL).strip()
-                print(f"Generated Code:\n{implementation}")
-
-            # Step 3: Act - Kimi chooses and formats the tool call
-            action_prompt_template = """
-You are an action agent. Your job is to convert the plan into a single, specific tool call.
+async def _act(next_step: str, state: Dict[str, Any], loop: int, options: Dict[str, Any]) -> List[tuple]:
+    """Has Kimi turn a prose step into actions, generating code for any writes."""
+    # Step 2 & 3: Implement (if coding is the next step) and Act.
+    # Kimi only needs the plan, not the implementation, so both calls run concurrently.
+    action_prompt_template = """
+You are an action agent. Your job is to convert the plan into specific tool calls.
 Your available tools are: {tool_list}.
 Output ONLY the action in the format: TOOL_NAME|key1=value1|key2=value2.
+If the plan names several independent actions, output one action per line.
 If using 'replace_in_file', the 'new_code' value is provided separately. You must specify the 'filename' and 'old_code'.
+If using 'apply_patch', the patch is provided separately. You must specify only the 'filename'.
 
 Plan: {plan}
 
 Action:
 """
-            action_prompt = langchain.prompts.PromptTemplate.from_template(action_prompt_template)
-            action_chain = action_prompt | kimi | langchain.schema.StrOutputParser()
-            action_str = action_chain.invoke({
-                "plan": next_step,
-                "tool_list": str(list(TOOLS.keys()))
-            })
-            print(f"Kimi's Action: {action_str}")
+    action_task = asyncio.create_task(ainvoke("actor", action_prompt_template, stage="act", inputs={
+        "plan": next_step,
+        "tool_list": str(_tool_names(options))
+    }))
 
-            # --- Tool Execution ---
-            if not action_str or '|' not in action_str:
-                raise ValueError("Kimi failed to provide a valid action.")
+    implementation = ""
+    planned_tool = next((name for name in CODE_TOOLS if name in next_step.lower()), None)
+    if planned_tool:
+        try:
+            implementation = await _implement(next_step, state, loop, options, tool_name=planned_tool)
+        except BaseException:
+            action_task.cancel()
+            raise
 
-            parts = action_str.strip().split('|')
-            tool_name = parts[0]
-            
-            if tool_name == "finish":
-                reason = "No reason given."
-                if len(parts) > 1 and '=' in parts[1]:
-                    reason = parts[1].split('=', 1)[1]
-                print(f"\n=== Task Finished: {reason} ===")
-                break
+    action_str = await action_task
+    print(f"Kimi's Action: {action_str}")
+
+    # The plan-level implementation goes to the first matching write; other writes get their own code
+    actions = split_actions(action_str)
+    implementations = []
+    for action in actions:
+        tool_name = action.split('|', 1)[0]
+        if tool_name not in CODE_TOOLS:
+            implementations.append("")
+        elif implementation and (tool_name == "apply_patch") == (planned_tool == "apply_patch"):
+            implementations.append(implementation)
+            implementation = ""
+        else:
+            target = re.search(r"\|filename=([^|\n]+)", action)
+            implementations.append(await _implement(f"{next_step}\nAction: {action}", state, loop, options,
+                                                    tool_name=tool_name, target=target and target.group(1)))
+
+    with span("repair_args"):
+        return [(*parse_action(action, code), action) for action, code in zip(actions, implementations)]
+
+async def _plan_tool_call(state: Dict[str, Any], loop: int, options: Dict[str, Any]) -> List[tuple]:
+    """Structured mode: the planner emits JSON tool calls directly, so no actor call is needed.
+
+    Returns (tool_name, args, action_str) for each call.
+    """
+    stream = options["stream"]
+    schemas = tool_schemas({name: TOOLS[name] for name in _tool_names(options)}, SCHEMA_EXCLUDED_ARGS)
+    planner_context = await _planner_context(state, loop, options)
+    if stream:
+        print("Grok's Tool Call: ", end="", flush=True)
+    reply = await ainvoke("planner", TOOL_CALL_PROMPT, stage="plan", on_chunk=write_stdout if stream else None, inputs={
+        "task": state["task"],
+        "history": planner_context["history"] or "No history yet.",
+        "files_content": planner_context["files_content"] or "No files read yet.",
+        "tool_schemas": json.dumps(schemas, indent=1)
+    })
+    state["planner_calls"] += 1
+    if stream:
+        print()
+
+    with span("repair_args"):
+        tool_calls, thoughts = parse_tool_calls(reply, schemas)
+    calls = []
+    for tool_name, args in tool_calls:
+        action_str = json.dumps({"tool": tool_name, "args": args})
+        if not stream:
+            print(f"Grok's Tool Call: {action_str}")
+        implementation = ""
+        if tool_name in CODE_TOOLS:
+            implementation = await _implement(f"{thoughts}\nTool call: {action_str}", state, loop, options,
+                                              tool_name=tool_name, target=args.get("filename"))
+        calls.append((tool_name, repair_args(tool_name, dict(args), implementation), action_str))
+    if thoughts and not stream:
+        print(f"Thoughts: {thoughts}")
+    return calls
+
+async def _plan_ahead(state: Dict[str, Any], loop: int, options: Dict[str, Any], reason: str) -> None:
+    """Plan-ahead mode: asks the planner for an ordered list of steps and stores it in state["plan"]."""
+    schemas = tool_schemas({name: TOOLS[name] for name in _tool_names(options)}, SCHEMA_EXCLUDED_ARGS)
+    planner_context = await _planner_context(state, loop, options)
+    print(f">> Planning ahead ({reason})...")
+    reply = await ainvoke("planner", PLAN_AHEAD_PROMPT, stage="plan", inputs={
+        "task": state["task"],
+        "history": planner_context["history"] or "No history yet.",
+        "files_content": planner_context["files_content"] or "No files read yet.",
+        "tool_schemas": json.dumps(schemas, indent=1),
+        "max_steps": PLAN_AHEAD_STEPS,
+        "replan_reason": reason
+    })
+    state["planner_calls"] += 1
+
+    with span("repair_args"):
+        steps = extract_json(reply).get("steps")
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("Planner returned no steps.")
+        plan = []
+        for raw in steps[:PLAN_AHEAD_STEPS]:
+            step = raw if isinstance(raw, dict) else {"step": str(raw)}
+            step.setdefault("step", step.get("tool") or "unnamed step")
+            if step.get("tool") and step["tool"] != "finish":
+                try:
+                    check_tool_call(step["tool"], step.get("args") or {}, schemas)
+                except ValueError as e:
+                    print(f"  (step '{step['step']}' will go through the actor: {e})")
+                    step.pop("tool")
+            plan.append(step)
+    state["plan"] = plan
+    print("Grok's Plan:")
+    for n, step in enumerate(plan, 1):
+        call = f" -> {step['tool']} {json.dumps(step.get('args') or {})}" if step.get("tool") else ""
+        print(f"  {n}. {step['step']}{call}")
+
+async def _next_planned_step(state: Dict[str, Any], loop: int, options: Dict[str, Any]) -> List[tuple]:
+    """Plan-ahead mode: runs the next stored step, replanning first if the plan is used up."""
+    if not state["plan"]:
+        reason = state.pop("replan_reason", None) or ("the previous plan is complete" if state["history"] else "start of task")
+        await _plan_ahead(state, loop, options, reason)
+    step = state["plan"].pop(0)
+    state["current_step"] = step
+    print(f">> Step: {step['step']} ({len(state['plan'])} more planned)")
+    if not step.get("tool"):
+        # Arguments depend on earlier results, so let the actor fill them in
+        recent = "\n".join(h[:500] for h in state["history"][-3:]) or "None yet."
+        return await _act(f"{step['step']}\nRecent results:\n{recent}", state, loop, options)
+
+    tool_name, args = step["tool"], dict(step.get("args") or {})
+    action_str = json.dumps({"tool": tool_name, "args": args})
+    implementation = ""
+    if tool_name in CODE_TOOLS:
+        implementation = await _implement(f"{step['step']}\nTool call: {action_str}", state, loop, options,
+                                          tool_name=tool_name, target=args.get("filename"))
+    with span("repair_args"):
+        return [(tool_name, repair_args(tool_name, args, implementation), action_str)]
+
+def step_deviation(step: Dict[str, Any], result: str) -> Optional[str]:
+    """Why a planned step's result invalidates the rest of the plan, or None if it went as expected."""
+    if result.lstrip().startswith("Error"):
+        return f"step '{step['step']}' failed: {result[:200]}"
+    expect = str(step.get("expect") or "").strip()
+    if expect and expect.lower() not in result.lower():
+        return f"step '{step['step']}' did not produce the expected '{expect}'"
+    return None
+
+# --- New, Simplified Orchestrator ---
+def run_agent_loop(task: str, max_loops: int = 20, is_self_improvement=False, original_task="", **options):
+    """Runs the stateful agent loop with a self-improvement mechanism (blocking wrapper).
 
-            if tool_name in TOOLS:
-                args = {}
-                for part in parts[1:]:
-                    if '=' in part:
-                        key, value = part.split('=', 1)
-                        args[key] = value
-                    else:
-                        # Handle positional arguments for specific tools
-                        if tool_name == 'list_files':
-                            args['path'] = part
-                        elif tool_name == 'read_file':
-                            args['filename'] = part
-                        elif tool_name == 'run_command':
-                            args['command'] = part
-
-                # Parameter validation and correction
-                if tool_name == "run_command":
-                    # Remove invalid parameters
-                    args = {k: v for k, v in args.items() if k in ['command']}
-                    if 'command' not in args:
-                        raise ValueError(f"run_command requires 'command' parameter")
-                
-                elif tool_name == "read_file":
-                    # Ensure correct parameter name - handle multiple possible parameter names
-                    if 'path' in args and 'filename' not in args:
-                        args['filename'] = args.pop('path')
-                    if 'file_path' in args and 'filename' not in args:
-                        args['filename'] = args.pop('file_path')
-                    if 'file' in args and 'filename' not in args:
-                        args['filename'] = args.pop('file')
-                    args = {k: v for k, v in args.items() if k in ['filename']}
-                    if 'filename' not in args:
-                        raise ValueError(f"read_file requires 'filename' parameter")
-                    
-                    # Handle cases where filename has a non-existent directory prefix
-                    if 'filename' in args and not os.path.exists(args['filename']):
-                        # Try removing directory prefixes like "project_directory/"
-                        filename = args['filename']
-                        if '/' in filename:
-                            basename = os.path.basename(filename)
-                            if os.path.exists(basename):
-                                args['filename'] = basename
-                
-                elif tool_name == "save_file":
-                    args['code'] = implementation
-                    # Validate save_file parameters
-                    valid_params = ['filename', 'file_name', 'path', 'file_path', 'code', 'content']
-                    args = {k: v for k, v in args.items() if k in valid_params}
-                
-                elif tool_name == "replace_in_file":
-                    args['new_code'] = implementation
-                    # Validate replace_in_file parameters
-                    valid_params = ['filename', 'old_code', 'new_code']
-                    args = {k: v for k, v in args.items() if k in valid_params}
-                    if 'filename' not in args or 'old_code' not in args:
-                        raise ValueError(f"replace_in_file requires 'filename' and 'old_code' parameters")
-                
-                elif tool_name == "list_files":
-                    # Validate list_files parameters
-                    valid_params = ['path', 'directory']
-                    args = {k: v for k, v in args.items() if k in valid_params}
-                    
-                    # Handle cases where path has a non-existent directory like "project_directory"
-                    if 'path' in args and not os.path.exists(args['path']):
-                        args['path'] = '.'
-                    if 'directory' in args and not os.path.exists(args['directory']):
-                        args['directory'] = '.'
-                
-                result = TOOLS[tool_name](**args)
-                
-                if tool_name == "read_file":
-                    filename_key = next((k for k in ['filename', 'file', 'path', 'file_path'] if k in args), None)
-                    if filename_key:
-                        state["files_content"][args[filename_key]] = result
-
-                state["history"].append(f"Action: {action_str}, Result: {result}")
-                print(f"Action Result: {result}")
+    `options` are the keyword arguments of arun_agent_loop.
+    """
+    return asyncio.run(arun_agent_loop(task, max_loops=max_loops, is_self_improvement=is_self_improvement,
+                                       original_task=original_task, **options))
+
+async def arun_agent_loop(task: str, max_loops: int = 20, is_self_improvement=False, original_task="", token_budgets: Dict[str, int] = None,
+                          max_cost: float = None, pricing: Dict[str, Dict[str, float]] = None, stream: bool = False,
+                          self_heal: bool = True, structured: bool = False, plan_ahead: bool = False,
+                          patch: bool = False, rollback_on_error: bool = False, persistent_shell: bool = False,
+                          retrieval: bool = False, resume: str = None):
+    """Runs the stateful agent loop on asyncio, overlapping LLM calls that don't depend on each other.
+
+    `token_budgets` overrides the per-role prompt context budgets (e.g. {"planner": 12000}).
+    `max_cost` (USD) stops the run before a model call would exceed it; `pricing` overrides the rate table.
+    Token usage and cost are returned in `state["usage"]`; sub-runs are billed to the parent run.
+    `stream` renders planner and coder output token by token as it arrives.
+    `self_heal=False` stops on agent errors instead of launching the self-improvement cycle.
+    `structured=True` has the planner emit a JSON tool call directly, skipping the actor call.
+    `plan_ahead=True` has the planner emit a multi-step plan and replans only on errors, deviations
+    or when the plan runs out; `state["planner_calls_saved"]` reports the planner calls avoided.
+    `patch=True` offers apply_patch instead of replace_in_file, so edits are written as hunks, not whole files.
+    Every file write is journaled; `state["run_id"]` names the journal for `g_wave rollback`.
+    `rollback_on_error=True` restores the run's files when it fails, instead of self-healing.
+    `persistent_shell=True` runs every run_command in one shell session, keeping cwd and environment.
+    `retrieval=True` adds the workspace code chunks that best match the task and step to planner prompts.
+    The state is checkpointed after every loop under the run id; `resume=<run id>` continues such a run
+    from its last completed loop (the other arguments should match the original run, as `g_wave resume` does).
+    The final `state["status"]` is one of: finished, max_loops, error, replay_miss, budget_exceeded, transport_error.
+    """
+    options = {"token_budgets": token_budgets, "stream": stream, "self_heal": self_heal and not rollback_on_error,
+               "structured": structured, "plan_ahead": plan_ahead, "patch": patch, "retrieval": retrieval}
+    run_options = {"token_budgets": token_budgets, "max_cost": max_cost, "pricing": pricing, "stream": stream,
+                   "self_heal": self_heal, "structured": structured, "plan_ahead": plan_ahead, "patch": patch,
+                   "rollback_on_error": rollback_on_error, "persistent_shell": persistent_shell, "retrieval": retrieval}
+    tracker = current_tracker()
+    token = None
+    if tracker is None:
+        tracker = UsageTracker(pricing=pricing, max_cost=max_cost)
+        token = start_tracking(tracker)
+    journal = current_journal()
+    journal_token = checkpoint = resumed = None
+    if journal is None:
+        if resume:
+            checkpoint = load_checkpoint(resume)
+            resumed = _resume_state(checkpoint)
+            try:
+                journal = load_journal(resume)
+            except FileNotFoundError:
+                journal = RunJournal(resume)
+        else:
+            journal = RunJournal()
+            checkpoint = RunCheckpoint(journal.run_id)
+            checkpoint.start({"task": task, "original_task": original_task, "max_loops": max_loops, "cwd": os.getcwd(),
+                              "workspace": current_workspace(), "root": current_root(), "options": run_options})
+        if resumed and token is not None:
+            # The cost cap covers the whole run, not just the part after the resume
+            tracker.carried.update(resumed.get("usage_totals", {}))
+            if tracker.carried["calls"]:
+                print(f"💰 ${tracker.carried['cost']:.4f} spent before the interruption counts toward the cost cap")
+        journal_token = start_journal(journal)
+        # After start_journal, so this run (and any other run in progress here) is spared
+        prune_journals()
+        prune_checkpoints()
+    session_token = None
+    if persistent_shell and current_session() is None:
+        session_token = start_session(ShellSession(cwd=current_root()))
+    try:
+        with span("run", self_improvement=is_self_improvement, max_loops=max_loops) as run_span:
+            state = await _arun_agent_loop(task, max_loops, is_self_improvement, original_task, options,
+                                           checkpoint=checkpoint, state=resumed)
+            run_span.update(loops_used=state["loops_used"], status=state["status"], cost=tracker.total_cost)
+    finally:
+        if checkpoint is not None and checkpoint.status != "finished":
+            print(f"\n💾 Run {checkpoint.run_id} checkpointed after loop {checkpoint.loop}; "
+                  f"continue it with `g_wave resume {checkpoint.run_id}`")
+        if token is not None:
+            stop_tracking(token)
+        if journal_token is not None:
+            stop_journal(journal_token)
+        if session_token is not None:
+            await current_session().close()
+            stop_session(session_token)
+
+    state["usage"] = tracker.summary()
+    state["run_id"] = journal.run_id
+    if token is not None:
+        print(f"\n💰 USAGE\n{tracker.report()}")
+    if journal_token is not None and journal.changed:
+        if rollback_on_error and state["status"] in ROLLBACK_STATUSES:
+            restored = await asyncio.to_thread(journal.rollback)
+            print(f"\n↩️  Run {state['status']}: rolled back {len(restored)} file(s)")
+            for path, error in journal.failed.items():
+                print(f"  ❌ Could not restore {path}: {error}; retry with `g_wave rollback {journal.run_id}`")
+        else:
+            print(f"\n🧾 Run {journal.run_id} changed {len(journal.changed)} file(s); undo with `g_wave rollback {journal.run_id}`")
+    return state
+
+def _resume_state(checkpoint: RunCheckpoint) -> Optional[Dict[str, Any]]:
+    """The checkpointed state to continue from, with cached files re-validated, or None if no loop completed."""
+    state = checkpoint.restore()
+    if state.get("status") == "finished":
+        raise ValueError(f"Run {checkpoint.run_id} already finished.")
+    if not state["loops_used"]:
+        return None
+    notes = checkpoint.revalidate(state, read_file)
+    state["status"] = "running"
+    state["history"].append(f"Resumed after loop {state['loops_used']}" + (": " + "; ".join(notes) if notes else ""))
+    print(f"⏯️  Resuming run {checkpoint.run_id} after loop {state['loops_used']} "
+          f"({len(state['history'])} history entries, {len(state['files_content'])} known files)")
+    for note in notes:
+        print(f"  - {note}")
+    return state
+
+async def _arun_agent_loop(task: str, max_loops: int, is_self_improvement: bool, original_task: str, options: Dict[str, Any],
+                           checkpoint: RunCheckpoint = None, state: Dict[str, Any] = None):
+    if state is None:
+        state = {"task": task, "history": [], "files_content": {}, "context_usage": [], "loops_used": 0,
+                 "status": "running", "planner_calls": 0, "plan": []}
+
+    tracker = current_tracker()
+    # This run's share of the tracker (shared with a parent run or batch), plus what it spent before a resume
+    baseline = tracker.totals()
+    spent = state.get("usage_totals", dict.fromkeys(baseline, 0))
+    for i in range(state["loops_used"], max_loops):
+        state["loops_used"] = i + 1
+        annotate(loop=i + 1)
+        tracker.loop = i + 1
+        print(f"\n\n==================== LOOP {i+1}/{max_loops} ====================")
+        
+        # --- Display Current State ---
+        print(">> Reviewing current state...")
+        history_log = "\n".join(f"  - {h}" for h in state['history']) if state['history'] else "  - No actions taken yet."
+        print(f"History:\n{history_log}")
+        if state['files_content']:
+            print("\nKnown File Contents:")
+            for filename, content in state['files_content'].items():
+                print(f"  --- {filename} ---")
+                print(f"  {content[:200]}..." if len(content) > 200 else content)
+                print(f"  --------------------")
+        print("======================================================")
+        
+        action_str = ""
+        try:
+            print("\n>> Planning next action...")
+            if options["plan_ahead"]:
+                calls = await _next_planned_step(state, i + 1, options)
+            elif options["structured"]:
+                calls = await _plan_tool_call(state, i + 1, options)
             else:
-                raise ValueError(f"Tool '{tool_name}' not found.")
+                calls = await _plan_and_act(state, i + 1, options)
+            action_str = "\n".join(call[2] for call in calls)
+
+            # --- Tool Execution ---
+            if len(calls) > MAX_BATCH_CALLS:
+                dropped = calls[MAX_BATCH_CALLS:]
+                calls = calls[:MAX_BATCH_CALLS]
+                print(f">> Batch limited to {MAX_BATCH_CALLS} tool calls; dropped {len(dropped)}.")
+                state["history"].append(f"Dropped {len(dropped)} actions over the batch limit: "
+                                        + "; ".join(call[2] for call in dropped))
+            finish_call = next((call for call in calls if call[0] == "finish"), None)
+            calls = [call for call in calls if call[0] != "finish"]
+
+            if calls:
+                results, elapsed = await run_tool_batch(TOOLS, [(tool_name, args) for tool_name, args, _ in calls])
+                print(f">> Batched {len(calls)} tool call(s) in {elapsed * 1000:.1f} ms")
+                for (tool_name, args, call_str), result in zip(calls, results):
+                    if tool_name == "read_file":
+                        filename_key = next((k for k in ['filename', 'file', 'path', 'file_path'] if k in args), None)
+                        if filename_key:
+                            if state["files_content"].get(args[filename_key]) == result:
+                                # Re-read of an unchanged file: don't store the same blob in history again
+                                result = f"[unchanged since last read; contents of {args[filename_key]} shown in File Contents]"
+                            else:
+                                state["files_content"][args[filename_key]] = result
+
+                    state["history"].append(f"Action: {call_str}, Result: {result}")
+                    print(f"Action Result: {result}")
 
+                if options["plan_ahead"]:
+                    reason = next(filter(None, (step_deviation(state["current_step"], r) for r in results)), None)
+                    if reason:
+                        print(f">> Replanning: {reason}" + (f" (dropping {len(state['plan'])} planned steps)" if state["plan"] else ""))
+                        state["plan"] = []
+                        state["replan_reason"] = reason
+
+            if finish_call:
+                print(f"\n=== Task Finished: {finish_call[1]['reason']} ===")
+                state["status"] = "finished"
+            if checkpoint is not None:
+                now = tracker.totals()
+                state["usage_totals"] = {key: spent[key] + now[key] - baseline[key] for key in now}
+                await asyncio.to_thread(checkpoint.record, state)
+            if finish_call:
+                break
+
+        except ReplayMiss as e:
+            print(f"\n--- REPLAY STOPPED ---\n{e}")
+            state["history"].append(f"Replay stopped: {e}")
+            state["status"] = "replay_miss"
+            break
+        except BudgetExceeded as e:
+            print(f"\n--- BUDGET EXHAUSTED ---\n{e}")
+            state["history"].append(f"Budget exhausted: {e}")
+            state["status"] = "budget_exceeded"
+            break
+        except TransportError as e:
+            # Provider outages and quota errors are not bugs in the agent; self-healing can't fix them
+            print(f"\n--- PROVIDER ERROR ---\n{e}")
+            state["history"].append(f"Provider call failed: {e}")
+            state["status"] = "transport_error"
+            break
         except Exception as e:
             print(f"\n--- AGENT ERROR ---")
             print(f"An error occurred: {e}")
             state["history"].append(f"Action failed with error: {e}")
+            state["status"] = "error"
 
             if is_self_improvement:
                 print("Self-improvement loop failed. Aborting to prevent recursion.")
                 break
+            if not options["self_heal"]:
+                print("Self-healing is disabled for this run. Stopping.")
+                break
 
             print(">> Initiating self-improvement loop...")
             self_improvement_task = (
@@ -335,11 +884,12 @@ Action:
                 f"The error was: '{e}'.\n"
                 f"Error context: This error occurred during tool execution.\n"
                 f"Available tools and their required parameters:\n"
-                f"- read_file(filename: str)\n"
+                f"- read_file(filename: str, offset: int = 1, limit: int = None)\n"
                 f"- save_file(filename: str, code: str)\n"
                 f"- replace_in_file(filename: str, old_code: str, new_code: str)\n"
-                f"- list_files(path: str = '.')\n"
-                f"- run_command(command: str)\n"
+                f"- list_files(path: str = '.', recursive: bool = False, pattern: str = None, max_depth: int = None, sort: str = 'name')\n"
+                f"- search(query: str, regex: bool = False, path: str = '.', files: str = None)\n"
+                f"- run_command(command: str, timeout: int = None)\n"
                 f"- finish(reason: str)\n\n"
                 f"Analyze the history and the source code of 'g_wave/main.py' to identify the root cause. "
                 f"Focus on parameter naming and tool execution logic. "
@@ -362,30 +912,29 @@ Action:
                 break
             
             # 2. Run the self-improvement loop on the staging file
-            run_agent_loop(self_improvement_task, max_loops=3, is_self_improvement=True, original_task=original_task)
+            with span("self_improvement"):
+                await arun_agent_loop(self_improvement_task, max_loops=3, is_self_improvement=True, original_task=original_task,
+                                      **options)
             
-            # 3. Test the staging file
+            # 3. Test the staging file: compile, import and smoke checks first, the full task rerun last
             print("\n>> Testing the staging file...")
-            cmd = [sys.executable, staging_file, original_task]
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-                
-                if result.returncode == 0:
-                    print("✔️ Staging test passed. Promoting to production.")
-                    shutil.move(staging_file, prod_file)
-                    print("✅ Self-improvement successful! Fixed code promoted to production.")
-                else:
-                    print(f"❌ Staging test failed. Discarding changes.\n--- Staging Output ---\n{result.stdout}\n--- Staging Error ---\n{result.stderr}")
-                    if os.path.exists(staging_file):
-                        os.remove(staging_file)
-            except subprocess.TimeoutExpired:
-                print("⏱️ Staging test timed out. Discarding changes to prevent infinite loops.")
+            with span("staging_test") as staging_span:
+                gate = await asyncio.to_thread(validate_staging, staging_file, original_task)
+                staging_span.update(passed=gate.passed, stage=gate.stage)
+
+            if gate.passed:
+                print(f"✔️ Staging test passed in {gate.seconds:.1f} s. Promoting to production.")
+                shutil.move(staging_file, prod_file)
+                print("✅ Self-improvement successful! Fixed code promoted to production.")
+            else:
+                print(f"❌ Staging {gate.stage} check failed after {gate.seconds:.1f} s. Discarding changes.\n{gate.detail}")
                 if os.path.exists(staging_file):
                     os.remove(staging_file)
 
             print(">> Self-improvement loop finished. Please retry the original task.")
             break
     else:
+        state["status"] = "max_loops"
         print(f"\n--- Max loops reached ({max_loops}). Attempting to provide summary based on current progress. ---")
         
         # Try to provide a summary of what was accomplished
@@ -405,10 +954,8 @@ Please provide a detailed summary of findings and recommendations for next steps
 """
             
             try:
-                # Use the planner to create a summary (imports are at top of file)
-                summary_template = langchain.prompts.PromptTemplate.from_template(summary_prompt)
-                summary_chain = summary_template | grok | langchain.schema.StrOutputParser()
-                summary = summary_chain.invoke({})
+                # Use the planner to create a summary
+                summary = await ainvoke("planner", summary_prompt, {}, stage="summary")
                 print(f"\n📋 SUMMARY:\n{summary}")
             except Exception as e:
                 print(f"\n📋 SUMMARY: Completed {len(state['history'])} actions. Analyzed {len(state['files_content'])} files. Task may need more time to complete fully.")
@@ -416,14 +963,40 @@ Please provide a detailed summary of findings and recommendations for next steps
         else:
             print("\n📋 No actions were completed. Task may need to be reformulated or simplified.")
 
+    if options["plan_ahead"]:
+        # One planner call per loop is what the default mode would have made
+        state["planner_calls_saved"] = max(state["loops_used"] - state["planner_calls"], 0)
+        print(f"\n🧭 Plan-ahead: {state['planner_calls']} planner calls over {state['loops_used']} loops "
+              f"({state['planner_calls_saved']} saved)")
+    return state
+
 @app.command()
 def chat(
     task: str = typer.Argument(None, help="The task for the agent to perform."),
-    max_loops: int = typer.Option(20, "--max-loops", "-l", help="Maximum number of loops (default: 20, increase for complex tasks)")
+    max_loops: int = typer.Option(20, "--max-loops", "-l", help="Maximum number of loops (default: 20, increase for complex tasks)"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Serve repeated LLM prompts from the on-disk response cache"),
+    cache_roles: str = typer.Option("planner,coder,actor", "--cache-roles", help="Comma-separated roles whose responses are cached"),
+    replay_only: bool = typer.Option(False, "--replay-only", help="Only use cached responses; never call the network"),
+    trace: str = typer.Option(None, "--trace", help="Append per-stage timing spans to this JSONL file"),
+    max_cost: float = typer.Option(None, "--max-cost", help="Stop the run before model calls would exceed this many USD"),
+    pricing: str = typer.Option(None, "--pricing", help="JSON rate table (USD per 1M tokens) overriding the defaults"),
+    stream: bool = typer.Option(False, "--stream", help="Render planner and coder output as it is generated"),
+    structured: bool = typer.Option(False, "--structured", help="Planner emits JSON tool calls directly (no separate actor call)"),
+    plan_ahead: bool = typer.Option(False, "--plan-ahead", help="Plan several steps at once; replan only on errors or deviations"),
+    patch: bool = typer.Option(False, "--patch", help="Edit existing files with patches (apply_patch) instead of whole-file rewrites"),
+    rollback_on_error: bool = typer.Option(False, "--rollback-on-error", help="Undo the run's file changes if it fails (instead of self-healing)"),
+    persistent_shell: bool = typer.Option(False, "--persistent-shell", help="Run commands in one shell session that keeps cwd and environment"),
+    retrieval: bool = typer.Option(False, "--retrieval", help="Add the workspace code that best matches the task to planner prompts (indexes the cwd)")
 ):
     """Interactive chat mode or single-task execution with the G-Wave agent."""
+    if trace:
+        configure_tracing(trace)
+    rates = load_pricing(pricing)
+    configure_cache(enabled=cache, roles=[r.strip() for r in cache_roles.split(",") if r.strip()], replay_only=replay_only)
     if task:
-        run_agent_loop(task, max_loops=max_loops, original_task=task)
+        run_agent_loop(task, max_loops=max_loops, original_task=task, max_cost=max_cost, pricing=rates, stream=stream,
+                      structured=structured, plan_ahead=plan_ahead, patch=patch, rollback_on_error=rollback_on_error,
+                      persistent_shell=persistent_shell, retrieval=retrieval)
     else:
         print("Welcome to G-Wave! I can read, write, and execute code across multiple steps.")
         print(f"Using max loops: {max_loops} (use --max-loops to adjust for complex tasks)")
@@ -434,7 +1007,98 @@ def chat(
             if not task_input:
                 continue
             
-            run_agent_loop(task_input, max_loops=max_loops, original_task=task_input)
+            run_agent_loop(task_input, max_loops=max_loops, original_task=task_input, max_cost=max_cost, pricing=rates,
+                           stream=stream, structured=structured, plan_ahead=plan_ahead, patch=patch,
+                           rollback_on_error=rollback_on_error, persistent_shell=persistent_shell, retrieval=retrieval)
+
+@app.command()
+def batch(
+    tasks_file: str = typer.Argument(..., help="JSONL file: one {\"id\": ..., \"task\": ..., \"max_loops\": ...} object (or plain string) per line."),
+    workers: int = typer.Option(4, "--workers", "-w", help="Maximum number of tasks running at once"),
+    output: str = typer.Option("batch_results.jsonl", "--output", "-o", help="Results JSONL; tasks already recorded here are skipped (resume)"),
+    max_loops: int = typer.Option(20, "--max-loops", "-l", help="Default maximum number of loops per task"),
+    workspace_root: str = typer.Option("g_wave_batch", "--workspace-root", help="Each task gets its own workspace directory under this root"),
+    max_cost: float = typer.Option(None, "--max-cost", help="Per-task cost cap in USD"),
+    trace: str = typer.Option(None, "--trace", help="Append per-stage timing spans to this JSONL file"),
+    structured: bool = typer.Option(False, "--structured", help="Planner emits JSON tool calls directly (no separate actor call)"),
+    plan_ahead: bool = typer.Option(False, "--plan-ahead", help="Plan several steps at once; replan only on errors or deviations"),
+    patch: bool = typer.Option(False, "--patch", help="Edit existing files with patches (apply_patch) instead of whole-file rewrites"),
+    rollback_on_error: bool = typer.Option(False, "--rollback-on-error", help="Undo a task's file changes if it fails"),
+    persistent_shell: bool = typer.Option(False, "--persistent-shell", help="Each task runs its commands in one shell session"),
+    retrieval: bool = typer.Option(False, "--retrieval", help="Add the workspace code that best matches each task to planner prompts")
+):
+    """Runs many tasks concurrently in one process with a bounded worker pool."""
+    from g_wave.batch import run_batch
+
+    if trace:
+        configure_tracing(trace)
+    run_batch(arun_agent_loop, tasks_file, output, workers=workers, max_loops=max_loops,
+              workspace_root=workspace_root, max_cost=max_cost, structured=structured,
+              plan_ahead=plan_ahead, patch=patch, rollback_on_error=rollback_on_error,
+              persistent_shell=persistent_shell, retrieval=retrieval)
+
+@app.command()
+def resume(
+    run_id: str = typer.Argument(..., help="Run id printed at the end of the run (state[\"run_id\"])."),
+    max_loops: int = typer.Option(None, "--max-loops", "-l", help="Loop limit for the resumed run (default: the run's original limit)"),
+    trace: str = typer.Option(None, "--trace", help="Append per-stage timing spans to this JSONL file")
+):
+    """Continues an interrupted run from its last completed loop."""
+    try:
+        meta = load_checkpoint(run_id).meta
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        raise typer.Exit(1)
+    cwd = meta.get("cwd")
+    if cwd and os.path.abspath(cwd) != os.getcwd():
+        # Cached file names and relative tool paths are relative to the directory the run started in
+        try:
+            os.chdir(cwd)
+        except OSError as e:
+            print(f"❌ Run {run_id} ran in {cwd}, which can't be entered: {e}")
+            raise typer.Exit(1)
+        print(f"📂 Resuming in {cwd}, where the run started")
+    if trace:
+        configure_tracing(trace)
+    token, root_token = use_workspace(meta["workspace"]), use_root(meta.get("root"))
+    try:
+        run_agent_loop(meta["task"], max_loops=max_loops or meta["max_loops"], original_task=meta["original_task"],
+                       resume=run_id, **meta["options"])
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise typer.Exit(1)
+    finally:
+        reset_root(root_token)
+        reset_workspace(token)
+
+@app.command()
+def rollback(run_id: str = typer.Argument(..., help="Run id printed at the end of the run (state[\"run_id\"]).")):
+    """Restores every file a run changed to its content before the run."""
+    try:
+        journal = load_journal(run_id)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        raise typer.Exit(1)
+    for path in journal.rollback():
+        print(f"↩️  {path}")
+    for path, error in journal.failed.items():
+        print(f"❌ Could not restore {path}: {error}")
+    if journal.failed:
+        print(f"⚠️  {len(journal.failed)} file(s) were not restored; fix the cause and run `g_wave rollback {run_id}` again.")
+        raise typer.Exit(1)
+    print(f"✅ Rolled back run {run_id}.")
+
+@trace_app.command("summarize")
+def trace_summarize(path: str = typer.Argument(..., help="JSONL trace file written with --trace.")):
+    """Prints p50/p95 latency per stage (plan, code, act, repair_args, tool, ...)."""
+    from g_wave.tracing import format_summary, load_spans, summarize
+
+    spans = load_spans(path)
+    if not spans:
+        print(f"No spans found in {path}.")
+        raise typer.Exit(1)
+    print(f"{len(spans)} spans from {len({s['trace_id'] for s in spans})} trace(s)")
+    print(format_summary(summarize(spans)))
 
 if __name__ == "__main__":
     app()
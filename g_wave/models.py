@@ -0,0 +1,215 @@
+import importlib
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from g_wave.cache import ReplayMiss, get_cache
+from g_wave.tracing import span
+
+# --- Provider Configuration ---
+# Each provider is described declaratively; its SDK is only imported and its
+# client only constructed the first time a role actually asks for it.
+PROVIDERS: Dict[str, Dict[str, Any]] = {
+    "gemini": {
+        "module": "langchain_google_genai",
+        "class": "ChatGoogleGenerativeAI",
+        "kwargs": {"model": "gemini-2.5-pro"},
+        "api_key_env": "GEMINI_API_KEY",
+    },
+    "claude": {
+        "module": "langchain_anthropic",
+        "class": "ChatAnthropic",
+        "kwargs": {"model": "claude-3-5-sonnet-20241022"},
+        "api_key_env": "CLAUDE_API_KEY",
+    },
+    "grok": {
+        "module": "langchain_openai",
+        "class": "ChatOpenAI",
+        "kwargs": {"model": "grok-2-1212", "base_url": "https://api.x.ai/v1"},
+        "api_key_env": "XAI_API_KEY",
+    },
+    "kimi": {
+        "module": "langchain_openai",
+        "class": "ChatOpenAI",
+        "kwargs": {"model": "moonshot-v1-8k", "base_url": "https://api.moonshot.ai/v1"},
+        "api_key_env": "MOONSHOT_API_KEY",
+    },
+}
+
+# Which provider plays which part in the agent loop.
+ROLES: Dict[str, str] = {
+    "planner": "grok",
+    "coder": "gemini",
+    "fallback_coder": "claude",
+    "actor": "kimi",
+}
+
+# Providers tried for each role, preferred first. Later entries receive failovers and
+# hedged duplicates of slow calls (see g_wave.routing).
+ROUTES: Dict[str, List[str]] = {
+    "planner": ["grok", "claude"],
+    "coder": ["gemini", "claude"],
+    "actor": ["kimi", "claude"],
+}
+
+_models: Dict[str, Any] = {}
+
+
+def resolve(name: str) -> str:
+    """Maps a role name (e.g. 'planner') to its provider name (e.g. 'grok')."""
+    return ROLES.get(name, name)
+
+
+def build_model(provider: str):
+    """Imports the provider SDK and constructs a fresh chat model client."""
+    spec = PROVIDERS[provider]
+    module = importlib.import_module(spec["module"])
+    model_cls = getattr(module, spec["class"])
+    return model_cls(api_key=os.getenv(spec["api_key_env"]), **spec["kwargs"])
+
+
+def get_model(name: str):
+    """Returns the chat model for a role or provider, building it on first use."""
+    provider = resolve(name)
+    if provider in _models:
+        return _models[provider]
+    if provider not in PROVIDERS:
+        raise KeyError(f"Unknown model role or provider: '{name}'")
+    model = build_model(provider)
+    _models[provider] = model
+    return model
+
+
+def routes_for(role: str) -> List[str]:
+    """Providers that may serve `role`, preferred first."""
+    return ROUTES.get(role, [resolve(role)])
+
+
+def set_model(name: str, model) -> None:
+    """Injects a ready-made chat model for a role or provider (e.g. a scripted stand-in)."""
+    _models[resolve(name)] = model
+
+
+def reset_models() -> None:
+    """Forgets every built or injected model so the next lookup rebuilds it."""
+    _models.clear()
+
+
+def loaded_providers() -> list:
+    """Lists the providers whose clients have been built or injected so far."""
+    return list(_models.keys())
+
+
+# --- Invocation ---
+def model_name(model) -> str:
+    """Best-effort identifier of the concrete model behind a chat client."""
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+
+def provider_model_name(provider: str) -> str:
+    """Model name for `provider` without building its client."""
+    if provider in _models:
+        return model_name(_models[provider])
+    return PROVIDERS[provider]["kwargs"]["model"]
+
+
+async def ainvoke(role: str, template: str, inputs: Dict[str, Any], stage: str = None,
+                  on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Renders `template` with `inputs`, sends it to the role's model and returns the text reply.
+
+    With `on_chunk`, the reply is streamed via `astream` and each text fragment is passed to it
+    as it arrives; the returned string is the same as without streaming.
+
+    Responses are served from / stored in the on-disk response cache when it is enabled for `role`.
+    Each call is recorded as a trace span named `stage` (defaults to the role) and, when a run is
+    tracking usage, billed to its UsageTracker. Provider calls go through the per-provider rate
+    limiter with retries and are routed across the role's providers (failover and hedging);
+    a call that no provider can serve raises TransportError.
+    """
+    # Imported here rather than at module level to keep CLI startup fast
+    import langchain.prompts
+    import langchain.schema
+    from g_wave.ratelimit import call_with_retry, get_limiter
+    from g_wave.routing import route
+    from g_wave.usage import BudgetExceeded, current_tracker
+
+    providers = routes_for(role)
+    name = provider_model_name(providers[0])
+    stage = stage or role
+    prompt_value = langchain.prompts.PromptTemplate.from_template(template).invoke(inputs)
+    rendered = prompt_value.to_string()
+    tracker = current_tracker()
+
+    with span(stage, role=role, model=name, prompt_chars=len(rendered)) as call_span:
+        cache = get_cache()
+        use_cache = cache is not None and cache.enabled_for(role)
+        if use_cache:
+            cached = cache.get(name, rendered)
+            if cached is not None:
+                print(f"  (cache hit: {role} / {name})")
+                if on_chunk:
+                    on_chunk(cached)
+                call_span.update(cached=True, response_chars=len(cached))
+                if tracker:
+                    tracker.record(role, stage, name, None, cached=True)
+                return cached
+        if cache is not None and cache.replay_only:
+            raise ReplayMiss(f"Replay-only mode: no cached {role} response for {name}.")
+
+        prompt_tokens = (len(rendered) + 3) // 4
+        if tracker:
+            tracker.check_budget(name, prompt_tokens, role)
+        parser = langchain.schema.StrOutputParser()
+        attempts: Dict[str, Dict[str, int]] = {}
+
+        async def call(model):
+            if not on_chunk:
+                return await model.ainvoke(prompt_value)
+            message = None
+            async for chunk in model.astream(prompt_value):
+                message = chunk if message is None else message + chunk
+                text = parser.invoke(chunk)
+                if text:
+                    on_chunk(text)
+            call_span["streamed"] = True
+            return message
+
+        async def attempt(provider: str, started: Callable[[], None]):
+            model = get_model(provider)
+            attempts[provider] = {"attempts": 0}
+            return await call_with_retry(provider, lambda: call(model), tokens=prompt_tokens,
+                                         attempts_out=attempts[provider], on_send=started)
+
+        def can_hedge(backup: str) -> bool:
+            """A hedge is a second paid call: it has to fit the cost cap alongside the one in flight."""
+            try:
+                tracker.check_budget(provider_model_name(backup), prompt_tokens, role,
+                                     reserved=tracker.price(name, prompt_tokens, tracker.expected_output_tokens(role)))
+            except BudgetExceeded:
+                print(f"  💸 Not hedging {role} with {backup}: it would exceed the cost cap")
+                return False
+            return True
+
+        try:
+            # Streamed output can't be taken back, so streaming calls fail over but never hedge
+            provider, message, info = await route(role, providers, attempt, hedge=on_chunk is None,
+                                                  can_hedge=can_hedge if tracker else None)
+        finally:
+            call_span["attempts"] = sum(a["attempts"] for a in attempts.values())
+        served_by = provider_model_name(provider)
+        response = parser.invoke(message) if message is not None else ""
+        usage = getattr(message, "usage_metadata", None)
+        call_span.update(cached=False, response_chars=len(response), model=served_by, provider=provider,
+                         hedged=info["hedged"], failed_providers=info["failed"])
+        get_limiter(provider).settle(prompt_tokens, (usage or {}).get("total_tokens", 0))
+        if usage:
+            call_span.update(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
+        if tracker:
+            tracker.record(role, stage, served_by, usage, prompt_chars=len(rendered), response_chars=len(response),
+                           provider=provider)
+            for loser in info["cancelled"]:
+                tracker.record(role, stage, provider_model_name(loser), None, prompt_chars=len(rendered),
+                               provider=loser, cancelled=True)
+    if use_cache:
+        # Keyed by the primary provider's model, like the lookup, whichever provider served the call
+        cache.put(name, rendered, response)
+    return response
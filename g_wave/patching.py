@@ -0,0 +1,171 @@
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from g_wave.writes import file_exists, read_current, write_text
+
+# --- Matching Configuration ---
+# Minimum similarity for a fuzzy hunk match, and the largest file (in lines x hunk lines)
+# for which the fuzzy scan is attempted.
+FUZZ_THRESHOLD = float(os.getenv("G_WAVE_PATCH_FUZZ", "0.85"))
+MAX_FUZZY_WORK = 2_000_000
+
+
+class PatchError(Exception):
+    """A patch could not be parsed or one of its hunks did not apply."""
+
+
+@dataclass
+class Hunk:
+    old: List[str]
+    new: List[str]
+    hint: Optional[int] = None  # 0-based line the hunk claims to start at (unified diffs only)
+
+
+# --- Parsing ---
+SEARCH_RE = re.compile(r"^<{5,} ?SEARCH[^\n]*\n(.*?)^={5,}[^\n]*\n(.*?)^>{5,} ?REPLACE[^\n]*$", re.DOTALL | re.MULTILINE)
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+def _lines(block: str) -> List[str]:
+    return block.split("\n")[:-1] if block.endswith("\n") else block.split("\n") if block else []
+
+
+def parse_search_replace(patch: str) -> List[Hunk]:
+    return [Hunk(_lines(old), _lines(new)) for old, new in SEARCH_RE.findall(patch)]
+
+
+def parse_unified_diff(patch: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    lines = patch.split("\n")
+    for i, line in enumerate(lines):
+        header = HUNK_HEADER_RE.match(line)
+        if header:
+            hunks.append(Hunk([], [], max(int(header.group(1)) - 1, 0)))
+        elif line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            continue  # file header
+        elif line.startswith("+++ ") and i > 0 and lines[i - 1].startswith("--- "):
+            continue
+        elif not hunks or line.startswith("\\"):
+            continue  # preamble ("diff --git", "index ...") or "\ No newline at end of file"
+        elif line.startswith("-"):
+            hunks[-1].old.append(line[1:])
+        elif line.startswith("+"):
+            hunks[-1].new.append(line[1:])
+        else:
+            # Context line; models often drop the leading space on blank lines
+            hunks[-1].old.append(line[1:] if line.startswith(" ") else line)
+            hunks[-1].new.append(line[1:] if line.startswith(" ") else line)
+    for hunk in hunks:
+        # Trailing blank "context" is usually just the end of the model's output
+        while hunk.old and hunk.new and hunk.old[-1] == "" and hunk.new[-1] == "":
+            hunk.old.pop()
+            hunk.new.pop()
+    return hunks
+
+
+def parse_patch(patch: str) -> List[Hunk]:
+    """Parses SEARCH/REPLACE blocks or a unified diff (optionally inside ``` fences)."""
+    patch = re.sub(r"^```[\w-]*\n|\n```\s*$", "", patch.strip() + "\n")
+    if SEARCH_RE.search(patch):
+        hunks = parse_search_replace(patch)
+    elif re.search(r"^@@ ", patch, re.MULTILINE):
+        hunks = parse_unified_diff(patch)
+    else:
+        raise PatchError("Unrecognized patch format: expected SEARCH/REPLACE blocks or a unified diff with @@ hunks.")
+    if not hunks:
+        raise PatchError("Patch contains no hunks.")
+    return hunks
+
+
+# --- Matching ---
+def _closest(candidates: List[int], start: int, hint: Optional[int]) -> int:
+    target = hint if hint is not None else start
+    after = [c for c in candidates if c >= start]
+    return min(after or candidates, key=lambda c: abs(c - target))
+
+
+def find_hunk(lines: List[str], old: List[str], start: int = 0, hint: Optional[int] = None) -> Tuple[Optional[int], float, str]:
+    """Locates `old` in `lines`: exactly, then ignoring whitespace, then by similarity.
+
+    Returns (index, similarity, how). `how` is "none" when nothing is similar enough;
+    the index is then the closest candidate (or None), for error messages.
+    """
+    n = len(old)
+    if n == 0:
+        return (min(hint, len(lines)) if hint is not None else len(lines)), 1.0, "insert"
+    windows = range(len(lines) - n + 1)
+    exact = [i for i in windows if lines[i:i + n] == old]
+    if exact:
+        return _closest(exact, start, hint), 1.0, "exact"
+
+    stripped_old = [l.strip() for l in old]
+    stripped = [l.strip() for l in lines]
+    loose = [i for i in windows if stripped[i:i + n] == stripped_old]
+    if loose:
+        return _closest(loose, start, hint), 1.0, "whitespace"
+
+    if len(lines) * n > MAX_FUZZY_WORK:
+        return None, 0.0, "none"
+    target = "\n".join(stripped_old)
+    best, best_ratio = None, 0.0
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for i in windows:
+        matcher.set_seq1("\n".join(stripped[i:i + n]))
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio or (ratio == best_ratio and best is not None and abs(i - start) < abs(best - start)):
+            best, best_ratio = i, ratio
+    return best, best_ratio, "fuzzy" if best_ratio >= FUZZ_THRESHOLD else "none"
+
+
+def _preview(lines: List[str], limit: int = 8) -> str:
+    shown = "\n".join(f"    {l}" for l in lines[:limit])
+    return shown + (f"\n    ... ({len(lines) - limit} more lines)" if len(lines) > limit else "")
+
+
+def apply_hunks(text: str, hunks: List[Hunk]) -> Tuple[str, List[str]]:
+    """Applies every hunk in order, in memory. Raises PatchError (naming the hunk) if any fails.
+
+    Returns the new text and a note per hunk describing where and how it matched.
+    """
+    newline = "\r\n" if "\r\n" in text else "\n"
+    trailing = text.endswith(newline)
+    lines = text.split(newline)
+    if trailing:
+        lines.pop()
+    notes, start = [], 0
+    for number, hunk in enumerate(hunks, 1):
+        index, ratio, how = find_hunk(lines, hunk.old, start, hunk.hint)
+        if how == "none":
+            message = f"Hunk {number}/{len(hunks)} did not apply; no match for:\n{_preview(hunk.old)}"
+            if index is not None:
+                message += (f"\nClosest text ({ratio:.0%} similar, need {FUZZ_THRESHOLD:.0%}) at line {index + 1}:\n"
+                            f"{_preview(lines[index:index + len(hunk.old)])}")
+            raise PatchError(message)
+        lines[index:index + len(hunk.old)] = hunk.new
+        notes.append(f"hunk {number}: {how} match at line {index + 1}" + (f" ({ratio:.0%})" if how == "fuzzy" else ""))
+        start = index + len(hunk.new)
+    return newline.join(lines) + (newline if trailing else ""), notes
+
+
+# --- Files ---
+def patch_file(path: Path, patch: str) -> str:
+    """Applies `patch` to `path` atomically: either every hunk applies and the file is replaced, or nothing changes."""
+    if not file_exists(path):
+        raise PatchError(f"{path} does not exist; use save_file to create new files.")
+    hunks = parse_patch(patch)
+    original = read_current(path)
+    try:
+        patched, notes = apply_hunks(original, hunks)
+    except PatchError as e:
+        raise PatchError(f"Patch rejected; {path} was not modified. {e}") from None
+    if patched == original:
+        return f"Patch applied to {path} but changed nothing ({'; '.join(notes)})."
+    write_text(path, patched)
+    return f"Successfully patched {path}: {len(hunks)} hunk(s) applied ({'; '.join(notes)})."
@@ -41,3 +41,58 @@ Output a JSON object with the following schema:
   }}
 }}
 """
+
+TOOL_CALL_PROMPT = """
+You are a master planner. Your primary directive is to fulfill the user's task by breaking it down into small, incremental steps.
+**Focus only on the single next best action to take.** Do not plan multiple steps ahead.
+If the next step needs several independent reads or listings (e.g. reading multiple files), put them all in "tool_calls"; they run together.
+Your available tools and their JSON schemas are:
+{tool_schemas}
+
+Task: {task}
+History: {history}
+File Contents: {files_content}
+
+Choose the next step: usually one tool call, or several in 'tool_calls' when they are independent of each other (e.g. reading a few files). Calls that depend on an earlier call's result belong in a later step. The code for 'save_file', the 'new_code' for 'replace_in_file' and the 'patch' for 'apply_patch' are written separately; do not include them.
+Output ONLY a JSON object with the following schema:
+{{
+  "thoughts": "<your reasoning for the next step>",
+  "tool_calls": [
+    {{
+      "tool": "<the name of the tool to use>",
+      "args": {{
+        "<argument_name>": "<argument_value>"
+      }}
+    }}
+  ]
+}}
+"""
+
+PLAN_AHEAD_PROMPT = """
+You are a master planner. Your primary directive is to fulfill the user's task by breaking it down into small, incremental steps.
+Plan the next {max_steps} steps (or fewer, if the task needs fewer), in order. End with a 'finish' step if the task will be complete.
+Your available tools and their JSON schemas are:
+{tool_schemas}
+
+Task: {task}
+History: {history}
+File Contents: {files_content}
+Why you are (re)planning: {replan_reason}
+
+For each step give a short description. Add "tool" and "args" when you already know the exact call; leave them out when
+the arguments depend on the results of earlier steps. The code for 'save_file', the 'new_code' for 'replace_in_file' and
+the 'patch' for 'apply_patch' are written separately; do not include them. "expect" is a short piece of text the step's result should contain if it
+went as planned (e.g. "Successfully saved"), or "" if anything is fine.
+Output ONLY a JSON object with the following schema:
+{{
+  "thoughts": "<your reasoning about the plan>",
+  "steps": [
+    {{
+      "step": "<one-sentence description>",
+      "tool": "<optional tool name>",
+      "args": {{"<argument_name>": "<argument_value>"}},
+      "expect": "<text expected in the result, or empty>"
+    }}
+  ]
+}}
+"""
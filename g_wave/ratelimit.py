@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# --- Limits Configuration ---
+# Requests and tokens per minute for each provider (None = unlimited). Override
+# with a JSON file of the same shape via G_WAVE_RATE_LIMITS=/path/to/limits.json.
+PROVIDER_LIMITS: Dict[str, Dict[str, Optional[int]]] = {
+    "gemini": {"rpm": 60, "tpm": 1_000_000},
+    "claude": {"rpm": 50, "tpm": 40_000},
+    "grok": {"rpm": 60, "tpm": 100_000},
+    "kimi": {"rpm": 20, "tpm": 32_000},
+}
+
+MAX_ATTEMPTS = int(os.getenv("G_WAVE_MAX_RETRIES", "5"))
+BASE_DELAY = float(os.getenv("G_WAVE_RETRY_BASE_DELAY", "1.0"))
+MAX_DELAY = float(os.getenv("G_WAVE_RETRY_MAX_DELAY", "30.0"))
+
+# HTTP statuses and exception class names that indicate a transient provider problem.
+TRANSIENT_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERRORS = {
+    "RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "OverloadedError", "ServiceUnavailable", "ResourceExhausted", "DeadlineExceeded",
+    "TooManyRequests", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError",
+}
+
+
+class TransportError(Exception):
+    """A model call failed for reasons outside the agent (network, quota, provider outage)."""
+
+    def __init__(self, provider: str, error: BaseException, attempts: int):
+        super().__init__(f"{provider} call failed after {attempts} attempt(s): {type(error).__name__}: {error}")
+        self.provider = provider
+        self.error = error
+        self.attempts = attempts
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    for candidate in (getattr(error, "status_code", None), getattr(getattr(error, "response", None), "status_code", None),
+                      getattr(error, "code", None)):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for rate limits, timeouts, connection problems and 5xx responses."""
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if status_of(error) in TRANSIENT_STATUS:
+        return True
+    return type(error).__name__ in TRANSIENT_ERRORS
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the provider sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Token Buckets ---
+class TokenBucket:
+    """Reservation-style token bucket refilled continuously at `capacity` per `period` seconds.
+
+    Reservations are taken immediately (the level may go negative) and the caller
+    sleeps for the returned delay, so waiters are served in arrival order without a lock.
+    """
+
+    def __init__(self, capacity: int, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` and returns how long to wait before it is actually available."""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Corrects an earlier reservation once the real cost is known (positive = consume more)."""
+        self._refill()
+        self.level -= amount
+
+
+class ProviderLimiter:
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, tokens: int) -> float:
+        """Waits until one request and `tokens` tokens are available; returns the time waited."""
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, estimated: int, actual: int) -> None:
+        if self.tokens and actual:
+            self.tokens.adjust(actual - estimated)
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def load_limits() -> Dict[str, Dict[str, Optional[int]]]:
+    limits = {provider: dict(l) for provider, l in PROVIDER_LIMITS.items()}
+    path = os.getenv("G_WAVE_RATE_LIMITS")
+    if path:
+        with open(path, "r") as f:
+            for provider, override in json.load(f).items():
+                limits.setdefault(provider, {}).update(override)
+    return limits
+
+
+def set_limits(provider: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+    """Replaces the provider's limiter (no arguments = unlimited, e.g. for a local stand-in model)."""
+    _limiters[provider] = ProviderLimiter(rpm, tpm)
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    if provider not in _limiters:
+        limits = load_limits().get(provider, {})
+        _limiters[provider] = ProviderLimiter(limits.get("rpm"), limits.get("tpm"))
+    return _limiters[provider]
+
+
+# --- Retry ---
+async def call_with_retry(provider: str, call: Callable[[], Awaitable[Any]], tokens: int = 0,
+                          max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                          max_delay: Optional[float] = None, attempts_out: Optional[Dict[str, int]] = None,
+                          on_send: Optional[Callable[[], None]] = None) -> Any:
+    """Runs `call` under the provider's rate limits, retrying transient failures.
+
+    `on_send`, if given, is called right before each attempt goes out, after the limiter
+    has granted it, so callers can time the provider apart from local waits and backoff.
+
+    Uses full-jitter exponential backoff (honouring Retry-After). Any failure that
+    survives the retries is raised as TransportError so callers can tell it apart
+    from agent errors.
+    """
+    max_attempts = max_attempts or MAX_ATTEMPTS
+    base_delay = BASE_DELAY if base_delay is None else base_delay
+    max_delay = MAX_DELAY if max_delay is None else max_delay
+    limiter = get_limiter(provider)
+    for attempt in range(1, max_attempts + 1):
+        if attempts_out is not None:
+            attempts_out["attempts"] = attempt
+        waited = await limiter.acquire(tokens)
+        if waited > 1:
+            print(f"  ⏳ {provider}: rate limited locally, waited {waited:.1f}s")
+        if on_send is not None:
+            on_send()
+        try:
+            return await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise TransportError(provider, e, attempt) from e
+            if attempt == max_attempts:
+                raise TransportError(provider, e, attempt) from e
+            delay = retry_after(e) or random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            print(f"  ⏳ {provider}: {type(e).__name__} ({status_of(e) or 'no status'}); "
+                  f"retrying in {delay:.1f}s (attempt {attempt + 1}/{max_attempts})")
+            await asyncio.sleep(delay)
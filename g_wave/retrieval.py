@@ -0,0 +1,255 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from g_wave.context import estimate_tokens, truncate_to_tokens
+from g_wave.fsindex import WorkspaceIndex, get_index
+
+# --- Retrieval Configuration ---
+# Before each planner call, the chunks of workspace files that best match the task and current
+# step (BM25) are added to the prompt, up to TOKEN_BUDGET tokens. Per-file chunk statistics are
+# stored in INDEX_FILE keyed by content hash, so unchanged files are never re-chunked.
+INDEX_FILE = os.getenv("G_WAVE_RETRIEVAL_INDEX", os.path.join(".g_wave", "retrieval.json"))
+TOKEN_BUDGET = int(os.getenv("G_WAVE_RETRIEVAL_TOKEN_BUDGET", "2000"))
+TOP_K = int(os.getenv("G_WAVE_RETRIEVAL_TOP_K", "6"))
+CHUNK_LINES = int(os.getenv("G_WAVE_RETRIEVAL_CHUNK_LINES", "40"))
+MAX_FILE_BYTES = int(os.getenv("G_WAVE_RETRIEVAL_MAX_FILE_BYTES", str(256 * 1024)))
+MAX_CHUNKS_PER_FILE = 2
+SKIPPED_SUFFIXES = (".lock", ".min.js", ".min.css", ".map", ".svg", ".pyc")
+INDEX_VERSION = 1
+K1, B = 1.2, 0.75
+
+WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how", "if", "in", "into", "is", "it",
+    "its", "me", "my", "no", "not", "of", "on", "or", "so", "that", "the", "then", "this", "to", "we", "what",
+    "when", "which", "with", "you", "your", "all", "any", "can", "file", "files", "make", "please", "should",
+}
+
+
+@lru_cache(maxsize=65536)
+def _word_terms(word: str) -> Tuple[str, ...]:
+    lower = word.lower()
+    parts = [p.lower() for piece in word.split("_") for p in CAMEL_RE.findall(piece)]
+    return tuple(term for term in ([lower] + parts if len(parts) > 1 else [lower])
+                 if len(term) > 1 and term not in STOPWORDS and not term.isdigit())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms: each identifier plus its snake_case and camelCase parts, minus stopwords."""
+    terms: List[str] = []
+    for word in WORD_RE.findall(text):
+        terms.extend(_word_terms(word))
+    return terms
+
+
+def chunk_file(text: str) -> List[list]:
+    """[first line, last line, length, {term: tf}] for each CHUNK_LINES-line chunk of `text`."""
+    lines = text.splitlines()
+    chunks = []
+    for start in range(0, len(lines), CHUNK_LINES):
+        terms = Counter(tokenize("\n".join(lines[start:start + CHUNK_LINES])))
+        if terms:
+            chunks.append([start + 1, min(start + CHUNK_LINES, len(lines)), sum(terms.values()), dict(terms)])
+    return chunks
+
+
+class RetrievalIndex:
+    """BM25 index over line-chunks of the files in a workspace index.
+
+    Chunk statistics are cached per content hash and persisted to `index_file`; postings are
+    built in memory when the index is loaded and updated as files change. A changed file's
+    old chunks stay in the postings as dead ids until the index is compacted.
+    """
+
+    def __init__(self, fs: WorkspaceIndex, index_file: str = INDEX_FILE):
+        self.fs = fs
+        self.path = Path(fs.root) / index_file
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}  # rel path -> {"mtime", "size", "hash"}
+        self.by_hash: Dict[str, List[list]] = {}    # content hash -> chunks
+        self.dirty = False
+        self.load()
+        self.reset_postings()
+
+    # --- Persistence ---
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+            self.by_hash = data.get("chunks", {})
+
+    def save(self) -> None:
+        from g_wave.writes import write_atomic
+
+        live = {meta["hash"] for meta in self.files.values()}
+        self.by_hash = {h: chunks for h, chunks in self.by_hash.items() if h in live}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.path, json.dumps({"version": INDEX_VERSION, "files": self.files, "chunks": self.by_hash},
+                                           separators=(",", ":")))
+        self.dirty = False
+
+    # --- Postings ---
+    def reset_postings(self) -> None:
+        self.chunk_ids: Dict[str, List[int]] = {}       # rel path -> live chunk ids
+        self.chunks: List[Optional[Tuple[str, int, int, int]]] = []  # chunk id -> (path, first, last, length)
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}         # term -> [(chunk id, tf)]
+        self.live = 0
+        self.total_length = 0
+        self.dead = 0
+        for rel in self.files:
+            self._post(rel)
+
+    def _post(self, rel: str) -> None:
+        path_terms = set(tokenize(rel))
+        ids = self.chunk_ids[rel] = []
+        for first, last, length, terms in self.by_hash.get(self.files[rel]["hash"], []):
+            chunk_id = len(self.chunks)
+            self.chunks.append((rel, first, last, length))
+            ids.append(chunk_id)
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((chunk_id, tf + (term in path_terms)))
+            for term in path_terms.difference(terms):
+                self.postings.setdefault(term, []).append((chunk_id, 1))
+            self.live += 1
+            self.total_length += length
+
+    def _unpost(self, rel: str) -> None:
+        for chunk_id in self.chunk_ids.pop(rel, []):
+            self.live -= 1
+            self.total_length -= self.chunks[chunk_id][3]
+            self.chunks[chunk_id] = None
+            self.dead += 1
+
+    # --- Syncing ---
+    def _indexable(self, rel: str, size: int) -> bool:
+        return size <= MAX_FILE_BYTES and not rel.endswith(SKIPPED_SUFFIXES)
+
+    def _read(self, rel: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.fs.root, rel), "rb") as f:
+                data = f.read(MAX_FILE_BYTES + 1)
+        except OSError:
+            return None
+        return None if len(data) > MAX_FILE_BYTES or b"\0" in data[:8192] else data
+
+    def sync(self) -> Tuple[int, int]:
+        """Brings the index up to date with the workspace; returns (files re-hashed, files re-chunked)."""
+        with self.fs.lock:
+            current = {e.path: (e.mtime, e.size) for e in self.fs.entries.values()
+                       if not e.is_dir and self._indexable(e.path, e.size)}
+        hashed = chunked = 0
+        with self.lock:
+            for rel in [rel for rel in self.files if rel not in current]:
+                self._unpost(rel)
+                del self.files[rel]
+                self.dirty = True
+            for rel, (mtime, size) in current.items():
+                meta = self.files.get(rel)
+                if meta is not None and (meta["mtime"], meta["size"]) == (mtime, size) and rel in self.chunk_ids:
+                    continue
+                data = self._read(rel)
+                hashed += 1
+                digest = hashlib.sha1(data).hexdigest() if data is not None else "binary"
+                if digest not in self.by_hash:
+                    self.by_hash[digest] = chunk_file(data.decode("utf-8", errors="replace")) if data is not None else []
+                    chunked += 1
+                self._unpost(rel)
+                self.files[rel] = {"mtime": mtime, "size": size, "hash": digest}
+                self._post(rel)
+                self.dirty = True
+            if self.dead > max(1000, self.live):
+                self.reset_postings()
+            if self.dirty:
+                self.save()
+        return hashed, chunked
+
+    # --- Querying ---
+    def query(self, text: str, k: int = TOP_K, exclude: Iterable[str] = ()) -> List[Tuple[float, str, int, int]]:
+        """The `k` best (score, path, first line, last line) chunks for `text`, at most MAX_CHUNKS_PER_FILE per file."""
+        terms = set(tokenize(text))
+        excluded = set(exclude)
+        with self.lock:
+            if not self.live:
+                return []
+            avg_length = self.total_length / self.live
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = [(c, tf) for c, tf in self.postings.get(term, ()) if self.chunks[c] is not None]
+                if not postings:
+                    continue
+                idf = math.log(1 + (self.live - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings:
+                    length = self.chunks[chunk_id][3]
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / (
+                        tf + K1 * (1 - B + B * length / avg_length))
+            results, per_file = [], Counter()
+            for chunk_id in sorted(scores, key=scores.get, reverse=True):
+                rel, first, last, _ = self.chunks[chunk_id]
+                if rel in excluded or per_file[rel] >= MAX_CHUNKS_PER_FILE:
+                    continue
+                per_file[rel] += 1
+                results.append((scores[chunk_id], rel, first, last))
+                if len(results) >= k:
+                    break
+        return results
+
+
+_indexes: Dict[str, RetrievalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_retrieval_index(root: str = ".") -> RetrievalIndex:
+    """The shared retrieval index for `root`, synced with the workspace."""
+    fs = get_index(root)
+    with _indexes_lock:
+        index = _indexes.get(fs.root)
+        if index is None or index.fs is not fs:
+            index = _indexes[fs.root] = RetrievalIndex(fs)
+    index.sync()
+    return index
+
+
+def _norm(filename: str, root: str) -> str:
+    return os.path.relpath(os.path.abspath(filename), root).replace(os.sep, "/")
+
+
+def retrieve(query: str, known_files: Iterable[str] = (), max_tokens: int = TOKEN_BUDGET, k: int = TOP_K,
+             root: str = ".") -> Tuple[str, List[Dict[str, Any]]]:
+    """Prompt text with the best-matching chunks for `query` within `max_tokens`, and what was picked.
+
+    Files already in `known_files` are left out; their full contents are in the prompt anyway.
+    """
+    index = get_retrieval_index(root)
+    exclude = {_norm(f, index.fs.root) for f in known_files}
+    intro = "Possibly relevant code (excerpts found by keyword search; read a file before editing it):"
+    blocks, picked, used = [], [], estimate_tokens(intro)
+    for score, rel, first, last in index.query(query, k=k, exclude=exclude):
+        remaining = max_tokens - used
+        if remaining <= 50:
+            break
+        try:
+            with open(os.path.join(index.fs.root, rel), encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()[first - 1:last]
+        except OSError:
+            continue
+        header = f"--- {rel} (lines {first}-{last}) ---\n"
+        block = header + truncate_to_tokens("\n".join(lines), remaining - estimate_tokens(header))
+        blocks.append(block)
+        picked.append({"path": rel, "lines": [first, last], "score": round(score, 2)})
+        used += estimate_tokens(block) + 1
+    if not blocks:
+        return "", picked
+    return "\n".join([intro] + blocks), picked
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from g_wave.ratelimit import TransportError
+from g_wave.tracing import percentile
+
+# --- Routing Configuration ---
+WINDOW = int(os.getenv("G_WAVE_ROUTE_WINDOW", "50"))                 # calls remembered per provider
+HEDGE_PERCENTILE = float(os.getenv("G_WAVE_HEDGE_PERCENTILE", "95"))  # hedge once a call is slower than this
+HEDGE_MIN_SAMPLES = int(os.getenv("G_WAVE_HEDGE_MIN_SAMPLES", "5"))   # latency samples needed before hedging
+HEDGE_MIN_DELAY = float(os.getenv("G_WAVE_HEDGE_MIN_DELAY", "2.0"))   # never hedge sooner than this (seconds)
+FAILURE_THRESHOLD = int(os.getenv("G_WAVE_BREAKER_FAILURES", "3"))    # consecutive failures that open a breaker
+ERROR_RATE_THRESHOLD = float(os.getenv("G_WAVE_BREAKER_ERROR_RATE", "0.5"))
+COOLDOWN = float(os.getenv("G_WAVE_BREAKER_COOLDOWN", "30"))          # seconds before a half-open probe
+
+
+class CircuitOpen(Exception):
+    """Raised when every provider for a role has an open circuit breaker."""
+
+
+# --- Provider Health ---
+class ProviderHealth:
+    """Rolling outcome window, per-role latencies and a circuit breaker for one provider.
+
+    The breaker opens after FAILURE_THRESHOLD consecutive failures, or when the error
+    rate over a full window of at least 10 calls reaches ERROR_RATE_THRESHOLD. After
+    COOLDOWN seconds it goes half-open and lets a single probe call through.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.outcomes: Deque[bool] = deque(maxlen=WINDOW)
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= COOLDOWN:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self, role: str, latency: float) -> None:
+        self.outcomes.append(True)
+        self.latencies.setdefault(role, deque(maxlen=WINDOW)).append(latency)
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            print(f"  ✅ {self.provider} recovered; circuit closed")
+        self.state = "closed"
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.state == "open":
+            return
+        if (self.state == "half_open" or self.consecutive_failures >= FAILURE_THRESHOLD
+                or (len(self.outcomes) >= 10 and self.error_rate >= ERROR_RATE_THRESHOLD)):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+            print(f"  🔌 {self.provider} circuit opened for {COOLDOWN:.0f}s "
+                  f"({self.consecutive_failures} consecutive failures, {self.error_rate:.0%} error rate)")
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def hedge_delay(self, role: str) -> Optional[float]:
+        """Seconds after which a call for `role` counts as slow, or None without enough history."""
+        samples = self.latencies.get(role)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(percentile(list(samples), HEDGE_PERCENTILE), HEDGE_MIN_DELAY)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state, "calls": len(self.outcomes), "error_rate": round(self.error_rate, 3),
+            "p50_s": {role: round(percentile(list(l), 50), 3) for role, l in self.latencies.items()},
+            "p95_s": {role: round(percentile(list(l), 95), 3) for role, l in self.latencies.items()},
+        }
+
+
+_health: Dict[str, ProviderHealth] = {}
+
+
+def health(provider: str) -> ProviderHealth:
+    if provider not in _health:
+        _health[provider] = ProviderHealth(provider)
+    return _health[provider]
+
+
+def reset_health() -> None:
+    _health.clear()
+
+
+def health_report() -> Dict[str, Dict[str, Any]]:
+    return {provider: h.snapshot() for provider, h in _health.items()}
+
+
+# --- Routing ---
+async def route(role: str, providers: List[str], attempt: Callable[[str, Callable[[], None]], Awaitable[Any]],
+                hedge: bool = True, can_hedge: Optional[Callable[[str], bool]] = None) -> Tuple[str, Any, Dict[str, Any]]:
+    """Calls `attempt(provider, started)` for the first healthy provider in `providers`.
+
+    `attempt` calls `started()` each time its request actually goes out to the provider, i.e.
+    after any local rate-limit wait or retry backoff; latencies are measured from there. If the
+    primary's request outlives the provider's latency percentile for `role`, a hedged duplicate
+    goes to the next healthy provider and the first answer wins; the other is cancelled.
+    `can_hedge(provider)`, when given, can veto a hedge (e.g. one the cost cap can't cover).
+    Failed calls fail over down the list. Returns (provider, result, info) where info
+    records whether the call was hedged, which providers failed and which were cancelled
+    after their request went out (they may still be billed for it).
+    """
+    queue = list(providers)
+    pending: Dict[asyncio.Task, str] = {}
+    info: Dict[str, Any] = {"hedged": False, "failed": [], "cancelled": []}
+    last_error: Optional[BaseException] = None
+    sent: Dict[str, float] = {}  # provider -> when its current request went out
+    went_out = asyncio.Event()
+
+    async def timed(provider: str) -> Any:
+        def started() -> None:
+            sent[provider] = time.monotonic()
+            went_out.set()
+
+        begun = time.monotonic()
+        try:
+            result = await attempt(provider, started)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            health(provider).record_failure()
+            raise
+        health(provider).record_success(role, time.monotonic() - sent.get(provider, begun))
+        return result
+
+    def start_next(allowed: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        while queue:
+            if allowed is not None and not allowed(queue[0]):
+                return None  # stays queued for failover
+            provider = queue.pop(0)
+            if health(provider).allow():
+                pending[asyncio.create_task(timed(provider))] = provider
+                return provider
+            print(f"  🔌 Skipping {provider} for {role}: circuit open")
+        return None
+
+    primary = start_next()
+    if primary is None:
+        raise TransportError(providers[0], CircuitOpen(f"All providers for {role} are unavailable"), 0)
+    delay = health(primary).hedge_delay(role) if hedge else None
+
+    try:
+        while pending:
+            timeout = watch = None
+            if delay is not None and queue:
+                if primary in sent:
+                    timeout = max(sent[primary] + delay - time.monotonic(), 0.0)
+                else:
+                    # Still waiting on the local rate limiter: the hedge clock starts when the request goes out
+                    went_out.clear()
+                    watch = asyncio.ensure_future(went_out.wait())
+            done, _ = await asyncio.wait([*pending, *filter(None, [watch])], timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if watch is not None:
+                watch.cancel()
+                done.discard(watch)
+            if not done:
+                if timeout is None or time.monotonic() < sent[primary] + delay:
+                    continue  # the primary's request only just went out (or was retried)
+                backup = start_next(can_hedge)
+                if backup:
+                    info["hedged"] = True
+                    print(f"  ⏱️ {primary} is slow for {role} (> {delay:.1f}s); hedging with {backup}")
+                delay = None
+                continue
+            for task in done:
+                provider = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    last_error = e
+                    info["failed"].append(provider)
+                    continue
+                info["provider"] = provider
+                return provider, result, info
+            if not pending:
+                failed = info["failed"][-1]
+                backup = start_next()
+                if backup:
+                    print(f"  ↪️ {failed} failed for {role} ({type(last_error).__name__}); failing over to {backup}")
+    finally:
+        info["cancelled"] = [provider for provider in pending.values() if provider in sent]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    if isinstance(last_error, TransportError):
+        raise last_error
+    raise TransportError(info["failed"][-1], last_error, 1) from last_error
@@ -0,0 +1,157 @@
+import ast
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from g_wave.workspace import resolve_path
+
+# --- Scope Configuration ---
+# How many related files (imports, callers) accompany the target file in a coder prompt.
+MAX_RELATED = int(os.getenv("G_WAVE_CODER_RELATED_FILES", "4"))
+# Files larger than this are not read from disk for analysis.
+MAX_SCAN_BYTES = 256 * 1024
+MAX_SIBLINGS = 200
+
+PATH_TOKEN_RE = re.compile(r"[\w./-]+\.[A-Za-z]\w*")
+
+
+def read_text(path: str) -> Optional[str]:
+    try:
+        if os.path.getsize(path) > MAX_SCAN_BYTES:
+            return None
+        with open(path, "r") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def locate(filename: str) -> Optional[str]:
+    """On-disk path for a tool filename: as given (reads), else resolved into the workspace (writes)."""
+    for candidate in (filename, str(resolve_path(filename))):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def find_target(plan: str, known_files: List[str]) -> Optional[str]:
+    """Guesses which file a plan edits: a known file it names, else the first path-like token on disk."""
+    for name in sorted(known_files, key=len, reverse=True):
+        if name in plan:
+            return name
+    for token in PATH_TOKEN_RE.findall(plan):
+        token = token.rstrip(".")
+        if locate(token):
+            return token
+    return None
+
+
+# --- Static Analysis ---
+def imported_modules(source: str) -> List[Tuple[str, int]]:
+    """(module, relative level) pairs for every import in Python `source`; empty if it doesn't parse."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    modules = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.extend((alias.name, 0) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            modules.append((base, node.level))
+            modules.extend((f"{base}.{alias.name}".strip("."), node.level) for alias in node.names)
+    return modules
+
+
+def defined_names(source: str) -> List[str]:
+    """Top-level functions and classes defined in Python `source`."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    return [node.name for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            and not node.name.startswith("_")]
+
+
+def module_paths(module: str, level: int, target_dir: str) -> List[str]:
+    """Candidate files for an import, relative to the target's directory (relative imports) or the cwd."""
+    if not module and not level:
+        return []
+    base = target_dir
+    for _ in range(max(level - 1, 0)):
+        base = os.path.dirname(base)
+    stem = module.replace(".", os.sep)
+    roots = [base] if level else [target_dir, "."]
+    paths = []
+    for root in roots:
+        paths.append(os.path.normpath(os.path.join(root, stem + ".py")))
+        paths.append(os.path.normpath(os.path.join(root, stem, "__init__.py")))
+    return paths
+
+
+def related_files(target: str, target_source: str, files_content: Dict[str, str],
+                  limit: int = MAX_RELATED) -> Dict[str, str]:
+    """Picks up to `limit` files related to `target`, most related first.
+
+    Candidates are the files already read this run plus the target's sibling files. A file
+    the target imports scores 3, a file that imports the target scores 3, and a file that
+    mentions one of the target's top-level names scores 1.
+    """
+    target_path = locate(target) or target
+    target_dir = os.path.dirname(target_path)
+    stem = os.path.splitext(os.path.basename(target_path))[0]
+    is_python = target_path.endswith(".py")
+
+    candidates: Dict[str, str] = {name: body for name, body in files_content.items() if name != target}
+    imports = imported_modules(target_source) if is_python else []
+    for module, level in imports:
+        for path in module_paths(module, level, target_dir):
+            if path not in candidates and os.path.normpath(path) != os.path.normpath(target_path) and os.path.isfile(path):
+                body = read_text(path)
+                if body is not None:
+                    candidates[path] = body
+    if is_python and os.path.isdir(target_dir or "."):
+        with os.scandir(target_dir or ".") as entries:
+            for entry in list(entries)[:MAX_SIBLINGS]:
+                path = os.path.join(target_dir, entry.name) if target_dir else entry.name
+                if entry.name.endswith(".py") and entry.is_file() and path not in candidates \
+                        and os.path.normpath(path) != os.path.normpath(target_path):
+                    body = read_text(path)
+                    if body is not None:
+                        candidates[path] = body
+
+    imported = {os.path.normpath(p) for module, level in imports for p in module_paths(module, level, target_dir)}
+    caller_re = re.compile(rf"^\s*(?:from|import)\s+[\w.]*\b{re.escape(stem)}\b", re.MULTILINE)
+    names = defined_names(target_source) if is_python else []
+    scores: Dict[str, int] = {}
+    for name, body in candidates.items():
+        score = 0
+        if os.path.normpath(locate(name) or name) in imported:
+            score += 3
+        if caller_re.search(body):
+            score += 3
+        if names and any(re.search(rf"\b{re.escape(n)}\b", body) for n in names):
+            score += 1
+        if score:
+            scores[name] = score
+    ranked = sorted(scores, key=lambda n: scores[n], reverse=True)[:limit]
+    return {name: candidates[name] for name in ranked}
+
+
+def scope_files(plan: str, files_content: Dict[str, str], target: Optional[str] = None) -> Tuple[Optional[str], Dict[str, str]]:
+    """Returns (target, files) for a coder prompt: related files first, the target last.
+
+    Without an identifiable target, every known file is returned unchanged.
+    """
+    target = target or find_target(plan, list(files_content))
+    if not target:
+        return None, dict(files_content)
+    source = files_content.get(target)
+    if source is None:
+        path = locate(target)
+        source = read_text(path) if path else None
+    files = related_files(target, source or "", files_content)
+    files = dict(reversed(list(files.items())))  # fit_files keeps the last entries first
+    if source is not None:
+        files[target] = source
+    return target, files
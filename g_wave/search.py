@@ -0,0 +1,303 @@
+import fnmatch
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set, Tuple
+
+from g_wave.fsindex import WorkspaceIndex, index_for, on_file_changed
+
+try:
+    from re import _parser as sre_parse
+    from re._constants import LITERAL, MAX_REPEAT, MIN_REPEAT, SUBPATTERN
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_constants import LITERAL, MAX_REPEAT, MIN_REPEAT, SUBPATTERN
+
+# --- Search Configuration ---
+# Files larger than MAX_FILE_BYTES (and binary files) are not indexed or searched.
+MAX_FILE_BYTES = int(os.getenv("G_WAVE_SEARCH_MAX_FILE_BYTES", str(1024 * 1024)))
+MAX_LINE_CHARS = 300
+WORD_RE = re.compile(r"\w+")
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class SearchIndex:
+    """Inverted index from (lowercased) word tokens to the files containing them.
+
+    A trigram index over the token vocabulary finds the tokens containing a substring,
+    so a query only reads the files that can possibly match. Files are indexed on first
+    search and re-indexed when their mtime or size changes; a rewritten file gets a new id
+    and its old id is left dead in the postings until the index is compacted.
+    """
+
+    def __init__(self, fs: WorkspaceIndex):
+        self.fs = fs
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.paths: List[Optional[str]] = []        # file id -> path (None once superseded)
+        self.ids: Dict[str, int] = {}               # path -> live file id
+        self.stamps: Dict[str, Tuple[float, int]] = {}
+        self.skipped: Set[str] = set()              # binary or too large
+        self.vocab: List[str] = []                  # token id -> token
+        self.token_ids: Dict[str, int] = {}
+        self.files_by_token: List[array] = []
+        self.token_trigrams: Dict[str, array] = {}  # trigram -> token ids
+        self.dead = 0
+
+    def read(self, rel: str) -> Optional[str]:
+        path = os.path.join(self.fs.root, rel)
+        try:
+            if os.path.getsize(path) > MAX_FILE_BYTES:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def _token_id(self, token: str) -> int:
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.vocab)
+            self.vocab.append(token)
+            self.files_by_token.append(array("I"))
+            for trigram in _trigrams(token):
+                self.token_trigrams.setdefault(trigram, array("I")).append(token_id)
+        return token_id
+
+    def _add(self, rel: str, stamp: Tuple[float, int]) -> None:
+        self.stamps[rel] = stamp
+        text = self.read(rel)
+        if text is None:
+            self.skipped.add(rel)
+            return
+        self.skipped.discard(rel)
+        file_id = len(self.paths)
+        self.paths.append(rel)
+        self.ids[rel] = file_id
+        for token in set(WORD_RE.findall(text.lower())):
+            self.files_by_token[self._token_id(token)].append(file_id)
+
+    def _drop(self, rel: str) -> None:
+        file_id = self.ids.pop(rel, None)
+        if file_id is not None:
+            self.paths[file_id] = None
+            self.dead += 1
+        self.stamps.pop(rel, None)
+        self.skipped.discard(rel)
+
+    def sync(self) -> Tuple[int, int]:
+        """Indexes new and changed files, drops deleted ones; returns (indexed, dropped)."""
+        with self.fs.lock:
+            files = {e.path: (e.mtime, e.size) for e in self.fs.entries.values() if not e.is_dir}
+        with self.lock:
+            if self.dead > max(1000, len(self.ids)):
+                self.reset()  # compact: most postings point at superseded files
+            dropped = [rel for rel in self.stamps if rel not in files]
+            for rel in dropped:
+                self._drop(rel)
+            changed = [rel for rel, stamp in files.items() if self.stamps.get(rel) != stamp]
+            for rel in changed:
+                self._drop(rel)
+                self._add(rel, files[rel])
+        return len(changed), len(dropped)
+
+    def file_changed(self, path: str) -> None:
+        rel = os.path.relpath(os.path.abspath(path), self.fs.root).replace(os.sep, "/")
+        if rel.startswith("..") or not self.stamps:
+            return  # outside this index, or not built yet (the first search will pick it up)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            self._drop(rel)
+            self._add(rel, (stat.st_mtime, stat.st_size))
+
+    # --- Candidate Selection ---
+    def _tokens_matching(self, piece: str, left_bounded: bool, right_bounded: bool) -> Optional[Set[int]]:
+        """Token ids a literal word piece can be part of, or None if the piece is too short to narrow anything."""
+        if left_bounded and right_bounded:
+            token_id = self.token_ids.get(piece)
+            return set() if token_id is None else {token_id}
+        if len(piece) < 3:
+            return None
+        trigram_postings = [self.token_trigrams.get(t) for t in _trigrams(piece)]
+        if any(p is None for p in trigram_postings):
+            return set()
+        trigram_postings.sort(key=len)
+        token_ids = set(trigram_postings[0])
+        for postings in trigram_postings[1:]:
+            token_ids.intersection_update(postings)
+        if left_bounded:
+            return {t for t in token_ids if self.vocab[t].startswith(piece)}
+        if right_bounded:
+            return {t for t in token_ids if self.vocab[t].endswith(piece)}
+        return {t for t in token_ids if piece in self.vocab[t]}
+
+    def candidates(self, fragments: List[str]) -> Optional[Set[int]]:
+        """Files containing every literal fragment's word pieces, or None when nothing narrows the search."""
+        result: Optional[Set[int]] = None
+        with self.lock:
+            for fragment in fragments:
+                fragment = fragment.lower()
+                for match in WORD_RE.finditer(fragment):
+                    token_ids = self._tokens_matching(match.group(), match.start() > 0, match.end() < len(fragment))
+                    if token_ids is None:
+                        continue
+                    files: Set[int] = set()
+                    for token_id in token_ids:
+                        files.update(self.files_by_token[token_id])
+                    result = files if result is None else result & files
+                    if not result:
+                        return result
+        return result
+
+
+# --- Query Planning ---
+def literal_fragments(parsed) -> List[str]:
+    """Literal strings that every match of a parsed regex must contain."""
+    fragments, current = [], []
+
+    def flush():
+        if current:
+            fragments.append("".join(current))
+            current.clear()
+
+    for op, arg in parsed:
+        if op is LITERAL:
+            current.append(chr(arg))
+            continue
+        flush()
+        if op is SUBPATTERN:
+            fragments.extend(literal_fragments(arg[-1]))
+        elif op in (MAX_REPEAT, MIN_REPEAT) and arg[0] >= 1:
+            fragments.extend(literal_fragments(arg[2]))
+    flush()
+    return fragments
+
+
+def query_fragments(query: str, regex: bool, flags: int) -> List[str]:
+    if not regex:
+        return [query]
+    try:
+        return literal_fragments(sre_parse.parse(query, flags))
+    except Exception:
+        return []
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(fs: WorkspaceIndex) -> SearchIndex:
+    with _indexes_lock:
+        index = _indexes.get(fs.root)
+        if index is None or index.fs is not fs:
+            index = _indexes[fs.root] = SearchIndex(fs)
+    return index
+
+
+def _file_changed(path: str) -> None:
+    for index in list(_indexes.values()):
+        index.file_changed(path)
+
+
+on_file_changed(_file_changed)
+
+
+# --- Searching ---
+def _clip(line: str) -> str:
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "..."
+
+
+def search_workspace(query: str, regex: bool = False, path: str = ".", files: Optional[str] = None,
+                     case_sensitive: bool = True, context: int = 1, max_results: int = 50) -> str:
+    """grep-style results (`path:line: text`, context lines as `path-line- text`) for `query` under `path`."""
+    if not query:
+        raise ValueError("query must not be empty.")
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"'{path}' is not a directory.")
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        pattern = re.compile(query if regex else re.escape(query), flags | re.MULTILINE)
+    except re.error as e:
+        raise ValueError(f"invalid regex {query!r}: {e}")
+
+    fs, rel_dir = index_for(path)
+    index = get_search_index(fs)
+    first_build = not index.stamps
+    start = time.perf_counter()
+    index.sync()
+    if first_build:
+        print(f">> Search index: {len(index.ids)} files indexed in {time.perf_counter() - start:.2f} s")
+
+    candidate_ids = index.candidates(query_fragments(query, regex, flags))
+    with index.lock:
+        if candidate_ids is None:
+            candidates = [p for p in index.paths if p is not None]
+        else:
+            candidates = [index.paths[i] for i in candidate_ids if index.paths[i] is not None]
+    if rel_dir:
+        candidates = [p for p in candidates if p.startswith(rel_dir + "/")]
+    if files:
+        candidates = [p for p in candidates if fnmatch.fnmatchcase(p.rsplit("/", 1)[-1], files) or fnmatch.fnmatchcase(p, files)]
+    candidates.sort()
+
+    lines_out: List[str] = []
+    matches = matched_files = 0
+    for rel in candidates:
+        text = index.read(rel)
+        if text is None:
+            continue
+        line_starts = None
+        shown_lines: Set[int] = set()
+        file_blocks: List[str] = []
+        for match in pattern.finditer(text):
+            if line_starts is None:
+                line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+                lines = text.splitlines()
+            line_no = bisect_right(line_starts, match.start())  # 1-based
+            if line_no in shown_lines:
+                continue
+            matches += 1
+            if matches > max_results:
+                break
+            shown = rel[len(rel_dir) + 1:] if rel_dir else rel
+            for n in range(max(line_no - context, 1), min(line_no + context, len(lines)) + 1):
+                if n in shown_lines:
+                    continue
+                shown_lines.add(n)
+                sep = ":" if n == line_no else "-"
+                file_blocks.append(f"{shown}{sep}{n}{sep} {_clip(lines[n - 1])}")
+        if file_blocks:
+            matched_files += 1
+            if lines_out and context:
+                lines_out.append("--")
+            lines_out.extend(file_blocks)
+        if matches > max_results:
+            break
+
+    total = len(index.ids)
+    if matches == 0:
+        ignored = f"; {path} is ignored by .gitignore, so it was indexed on demand" if fs.on_demand else ""
+        return f"No matches for {query!r} ({len(candidates)} candidate files of {total} indexed{ignored})."
+    header = (f"{min(matches, max_results)} matches in {matched_files} files "
+              f"({len(candidates)} candidate files of {total} indexed)")
+    if matches > max_results:
+        header += f"; stopped at {max_results}, narrow the query, path or files filter to see more"
+    if index.skipped:
+        header += f"; {len(index.skipped)} binary or large files not searched"
+    if fs.on_demand:
+        header += f"; {path} is ignored by .gitignore, so it was indexed on demand"
+    return header + "\n" + "\n".join(lines_out)
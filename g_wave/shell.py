@@ -0,0 +1,442 @@
+import asyncio
+import codecs
+import contextvars
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from g_wave.streaming import write_stdout
+from g_wave.workspace import current_workspace
+
+try:
+    import resource  # noqa: F401  (POSIX only; the launcher below needs it)
+    HAS_RUSAGE = True
+except ImportError:
+    HAS_RUSAGE = False
+
+# --- Command Configuration ---
+# run_command kills a command after COMMAND_TIMEOUT seconds. Of its output, the first and
+# last OUTPUT_BYTES / 2 bytes per stream are returned; the full output spills to a log file
+# under <workspace>/LOG_DIR when anything had to be cut.
+COMMAND_TIMEOUT = float(os.getenv("G_WAVE_COMMAND_TIMEOUT", "300"))
+OUTPUT_BYTES = int(os.getenv("G_WAVE_COMMAND_OUTPUT_BYTES", "8000"))
+ECHO_OUTPUT = os.getenv("G_WAVE_COMMAND_ECHO", "1") not in ("0", "false", "off")
+LOG_DIR = "command_logs"
+DRAIN_GRACE = 1.0
+READ_CHUNK = 65536
+
+# Runs the shell command as its only child, then reports its exit code and the CPU time and
+# peak RSS of the whole process tree (every reaped descendant counts in RUSAGE_CHILDREN) on
+# the given fd. That fd is not inherited by the command, so its EOF marks the command's end
+# even when a background process it started still holds stdout open.
+LAUNCHER = (
+    "import os, resource, subprocess, sys\n"
+    "code = subprocess.call(sys.argv[1], shell=True)\n"
+    "code = code if code >= 0 else 128 - code\n"
+    "usage = resource.getrusage(resource.RUSAGE_CHILDREN)\n"
+    "os.write(int(sys.argv[2]), f'{code} {usage.ru_utime} {usage.ru_stime} {usage.ru_maxrss}'.encode())\n"
+    "sys.exit(code)\n"
+)
+
+
+class OutputCapture:
+    """Keeps the first and last `limit / 2` bytes of a stream and counts everything in between."""
+
+    def __init__(self, limit: int = OUTPUT_BYTES):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > 2 * self.tail_limit:
+                del self.tail[:-self.tail_limit]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.head_limit + self.tail_limit
+
+    def text(self, log_path: Optional[str] = None) -> str:
+        tail = self.tail[-self.tail_limit:] if self.tail_limit else b""
+        if not self.truncated:
+            return (bytes(self.head) + bytes(tail)).decode("utf-8", errors="replace")
+        omitted = self.total - len(self.head) - len(tail)
+        where = f"; full output in {log_path}" if log_path else ""
+        return (bytes(self.head).decode("utf-8", errors="replace")
+                + f"\n... [{omitted} bytes omitted{where}] ...\n"
+                + bytes(tail).decode("utf-8", errors="replace"))
+
+
+class CommandOutput:
+    """Both streams of one command: echoed live, kept head+tail, and logged in full to the workspace."""
+
+    def __init__(self, limit: int = OUTPUT_BYTES, echo: bool = ECHO_OUTPUT):
+        self.captures = {"stdout": OutputCapture(limit), "stderr": OutputCapture(limit)}
+        self.decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in self.captures}
+        self.echo = echo
+        log_dir = Path(current_workspace()) / LOG_DIR
+        log_dir.mkdir(parents=True, exist_ok=True)
+        log_fd, self.log_path = tempfile.mkstemp(dir=str(log_dir), prefix=f"cmd-{time.strftime('%Y%m%d-%H%M%S')}-",
+                                                 suffix=".log")
+        self.log = os.fdopen(log_fd, "wb")
+
+    def feed(self, name: str, data: bytes) -> None:
+        self.captures[name].feed(data)
+        self.log.write(data)
+        if self.echo:
+            write_stdout(self.decoders[name].decode(data))
+
+    def close(self) -> Optional[str]:
+        """Closes the log, keeping it only if some output was cut; returns its path if kept."""
+        self.log.close()
+        if any(c.truncated for c in self.captures.values()):
+            return self.log_path
+        os.remove(self.log_path)
+        return None
+
+
+@dataclass
+class CommandResult:
+    command: str
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    timeout: Optional[float] = None
+    cpu_user: Optional[float] = None
+    cpu_system: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    log_path: Optional[str] = None
+    note: Optional[str] = None
+
+    def format(self) -> str:
+        """Tool result text: an exit/resource summary line, then the (capped) streams."""
+        usage = f"{self.duration:.2f} s wall"
+        if self.cpu_user is not None:
+            usage += f", CPU {self.cpu_user:.2f} s user + {self.cpu_system:.2f} s sys"
+        if self.peak_rss_mb is not None:
+            usage += f", peak RSS {self.peak_rss_mb:.1f} MB"
+        if self.timed_out:
+            summary = f"Error: command timed out after {self.timeout:g} s and was killed ({usage})."
+        else:
+            summary = f"Exit code: {self.exit_code} ({usage})"
+        if self.note:
+            summary += f"\nNote: {self.note}"
+        return f"{summary}\nSTDOUT:\n{self.stdout}\nSTDERR:\n{self.stderr}"
+
+
+def _kill_group(process: asyncio.subprocess.Process) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def _parse_report(raw: bytes):
+    """(exit code, user CPU s, system CPU s, peak RSS MB) from the launcher's report."""
+    try:
+        code, user, system, max_rss = raw.decode().split()
+    except ValueError:
+        return None, None, None, None
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    rss_mb = int(max_rss) / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return int(code), float(user), float(system), rss_mb
+
+
+async def _read_report(fd: int) -> bytes:
+    """Reads the launcher's report pipe to EOF without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb"))
+    return await reader.read()
+
+
+async def run_shell(command: str, timeout: Optional[float] = None, limit: int = OUTPUT_BYTES,
+                    echo: bool = ECHO_OUTPUT, cwd: Optional[str] = None) -> CommandResult:
+    """Runs `command` through the shell without blocking the event loop.
+
+    Output is echoed to the console as it arrives, kept head+tail in memory and written in
+    full to a log file in the workspace (kept only if the returned output was cut). After
+    `timeout` seconds the command's whole process group is killed, as are background processes
+    still holding its output open once it has exited (redirect their output to keep them).
+    The command runs in `cwd` (default: the process cwd).
+    """
+    timeout = COMMAND_TIMEOUT if timeout is None else timeout
+    usage_read = usage_write = None
+    if HAS_RUSAGE:
+        usage_read, usage_write = os.pipe()
+        argv = [sys.executable, "-I", "-S", "-c", LAUNCHER, command, str(usage_write)]
+        spawn = asyncio.create_subprocess_exec(*argv, pass_fds=(usage_write,), start_new_session=True, cwd=cwd,
+                                               stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                                               stderr=asyncio.subprocess.PIPE)
+    else:
+        spawn = asyncio.create_subprocess_shell(command, cwd=cwd, stdin=asyncio.subprocess.DEVNULL,
+                                                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    start = time.perf_counter()
+    try:
+        process = await spawn
+    except BaseException:
+        if usage_read is not None:
+            os.close(usage_read)
+        raise
+    finally:
+        if usage_write is not None:
+            os.close(usage_write)
+
+    output = CommandOutput(limit, echo)
+
+    async def pump(name: str, stream: asyncio.StreamReader) -> None:
+        while True:
+            data = await stream.read(READ_CHUNK)
+            if not data:
+                break
+            output.feed(name, data)
+
+    readers = asyncio.gather(pump("stdout", process.stdout), pump("stderr", process.stderr))
+    timed_out = background = False
+    drained = True
+    report = b""
+    try:
+        if usage_read is not None:
+            report = await asyncio.wait_for(_read_report(usage_read), timeout)
+        else:
+            await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill_group(process)
+    except BaseException:
+        _kill_group(process)
+        raise
+    finally:
+        try:
+            await asyncio.wait_for(asyncio.shield(readers), DRAIN_GRACE)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Background processes the command left running still hold its output pipes open
+            background = not timed_out
+            _kill_group(process)
+            try:
+                await asyncio.wait_for(readers, DRAIN_GRACE)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                readers.cancel()
+                drained = False
+        log_path = output.close()
+    if drained:
+        await process.wait()
+    duration = time.perf_counter() - start
+
+    exit_code, cpu_user, cpu_system, peak_rss = _parse_report(report) if report else (process.returncode, None, None, None)
+    return CommandResult(command=command, exit_code=None if timed_out else exit_code,
+                         stdout=output.captures["stdout"].text(log_path), stderr=output.captures["stderr"].text(log_path),
+                         duration=duration, timed_out=timed_out, timeout=timeout, cpu_user=cpu_user,
+                         cpu_system=cpu_system, peak_rss_mb=peak_rss, log_path=log_path,
+                         note="background processes still holding the command's output open were killed." if background else None)
+
+
+# --- Persistent Session ---
+SHELL = os.getenv("G_WAVE_SHELL") or shutil.which("bash") or "/bin/sh"
+TIMES_RE = re.compile(rb"(\d+)m([\d.]+)s")
+
+
+def _descendants(pid: int) -> List[int]:
+    """Every live descendant of `pid` (from /proc, or pgrep where there is no /proc)."""
+    children: Dict[int, List[int]] = {}
+    if os.path.isdir("/proc"):
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as f:
+                    ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    found, queue = [], [pid]
+    while queue:
+        parent = queue.pop()
+        if children:
+            kids = children.get(parent, [])
+        else:
+            listing = subprocess.run(["pgrep", "-P", str(parent)], capture_output=True, text=True).stdout
+            kids = [int(p) for p in listing.split()]
+        found.extend(kids)
+        queue.extend(kids)
+    return found
+
+
+class ShellSession:
+    """A long-lived shell, so `cd`, `export` and `source` carry over between run_command calls.
+
+    Each command is followed by a random marker on stdout and stderr, and its output is
+    read up to the markers. A timeout kills the command's processes but keeps the shell;
+    if the shell itself is stuck or has exited, a fresh one is started.
+    """
+
+    def __init__(self, shell: str = SHELL, cwd: Optional[str] = None):
+        self.shell = shell
+        self.cwd = cwd
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.leftover: Dict[str, bytearray] = {}
+        self.children_cpu = (0.0, 0.0)
+        self.restarts = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        args = [self.shell, "--noprofile", "--norc"] if os.path.basename(self.shell) == "bash" else [self.shell]
+        self.process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, start_new_session=True, cwd=self.cwd)
+        self.leftover = {}
+        self.children_cpu = (0.0, 0.0)
+
+    async def close(self) -> None:
+        """Kills the shell and everything it started."""
+        if self.process is None:
+            return
+        _kill_group(self.process)
+        try:
+            await asyncio.wait_for(self.process.wait(), DRAIN_GRACE)
+        except asyncio.TimeoutError:
+            pass
+        self.process = None
+
+    async def _read_until_marker(self, name: str, stream: asyncio.StreamReader, marker: bytes,
+                                 output: CommandOutput) -> Optional[bytes]:
+        """Feeds `stream` to `output` up to `marker`; returns the status text between `marker` and
+        `marker` + newline, or None if the shell exited first."""
+        buf = self.leftover.pop(name, bytearray())
+        while True:
+            start = buf.find(marker)
+            if start == -1:
+                safe = len(buf) - len(marker) + 1  # keep what could be the start of a marker
+                if safe > 0:
+                    output.feed(name, bytes(buf[:safe]))
+                    del buf[:safe]
+            else:
+                if start:
+                    output.feed(name, bytes(buf[:start]))
+                    del buf[:start]
+                end = buf.find(marker + b"\n")
+                if end != -1:
+                    self.leftover[name] = buf[end + len(marker) + 1:]
+                    return bytes(buf[len(marker):end])
+            data = await stream.read(READ_CHUNK)
+            if not data:
+                if buf:
+                    output.feed(name, bytes(buf))
+                return None
+            buf += data
+
+    def _cpu_delta(self, status: bytes) -> Tuple[Optional[float], Optional[float]]:
+        times = [int(m) * 60 + float(s) for m, s in TIMES_RE.findall(status)]
+        if len(times) < 4:
+            return None, None
+        user, system = times[2], times[3]  # second line of `times`: the shell's children
+        previous, self.children_cpu = self.children_cpu, (user, system)
+        return max(user - previous[0], 0.0), max(system - previous[1], 0.0)
+
+    async def run(self, command: str, timeout: Optional[float] = None, limit: int = OUTPUT_BYTES,
+                  echo: bool = ECHO_OUTPUT) -> CommandResult:
+        timeout = COMMAND_TIMEOUT if timeout is None else timeout
+        async with self.lock:
+            notes = []
+            if not self.alive:
+                if self.process is not None:
+                    self.restarts += 1
+                    notes.append("the previous shell session had exited, so this ran in a new one "
+                                 "(cwd and environment were reset)")
+                await self.start()
+            marker = f"__g_wave_{uuid.uuid4().hex}__"
+            script = (f"{{ {command}\n}} </dev/null\n"
+                      f"__g_wave_rc=$?\n"
+                      f"printf '%s %d\\n' '{marker}' \"$__g_wave_rc\"\ntimes\nprintf '%s\\n' '{marker}'\n"
+                      f"printf '%s\\n' '{marker}' >&2\n")
+            output = CommandOutput(limit, echo)
+            readers = asyncio.gather(
+                self._read_until_marker("stdout", self.process.stdout, marker.encode(), output),
+                self._read_until_marker("stderr", self.process.stderr, marker.encode(), output))
+            start = time.perf_counter()
+            timed_out = False
+            statuses = (None, None)
+            try:
+                self.process.stdin.write(script.encode())
+                await self.process.stdin.drain()
+                statuses = await asyncio.wait_for(asyncio.shield(readers), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                for pid in _descendants(self.process.pid):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                try:
+                    statuses = await asyncio.wait_for(readers, DRAIN_GRACE)
+                except asyncio.TimeoutError:
+                    # The shell itself is busy (e.g. a builtin loop or an unclosed quote)
+                    readers.cancel()
+                    await self.close()
+                    notes.append("the shell did not recover, so the session was restarted (cwd and environment were reset)")
+            except (BrokenPipeError, ConnectionResetError):
+                readers.cancel()
+            except BaseException:
+                readers.cancel()
+                await self.close()
+                raise
+            finally:
+                log_path = output.close()
+            duration = time.perf_counter() - start
+
+            stdout_status = statuses[0]
+            exit_code, cpu_user, cpu_system = None, None, None
+            if stdout_status is not None:
+                exit_code = int(stdout_status.split()[0])
+                cpu_user, cpu_system = self._cpu_delta(stdout_status)
+            elif self.process is not None and not timed_out:
+                exit_code = await asyncio.wait_for(self.process.wait(), DRAIN_GRACE)
+                notes.append(f"the command ended the shell session (status {exit_code}); "
+                             "the next command starts a new one with the initial cwd and environment")
+            return CommandResult(command=command, exit_code=None if timed_out else exit_code,
+                                 stdout=output.captures["stdout"].text(log_path),
+                                 stderr=output.captures["stderr"].text(log_path),
+                                 duration=duration, timed_out=timed_out, timeout=timeout, cpu_user=cpu_user,
+                                 cpu_system=cpu_system, log_path=log_path, note="; ".join(notes) or None)
+
+
+_session: contextvars.ContextVar = contextvars.ContextVar("g_wave_shell_session", default=None)
+
+
+def current_session() -> Optional[ShellSession]:
+    return _session.get()
+
+
+def start_session(session: ShellSession):
+    """Makes `session` the shell for run_command in this context; returns a token for stop_session()."""
+    return _session.set(session)
+
+
+def stop_session(token) -> None:
+    _session.reset(token)
@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import importlib.util
+import inspect
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from g_wave.models import PROVIDERS
+from g_wave.tracing import child_env, span
+
+# --- Validation Configuration ---
+# A staged self-improvement is checked in layers, cheapest first, and rejected at the first
+# failure: byte-compile, import in a subprocess with stubbed providers, a smoke suite on scripted
+# models, and only then the full original task against the live providers.
+IMPORT_TIMEOUT = int(os.getenv("G_WAVE_STAGING_IMPORT_TIMEOUT", "30"))
+SMOKE_TIMEOUT = int(os.getenv("G_WAVE_STAGING_SMOKE_TIMEOUT", "60"))
+FULL_RUN_TIMEOUT = int(os.getenv("G_WAVE_STAGING_TIMEOUT", "120"))
+RESULT_PREFIX = "G_WAVE_SMOKE "
+# Names the staged module must still provide for the agent and CLI to work
+REQUIRED_ATTRS = ("app", "TOOLS", "run_agent_loop", "arun_agent_loop", "parse_action", "split_actions", "repair_args")
+REQUIRED_TOOLS = ("list_files", "read_file", "save_file", "replace_in_file", "run_command", "finish")
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class GateResult:
+    passed: bool
+    stage: str      # the last stage run: compile, import, smoke or full_run
+    detail: str
+    seconds: float
+
+
+# --- Staged Module Loading (subprocess side) ---
+def stub_providers() -> None:
+    """Puts a scripted model behind every provider, so nothing can reach the network."""
+    from g_wave.fakes import ScriptedChatModel, install_fakes
+
+    install_fakes({name: ScriptedChatModel(model_name=f"stub-{name}", responses=["finish|reason=stubbed provider"])
+                   for name in PROVIDERS})
+
+
+def load_staged(path: str):
+    """Imports the staged main module from `path` (as g_wave.main_staging) and checks its interface."""
+    spec = importlib.util.spec_from_file_location("g_wave.main_staging", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    missing = [name for name in REQUIRED_ATTRS if not hasattr(module, name)]
+    missing += [f"TOOLS['{name}']" for name in REQUIRED_TOOLS if name not in getattr(module, "TOOLS", {})]
+    if missing:
+        raise AttributeError(f"staged module is missing {', '.join(missing)}")
+    return module
+
+
+# --- Smoke Suite (subprocess side) ---
+def _script(planner: List[str], actor: List[str] = (), coder: List[str] = ("print('smoke')",)) -> None:
+    from g_wave.fakes import ScriptedChatModel, install_fakes
+
+    stub_providers()
+    install_fakes({
+        "planner": ScriptedChatModel(model_name="smoke-planner", responses=list(planner)),
+        "actor": ScriptedChatModel(model_name="smoke-actor", responses=list(actor) or ["finish|reason=done"]),
+        "coder": ScriptedChatModel(model_name="smoke-coder", responses=list(coder)),
+    })
+
+
+def _call(tool: Callable, **args):
+    result = tool(**args)
+    return asyncio.run(result) if inspect.isawaitable(result) else result
+
+
+def _tool_call(tool: str, **args) -> str:
+    return json.dumps({"thoughts": "smoke", "tool_calls": [{"tool": tool, "args": args}]})
+
+
+def smoke_parse(m) -> None:
+    assert m.parse_action("read_file|filename=notes.txt") == ("read_file", {"filename": "notes.txt"})
+    assert m.parse_action("save_file|filename=out.py", "print(1)")[1].get("code") == "print(1)"
+    assert m.split_actions("read_file|filename=a.txt\nlist_files|path=.") == ["read_file|filename=a.txt", "list_files|path=."]
+
+
+def smoke_tools(m) -> None:
+    tools = m.TOOLS
+    assert _call(tools["save_file"], filename="notes.txt", code="alpha\n").startswith("Successfully"), "save_file failed"
+    workspace_file = os.path.join(m.WORKSPACE_DIR, "notes.txt")
+    assert _call(tools["read_file"], filename=workspace_file) == "alpha\n", "read_file did not return the saved content"
+    assert _call(tools["replace_in_file"], filename="notes.txt", old_code="alpha", new_code="beta").startswith("Successfully"), "replace_in_file failed"
+    assert _call(tools["read_file"], filename=workspace_file) == "beta\n", "replace_in_file did not change the file"
+    assert "notes.txt" in _call(tools["list_files"], path=m.WORKSPACE_DIR), "list_files did not list the saved file"
+    output = _call(tools["run_command"], command="echo smoke-ok")
+    assert "smoke-ok" in output, f"run_command output: {output[:200]}"
+
+
+def smoke_text_loop(m) -> None:
+    with open("notes.txt", "w") as f:
+        f.write("smoke notes\n")
+    _script(planner=["Read notes.txt", "finish"], actor=["read_file|filename=notes.txt", "finish|reason=done"])
+    state = m.run_agent_loop("Read notes.txt", max_loops=4, self_heal=False)
+    assert state["status"] == "finished", f"status {state['status']}: {state['history'][-1:]}"
+    assert state["files_content"].get("notes.txt") == "smoke notes\n", "read_file result missing from files_content"
+
+
+def smoke_structured_loop(m) -> None:
+    _script(planner=[_tool_call("save_file", filename="out.py"), _tool_call("finish", reason="done")])
+    state = m.run_agent_loop("Write out.py", max_loops=4, self_heal=False, structured=True)
+    assert state["status"] == "finished", f"status {state['status']}: {state['history'][-1:]}"
+    with open(os.path.join(m.WORKSPACE_DIR, "out.py")) as f:
+        assert f.read() == "print('smoke')", "coder output was not saved"
+
+
+def smoke_error_stops(m) -> None:
+    _script(planner=["not a tool call"])
+    state = m.run_agent_loop("Fail", max_loops=3, self_heal=False, structured=True)
+    assert state["status"] == "error" and state["loops_used"] == 1, f"status {state['status']} after {state['loops_used']} loops"
+
+
+SMOKE_SUITE: Dict[str, Callable] = {
+    "parse": smoke_parse,
+    "tools": smoke_tools,
+    "text_loop": smoke_text_loop,
+    "structured_loop": smoke_structured_loop,
+    "error_stops": smoke_error_stops,
+}
+
+
+def run_smoke_suite(path: str) -> bool:
+    """Runs every scenario in its own directory under the cwd; prints one result line per scenario."""
+    from g_wave.cache import configure_cache
+
+    configure_cache(enabled=False)
+    stub_providers()
+    module = load_staged(path)
+    root = os.getcwd()
+    passed = True
+    for name, scenario in SMOKE_SUITE.items():
+        os.makedirs(os.path.join(root, name))
+        os.chdir(os.path.join(root, name))
+        output = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output):
+                scenario(module)
+            error = None
+        except BaseException as e:
+            error = (f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=-3)}"
+                     f"--- output (last 1500 chars) ---\n{output.getvalue()[-1500:]}")
+            passed = False
+        finally:
+            os.chdir(root)
+        print(RESULT_PREFIX + json.dumps({"name": name, "ok": error is None, "error": error,
+                                          "seconds": round(time.perf_counter() - start, 3)}), flush=True)
+    return passed
+
+
+# --- Gate (agent side) ---
+def _env(stubbed: bool = True) -> Dict[str, str]:
+    """Environment for a check subprocess: the package importable and, if `stubbed`, no real API keys or cache."""
+    env = child_env()
+    if stubbed:
+        for spec in PROVIDERS.values():
+            env[spec["api_key_env"]] = "stubbed"  # set, so load_dotenv can't fill in real keys
+        env["G_WAVE_CACHE"] = "0"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def _run_check(check: str, path: str, timeout: int, cwd: Optional[str] = None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-m", "g_wave.staging", check, os.path.abspath(path)], capture_output=True,
+                          text=True, timeout=timeout, env=_env(), cwd=cwd)
+
+
+def check_compile(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            compile(f.read(), path, "exec")
+    except (SyntaxError, ValueError, OSError) as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def check_import(path: str) -> Optional[str]:
+    try:
+        result = _run_check("import", path, IMPORT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return f"import did not finish within {IMPORT_TIMEOUT} s"
+    return None if result.returncode == 0 else (result.stderr or result.stdout)[-3000:]
+
+
+def check_smoke(path: str) -> Optional[str]:
+    workdir = tempfile.mkdtemp(prefix="g_wave_smoke_")
+    try:
+        result = _run_check("smoke", path, SMOKE_TIMEOUT, cwd=workdir)
+    except subprocess.TimeoutExpired:
+        return f"smoke suite did not finish within {SMOKE_TIMEOUT} s"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results = [json.loads(line[len(RESULT_PREFIX):]) for line in result.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    failed = [r for r in results if not r["ok"]]
+    if failed:
+        return "\n".join(f"[{r['name']}] {r['error']}" for r in failed)[:4000]
+    if result.returncode != 0 or len(results) < len(SMOKE_SUITE):
+        return (result.stderr or result.stdout)[-3000:] or f"smoke suite exited with code {result.returncode}"
+    return None
+
+
+def check_full_run(path: str, original_task: str) -> Optional[str]:
+    try:
+        result = subprocess.run([sys.executable, path, original_task], capture_output=True, text=True,
+                                timeout=FULL_RUN_TIMEOUT, env=_env(stubbed=False))
+    except subprocess.TimeoutExpired:
+        return f"full task rerun did not finish within {FULL_RUN_TIMEOUT} s"
+    if result.returncode != 0:
+        return f"--- Staging Output ---\n{result.stdout}\n--- Staging Error ---\n{result.stderr}"
+    return None
+
+
+def validate_staging(path: str, original_task: str) -> GateResult:
+    """Runs the validation layers in order, stopping at the first that fails.
+
+    Without an `original_task` there is nothing to rerun (the staged CLI would wait for input),
+    so the full-run layer is skipped and the smoke suite is the last check.
+    """
+    stages = [
+        ("compile", lambda: check_compile(path)),
+        ("import", lambda: check_import(path)),
+        ("smoke", lambda: check_smoke(path)),
+    ]
+    if original_task:
+        stages.append(("full_run", lambda: check_full_run(path, original_task)))
+    start = time.perf_counter()
+    for stage, check in stages:
+        stage_start = time.perf_counter()
+        with span(f"staging_{stage}") as stage_span:
+            error = check()
+            stage_span["passed"] = error is None
+        elapsed = time.perf_counter() - stage_start
+        if error is not None:
+            print(f"  ✗ {stage} ({elapsed:.1f} s)")
+            return GateResult(False, stage, error, time.perf_counter() - start)
+        print(f"  ✓ {stage} ({elapsed:.1f} s)")
+    if not original_task:
+        print("  - full_run skipped: no original task to rerun")
+    return GateResult(True, stages[-1][0], "", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    check, staged_path = sys.argv[1], sys.argv[2]
+    if check == "import":
+        stub_providers()
+        load_staged(staged_path)
+        sys.exit(0)
+    sys.exit(0 if run_smoke_suite(staged_path) else 1)
@@ -0,0 +1,55 @@
+import sys
+from typing import Callable
+
+
+def write_stdout(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+class FenceStripper:
+    """Streams code to the terminal while hiding ```python fences as they arrive.
+
+    Mirrors, line by line, what `re.sub(r"```python\\n(.*?)\\n```", r"\\1", ...)` does to
+    the finished text; the final implementation string is still produced by that re.sub.
+    """
+
+    OPENER = "```python"
+    CLOSER = "```"
+
+    def __init__(self, write: Callable[[str], None] = write_stdout):
+        self.write = write
+        self.in_fence = False
+        self.pending = ""           # start of a line that might still turn out to be a fence
+        self.line_started = False   # part of the current line was already written
+
+    def _could_be_fence(self, partial: str) -> bool:
+        fence = self.CLOSER if self.in_fence else self.OPENER
+        return fence.startswith(partial) or partial.startswith(fence)
+
+    def _finish_line(self, line: str) -> None:
+        if not self.line_started:
+            if not self.in_fence and line == self.OPENER:
+                self.in_fence = True
+                return
+            if self.in_fence and line == self.CLOSER:
+                self.in_fence = False
+                return
+        self.write(line + "\n")
+
+    def feed(self, text: str) -> None:
+        self.pending += text
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            self._finish_line(line)
+            self.line_started = False
+        if self.pending and (self.line_started or not self._could_be_fence(self.pending)):
+            self.write(self.pending)
+            self.pending = ""
+            self.line_started = True
+
+    def close(self) -> None:
+        if self.pending and not (self.in_fence and self.pending == self.CLOSER and not self.line_started):
+            self.write(self.pending)
+        self.pending = ""
+        self.write("\n")
@@ -0,0 +1,81 @@
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from g_wave.tracing import span
+from g_wave.workspace import resolve_path, resolve_read_path
+from g_wave.writes import WRITE_BEHIND, write_behind
+
+# --- Batch Limits ---
+# Calls beyond this are dropped from a step (and reported) rather than run.
+MAX_BATCH_CALLS = int(os.getenv("G_WAVE_MAX_BATCH_CALLS", "8"))
+
+# Tools that write through the workspace resolver, and the argument names that carry a path.
+WRITE_TOOLS = ("save_file", "replace_in_file", "apply_patch")
+PATH_ARGS = ("filename", "file_name", "path", "file_path", "directory")
+# Conflict key of shell commands: they may touch any file, so they conflict with every other call
+BARRIER = "run_command"
+
+
+def conflict_key(tool_name: str, args: Dict[str, Any]) -> str:
+    """Calls with the same key run one after another, in order; different keys run concurrently.
+
+    The key is the absolute path a call touches (writes resolve through the workspace and reads
+    through the task root, as the tools themselves do). Shell commands get the BARRIER key:
+    run_tool_batch runs each one alone, after every earlier call and before every later one.
+    """
+    if tool_name == "run_command":
+        return BARRIER
+    path = next((args[k] for k in PATH_ARGS if args.get(k)), None)
+    if path is None:
+        return f"{tool_name}:{id(args)}"
+    path = resolve_path(path) if tool_name in WRITE_TOOLS else resolve_read_path(path)
+    return os.path.abspath(path)
+
+
+async def run_tool_batch(tools: Dict[str, Callable[..., str]],
+                         calls: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[str], float]:
+    """Runs independent tool calls concurrently: async tools on the event loop, the rest on the default thread pool.
+
+    Calls touching the same path are chained so a read sees the preceding write; shell commands
+    wait for every earlier call and hold back every later one. With write-behind,
+    repeated writes to one file are coalesced and reach disk once, when the batch ends (or before a
+    later call in the chain reads the file). Returns the results in call order and the wall time
+    of the whole batch.
+    """
+    results: List[str] = [""] * len(calls)
+    # Phases run one after another: ordinary calls (chained per key, chains concurrent), and each
+    # shell command on its own, so it sees every earlier write and no later call overtakes it
+    phases: List[Dict[str, List[int]]] = [{}]
+    for index, (tool_name, args) in enumerate(calls):
+        key = conflict_key(tool_name, args)
+        if key == BARRIER:
+            phases += [{key: [index]}, {}]
+        else:
+            phases[-1].setdefault(key, []).append(index)
+
+    async def run_chain(key: str, indexes: List[int]) -> None:
+        for index in indexes:
+            tool_name, args = calls[index]
+            if buffer is not None and tool_name not in WRITE_TOOLS:
+                # Anything other than a buffered write (reads, shell commands) sees the files on disk
+                await asyncio.to_thread(buffer.flush, None if key == BARRIER else key)
+            with span("tool", tool=tool_name, batch_size=len(calls)) as tool_span:
+                if inspect.iscoroutinefunction(tools[tool_name]):
+                    results[index] = await tools[tool_name](**args)
+                else:
+                    # to_thread copies the context, so the per-task workspace and trace follow the call
+                    results[index] = await asyncio.to_thread(tools[tool_name], **args)
+                tool_span["result_chars"] = len(results[index])
+
+    start = time.perf_counter()
+    with write_behind(WRITE_BEHIND) as buffer:
+        for chains in phases:
+            await asyncio.gather(*(run_chain(key, indexes) for key, indexes in chains.items()))
+        if buffer is not None:
+            await asyncio.to_thread(buffer.flush)
+    if buffer is not None and buffer.writes > buffer.files_written:
+        print(f">> Coalesced {buffer.writes} writes into {buffer.files_written} file write(s)")
+    return results, time.perf_counter() - start
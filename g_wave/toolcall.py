@@ -0,0 +1,79 @@
+import inspect
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# --- Schema Generation ---
+# Tool parameters are plain strings unless annotated otherwise.
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+def tool_schema(name: str, fn: Callable, exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """JSON schema of one tool, built from its signature and docstring."""
+    properties: Dict[str, Any] = {}
+    required: List[str] = []
+    for param in inspect.signature(fn).parameters.values():
+        if param.name in exclude or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        properties[param.name] = {"type": JSON_TYPES.get(param.annotation, "string")}
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+    return {
+        "name": name,
+        "description": inspect.getdoc(fn) or "",
+        "parameters": {"type": "object", "properties": properties, "required": required},
+    }
+
+
+def tool_schemas(tools: Dict[str, Callable], exclude: Optional[Dict[str, Iterable[str]]] = None) -> List[Dict[str, Any]]:
+    """Schemas for every tool; `exclude` maps tool names to parameters the model must not fill."""
+    exclude = exclude or {}
+    return [tool_schema(name, fn, exclude.get(name, ())) for name, fn in tools.items()]
+
+
+# --- Parsing ---
+def extract_json(text: str) -> Dict[str, Any]:
+    """Returns the first JSON object in `text`, tolerating ``` fences and surrounding prose."""
+    text = re.sub(r"```(?:json)?", "", text)
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    raise ValueError(f"No JSON object found in model output: {text[:200]!r}")
+
+
+def check_tool_call(tool_name: str, args: Any, schemas: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Validates one call against `schemas`; returns (tool_name, args)."""
+    if not isinstance(args, dict):
+        raise ValueError(f"Tool call arguments must be an object, got {type(args).__name__}.")
+    schema = next((s for s in schemas if s["name"] == tool_name), None)
+    if schema is None:
+        raise ValueError(f"Tool '{tool_name}' not found.")
+    missing = [p for p in schema["parameters"]["required"] if p not in args]
+    if missing:
+        raise ValueError(f"{tool_name} requires {', '.join(repr(p) for p in missing)} parameter(s)")
+    return tool_name, args
+
+
+def parse_tool_calls(text: str, schemas: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], str]:
+    """Parses a `{"thoughts", "tool", "args"}` or `{"thoughts", "tool_calls": [...]}` reply.
+
+    Returns ([(tool_name, args), ...], thoughts), each call checked against `schemas`.
+    """
+    reply = extract_json(text)
+    raw_calls = reply.get("tool_calls")
+    if raw_calls is None:
+        raw_calls = [reply]
+    if not isinstance(raw_calls, list) or not raw_calls:
+        raise ValueError("'tool_calls' must be a non-empty list.")
+    calls = []
+    for call in raw_calls:
+        if not isinstance(call, dict):
+            raise ValueError(f"Each tool call must be an object, got {type(call).__name__}.")
+        calls.append(check_tool_call(call.get("tool") or call.get("name"),
+                                     call.get("args") or call.get("arguments") or {}, schemas))
+    return calls, str(reply.get("thoughts", ""))
@@ -0,0 +1,140 @@
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+# --- Trace Configuration ---
+# Spans are appended as JSON lines to this file. The environment variables let
+# the staging subprocess join the parent's trace.
+TRACE_ENV = "G_WAVE_TRACE"
+TRACE_PARENT_ENV = "G_WAVE_TRACE_PARENT"
+TRACE_ID_ENV = "G_WAVE_TRACE_ID"
+
+_trace_path: Optional[str] = os.getenv(TRACE_ENV) or None
+_trace_id = contextvars.ContextVar("g_wave_trace_id", default=os.getenv(TRACE_ID_ENV) or uuid.uuid4().hex[:16])
+_current_span = contextvars.ContextVar("g_wave_current_span", default=os.getenv(TRACE_PARENT_ENV) or None)
+_span_attrs = contextvars.ContextVar("g_wave_span_attrs", default={})
+_write_lock = threading.Lock()
+
+
+def configure_tracing(path: Optional[str]) -> None:
+    """Enables span export to `path` (JSONL), or disables tracing when `path` is None."""
+    global _trace_path
+    _trace_path = path
+    if path:
+        os.environ[TRACE_ENV] = path
+    else:
+        os.environ.pop(TRACE_ENV, None)
+
+
+def tracing_enabled() -> bool:
+    return bool(_trace_path)
+
+
+def annotate(**attrs: Any) -> None:
+    """Adds attributes (e.g. the loop number) to every span opened later within the enclosing span."""
+    _span_attrs.set({**_span_attrs.get(), **attrs})
+
+
+def child_env() -> Dict[str, str]:
+    """Environment for a subprocess whose spans should nest under the current span."""
+    env = dict(os.environ)
+    if _trace_path:
+        env[TRACE_ENV] = _trace_path
+        env[TRACE_ID_ENV] = _trace_id.get()
+        if _current_span.get():
+            env[TRACE_PARENT_ENV] = _current_span.get()
+    return env
+
+
+def _write(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        with open(_trace_path, "a") as f:
+            f.write(line + "\n")
+
+
+@contextlib.contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Times a stage of the agent loop and appends it to the trace file.
+
+    Yields a dict; anything the caller adds to it (model, sizes, outcome) is
+    recorded with the span. Exceptions mark the span's outcome as an error.
+    """
+    record: Dict[str, Any] = {**_span_attrs.get(), **attrs}
+    if not _trace_path:
+        yield record
+        return
+
+    saved_attrs = _span_attrs.get()
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.time()
+    try:
+        yield record
+        record.setdefault("outcome", "ok")
+    except BaseException as e:
+        record["outcome"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current_span.reset(token)
+        _span_attrs.set(saved_attrs)
+        end = time.time()
+        record.update(
+            trace_id=_trace_id.get(), span_id=span_id, parent_id=parent_id, stage=stage,
+            start=start, end=end, duration_ms=round((end - start) * 1000, 3), pid=os.getpid(),
+        )
+        _write(record)
+
+
+# --- Summaries ---
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    spans = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    return spans
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 < pct <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-stage count, error count and p50/p95/max latency in milliseconds."""
+    by_stage: Dict[str, List[Dict[str, Any]]] = {}
+    for record in spans:
+        by_stage.setdefault(record["stage"], []).append(record)
+    summary = {}
+    for stage, records in by_stage.items():
+        durations = [r["duration_ms"] for r in records]
+        summary[stage] = {
+            "count": len(records),
+            "errors": sum(1 for r in records if r.get("outcome") == "error"),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "max_ms": max(durations),
+            "total_ms": sum(durations),
+        }
+    return summary
+
+
+def format_summary(summary: Dict[str, Dict[str, Any]]) -> str:
+    lines = [f"{'stage':<18} {'count':>6} {'errors':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total s':>9}"]
+    for stage, s in sorted(summary.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        lines.append(f"{stage:<18} {s['count']:>6} {s['errors']:>6} {s['p50_ms']:>10.1f} "
+                     f"{s['p95_ms']:>10.1f} {s['max_ms']:>10.1f} {s['total_ms'] / 1000:>9.2f}")
+    return "\n".join(lines)
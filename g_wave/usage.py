@@ -0,0 +1,176 @@
+import contextvars
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from g_wave.models import PROVIDERS, resolve
+
+# --- Pricing ---
+# USD per 1M tokens. Override or extend with a JSON file of the same shape via
+# G_WAVE_PRICING=/path/to/pricing.json or `g_wave "task" --pricing pricing.json`.
+DEFAULT_PRICING: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+    "claude-3-5-sonnet-20241022": {"input": 3.00, "output": 15.00},
+    "grok-2-1212": {"input": 2.00, "output": 10.00},
+    "moonshot-v1-8k": {"input": 0.20, "output": 2.00},
+}
+
+# Output tokens reserved for a call when the role has no completed calls to average over yet
+DEFAULT_OUTPUT_TOKENS = int(os.getenv("G_WAVE_DEFAULT_OUTPUT_TOKENS", "1000"))
+
+
+class BudgetExceeded(Exception):
+    """Raised before a model call that would take the run past its cost cap."""
+
+
+def load_pricing(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Returns DEFAULT_PRICING overlaid with the JSON rate table at `path` (or $G_WAVE_PRICING)."""
+    pricing = {model: dict(rates) for model, rates in DEFAULT_PRICING.items()}
+    path = path or os.getenv("G_WAVE_PRICING")
+    if path:
+        with open(path, "r") as f:
+            pricing.update(json.load(f))
+    return pricing
+
+
+def provider_for(model: str, role: str) -> str:
+    """Finds the provider serving `model`, falling back to the provider assigned to `role`."""
+    for provider, spec in PROVIDERS.items():
+        if spec["kwargs"].get("model") == model:
+            return provider
+    return resolve(role)
+
+
+class UsageTracker:
+    """Accumulates token usage and cost for every model call of a run (including sub-runs)."""
+
+    def __init__(self, pricing: Optional[Dict[str, Dict[str, float]]] = None, max_cost: Optional[float] = None):
+        self.pricing = pricing if pricing is not None else load_pricing()
+        self.max_cost = max_cost
+        self.loop = 0
+        self.records: List[Dict[str, Any]] = []
+        # Totals of the part of a resumed run before it was interrupted; they count toward max_cost
+        self.carried = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+
+    def price(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        rates = self.pricing.get(model, {})
+        return (input_tokens * rates.get("input", 0.0) + output_tokens * rates.get("output", 0.0)) / 1_000_000
+
+    @property
+    def total_cost(self) -> float:
+        return self.carried["cost"] + sum(r["cost"] for r in self.records)
+
+    def totals(self) -> Dict[str, Any]:
+        """Calls, tokens and cost so far, including any carried over from before a resume."""
+        return {
+            "calls": self.carried["calls"] + len(self.records),
+            "input_tokens": self.carried["input_tokens"] + sum(r["input_tokens"] for r in self.records),
+            "output_tokens": self.carried["output_tokens"] + sum(r["output_tokens"] for r in self.records),
+            "cost": self.total_cost,
+        }
+
+    def expected_output_tokens(self, role: Optional[str] = None) -> int:
+        """Average output tokens of the role's uncached calls so far, or DEFAULT_OUTPUT_TOKENS."""
+        outputs = [r["output_tokens"] for r in self.records
+                   if not r["cached"] and not r.get("cancelled") and (role is None or r["role"] == role)]
+        return round(sum(outputs) / len(outputs)) if outputs else DEFAULT_OUTPUT_TOKENS
+
+    def check_budget(self, model: str, prompt_tokens: int, role: Optional[str] = None, reserved: float = 0.0) -> None:
+        """Raises BudgetExceeded if sending `prompt_tokens` more to `model`, plus the reply the
+        role usually gets back, would exceed max_cost. `reserved` is the cost of calls still in flight."""
+        if self.max_cost is None:
+            return
+        projected = self.total_cost + reserved + self.price(model, prompt_tokens, self.expected_output_tokens(role))
+        if projected > self.max_cost:
+            raise BudgetExceeded(
+                f"Cost cap of ${self.max_cost:.4f} reached (spent ${self.total_cost:.4f}, "
+                f"next {model} call needs ~${projected - self.total_cost - reserved:.4f})."
+            )
+
+    def record(self, role: str, stage: str, model: str, usage: Optional[Dict[str, Any]],
+               prompt_chars: int = 0, response_chars: int = 0, cached: bool = False,
+               provider: Optional[str] = None, cancelled: bool = False) -> Dict[str, Any]:
+        """Adds one call. Missing usage metadata is estimated from character counts (~4 chars/token).
+
+        A `cancelled` call (the losing side of a hedge) is billed for its prompt only; providers
+        don't report usage for requests cut off mid-reply.
+        """
+        if cancelled:
+            input_tokens, output_tokens = (prompt_chars + 3) // 4, 0
+            estimated = True
+        elif cached:
+            input_tokens = output_tokens = 0
+            estimated = False
+        elif usage:
+            input_tokens = int(usage.get("input_tokens", 0))
+            output_tokens = int(usage.get("output_tokens", 0))
+            estimated = False
+        else:
+            input_tokens, output_tokens = (prompt_chars + 3) // 4, (response_chars + 3) // 4
+            estimated = True
+        entry = {
+            "loop": self.loop, "role": role, "stage": stage, "model": model,
+            "provider": provider or provider_for(model, role), "input_tokens": input_tokens,
+            "output_tokens": output_tokens, "cost": self.price(model, input_tokens, output_tokens),
+            "cached": cached, "estimated": estimated,
+        }
+        if cancelled:
+            entry["cancelled"] = True
+        self.records.append(entry)
+        return entry
+
+    def _group(self, key: str) -> Dict[Any, Dict[str, Any]]:
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for r in self.records:
+            g = groups.setdefault(r[key], {"calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+            g["calls"] += 1
+            g["cached_calls"] += int(r["cached"])
+            g["input_tokens"] += r["input_tokens"]
+            g["output_tokens"] += r["output_tokens"]
+            g["cost"] += r["cost"]
+        return groups
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **self.totals(),
+            "carried": dict(self.carried),
+            "max_cost": self.max_cost,
+            "estimated_calls": sum(1 for r in self.records if r["estimated"]),
+            "by_role": self._group("role"),
+            "by_provider": self._group("provider"),
+            "by_stage": self._group("stage"),
+            "by_loop": self._group("loop"),
+        }
+
+    def report(self) -> str:
+        s = self.summary()
+        lines = [f"Tokens: {s['input_tokens']} in / {s['output_tokens']} out over {s['calls']} calls, "
+                 f"cost ${s['cost']:.4f}" + (f" (cap ${s['max_cost']:.4f})" if s["max_cost"] is not None else "")]
+        if s["carried"]["calls"]:
+            lines.append(f"  (including {s['carried']['calls']} calls and ${s['carried']['cost']:.4f} from before the resume)")
+        if s["estimated_calls"]:
+            lines.append(f"  ({s['estimated_calls']} calls had no usage metadata; their tokens are estimated)")
+        for title, key in (("By role", "by_role"), ("By provider", "by_provider"), ("By stage", "by_stage")):
+            lines.append(f"{title}:")
+            for name, g in sorted(s[key].items(), key=lambda item: item[1]["cost"], reverse=True):
+                lines.append(f"  {name:<16} {g['calls']:>4} calls ({g['cached_calls']} cached) "
+                             f"{g['input_tokens']:>9} in {g['output_tokens']:>8} out  ${g['cost']:.4f}")
+        return "\n".join(lines)
+
+
+# --- Active Tracker ---
+_tracker: contextvars.ContextVar = contextvars.ContextVar("g_wave_usage_tracker", default=None)
+
+
+def current_tracker() -> Optional[UsageTracker]:
+    """The tracker of the run executing in this context, if any."""
+    return _tracker.get()
+
+
+def start_tracking(tracker: UsageTracker):
+    """Makes `tracker` current for this context; returns a token for stop_tracking()."""
+    return _tracker.set(tracker)
+
+
+def stop_tracking(token) -> None:
+    _tracker.reset(token)
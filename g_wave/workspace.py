@@ -0,0 +1,61 @@
+import contextvars
+import os
+from pathlib import Path
+from typing import Optional
+
+# --- Workspace Configuration ---
+WORKSPACE_DIR = "g_wave_workspace"
+
+# The active workspace is per-context so concurrent batch tasks can each write
+# into their own directory while sharing one process.
+_workspace = contextvars.ContextVar("g_wave_workspace", default=WORKSPACE_DIR)
+# Batch tasks also get their own working directory: relative reads, listings, searches and
+# shell commands resolve against it instead of the shared process cwd (None = the process cwd).
+_root = contextvars.ContextVar("g_wave_task_root", default=None)
+
+
+def current_workspace() -> str:
+    return _workspace.get()
+
+
+def use_workspace(path: str):
+    """Makes `path` the workspace for this context; returns a token for reset_workspace()."""
+    return _workspace.set(path)
+
+
+def reset_workspace(token) -> None:
+    _workspace.reset(token)
+
+
+def current_root() -> Optional[str]:
+    return _root.get()
+
+
+def use_root(path: Optional[str]):
+    """Makes `path` the working directory of this context's tools; returns a token for reset_root()."""
+    return _root.set(path)
+
+
+def reset_root(token) -> None:
+    _root.reset(token)
+
+
+def resolve_read_path(filepath: str) -> str:
+    """Resolves a path to read or list: relative paths land in the task's root, if it has one."""
+    root = current_root()
+    if root is None or os.path.isabs(filepath):
+        return filepath
+    normalized = os.path.normpath(filepath)
+    if normalized == os.path.normpath(root) or normalized.startswith(os.path.normpath(root) + os.sep):
+        return filepath  # already spelled from the process cwd, e.g. copied from a save_file result
+    return os.path.join(root, filepath)
+
+
+def resolve_path(filepath: str) -> Path:
+    """Resolves a tool path: absolute paths are used as-is, relative ones land in the workspace."""
+    workspace = current_workspace()
+    if os.path.isabs(filepath):
+        return Path(filepath)
+    if not filepath.startswith(workspace):
+        return Path(workspace) / filepath
+    return Path(filepath)
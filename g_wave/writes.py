@@ -0,0 +1,158 @@
+import contextlib
+import contextvars
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from g_wave.fsindex import file_changed
+from g_wave.journal import current_journal
+
+# --- Write Configuration ---
+# With write-behind on (opt-in), writes made during one tool batch are held in memory and each
+# file is written once when the batch ends (or before anything else in it reads the file).
+# The tools then report success before the bytes are on disk.
+WRITE_BEHIND = os.getenv("G_WAVE_WRITE_BEHIND", "0") not in ("0", "false", "off")
+
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Read once at import: os.umask can only be queried by setting it, which races with other threads
+UMASK = _read_umask()
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """Writes `text` to a temp file beside `path`, fsyncs it, then renames it over `path`.
+
+    Symlinks are followed, so the link stays and its target is replaced. The file keeps its
+    mode; a new file gets the usual 0o666 minus the umask (the temp file itself is 0o600).
+    """
+    path = Path(os.path.realpath(path))
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = path.stat().st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def copy_atomic(source: Path, path: Path) -> None:
+    """Replaces `path` with a byte-for-byte copy of `source` (mode and times included), atomically."""
+    path = Path(os.path.realpath(path))
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, open(source, "rb") as src:
+            shutil.copyfileobj(src, f)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copystat(source, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def commit_write(path: Path, text: str) -> None:
+    """Journals `path`'s previous content (once per run), then replaces it atomically."""
+    journal = current_journal()
+    if journal is not None:
+        journal.record(path)
+    write_atomic(path, text)
+    file_changed(str(path))
+
+
+# --- Write-Behind Buffer ---
+class WriteBuffer:
+    """Pending file contents for one tool batch; repeated writes to a file coalesce into one."""
+
+    def __init__(self):
+        self.pending: Dict[str, str] = {}
+        self.writes = 0
+        self.files_written = 0
+        self.lock = threading.Lock()  # batched tools run on a thread pool
+
+    def put(self, path: Path, text: str) -> None:
+        with self.lock:
+            self.pending[os.path.abspath(path)] = text
+            self.writes += 1
+
+    def get(self, path: Path) -> Optional[str]:
+        with self.lock:
+            return self.pending.get(os.path.abspath(path))
+
+    def flush(self, path: Optional[str] = None) -> None:
+        """Writes pending content to disk: one file, or everything when `path` is None."""
+        with self.lock:
+            if path is None:
+                items = list(self.pending.items())
+                self.pending.clear()
+            else:
+                key = os.path.abspath(path)
+                items = [(key, self.pending.pop(key))] if key in self.pending else []
+        for key, text in items:
+            commit_write(Path(key), text)
+            self.files_written += 1
+
+
+_buffer: contextvars.ContextVar = contextvars.ContextVar("g_wave_write_buffer", default=None)
+
+
+def current_buffer() -> Optional[WriteBuffer]:
+    return _buffer.get()
+
+
+@contextlib.contextmanager
+def write_behind(enabled: bool = True) -> Iterator[Optional[WriteBuffer]]:
+    """Buffers writes made in this context until the block exits, then flushes them."""
+    if not enabled or _buffer.get() is not None:
+        yield _buffer.get()
+        return
+    buffer = WriteBuffer()
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+        buffer.flush()
+
+
+# --- Tool-Facing Helpers ---
+def write_text(path: Path, text: str) -> None:
+    """Writes `text` to `path`: into the active write-behind buffer, or atomically to disk."""
+    buffer = _buffer.get()
+    if buffer is not None:
+        buffer.put(path, text)
+    else:
+        commit_write(path, text)
+
+
+def read_current(path: Path) -> str:
+    """Contents of `path` including writes still pending in the buffer (newlines untranslated)."""
+    buffer = _buffer.get()
+    pending = buffer.get(path) if buffer is not None else None
+    if pending is not None:
+        return pending
+    with open(path, "r", newline="") as f:
+        return f.read()
+
+
+def file_exists(path: Path) -> bool:
+    buffer = _buffer.get()
+    return path.is_file() or (buffer is not None and buffer.get(path) is not None)
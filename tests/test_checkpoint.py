@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from g_wave.checkpoint import LOG_FILE, RunCheckpoint, load_checkpoint, prune_checkpoints
+from g_wave.journal import RunJournal, start_journal, stop_journal
+from g_wave.usage import BudgetExceeded, UsageTracker
+
+
+def new_state():
+    return {"task": "t", "history": [], "files_content": {}, "context_usage": [], "loops_used": 0,
+            "status": "running", "plan": []}
+
+
+def run_loops(checkpoint, state, loops, files):
+    for loop in range(1, loops + 1):
+        state["loops_used"] = loop
+        state["history"].append(f"action {loop}")
+        state["context_usage"].append({"loop": loop})
+        for name in files(loop):
+            state["files_content"][name] = f"{name} at loop {loop}"
+        checkpoint.record(state)
+
+
+def test_record_and_restore_from_log_only(tmp_path):
+    checkpoint = RunCheckpoint("run1", str(tmp_path))
+    checkpoint.start({"task": "t"})
+    state = new_state()
+    run_loops(checkpoint, state, 3, lambda loop: [f"f{loop}.py"])
+    state["files_content"].pop("f1.py")
+    state["loops_used"] = 4
+    checkpoint.record(state)
+
+    restored = load_checkpoint("run1", str(tmp_path)).restore()
+    assert restored == state
+    assert not (tmp_path / "run1" / "snapshot.json").exists()
+
+
+def test_snapshot_plus_later_records(tmp_path, monkeypatch):
+    monkeypatch.setattr("g_wave.checkpoint.SNAPSHOT_EVERY", 2)
+    checkpoint = RunCheckpoint("run2", str(tmp_path))
+    checkpoint.start({"task": "t"})
+    state = new_state()
+    run_loops(checkpoint, state, 5, lambda loop: ["a.py"] if loop % 2 else ["b.py"])
+    assert (tmp_path / "run2" / "snapshot.json").exists()
+    assert RunCheckpoint("run2", str(tmp_path)).restore() == state
+
+
+def test_rewritten_history_forces_a_snapshot(tmp_path):
+    checkpoint = RunCheckpoint("run3", str(tmp_path))
+    state = new_state()
+    checkpoint.start({})
+    run_loops(checkpoint, state, 2, lambda loop: [])
+    state["history"] = ["compacted"]
+    state["loops_used"] = 3
+    checkpoint.record(state)
+    assert RunCheckpoint("run3", str(tmp_path)).restore()["history"] == ["compacted"]
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    checkpoint = RunCheckpoint("run4", str(tmp_path))
+    checkpoint.start({})
+    state = new_state()
+    run_loops(checkpoint, state, 2, lambda loop: [])
+    with open(tmp_path / "run4" / LOG_FILE, "a") as f:
+        f.write(json.dumps({"loop": 3})[:8])
+    assert RunCheckpoint("run4", str(tmp_path)).restore()["loops_used"] == 2
+
+
+def test_revalidate_rereads_changed_and_drops_deleted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("same.txt", "changed.txt", "gone.txt"):
+        (tmp_path / name).write_text(name)
+    checkpoint = RunCheckpoint("run5", str(tmp_path / "runs"))
+    checkpoint.start({})
+    state = new_state()
+    state["loops_used"] = 1
+    state["files_content"] = {name: name for name in ("same.txt", "changed.txt", "gone.txt")}
+    checkpoint.record(state)
+    os.utime("changed.txt", ns=(1, 1))
+    os.remove("gone.txt")
+
+    resumed = RunCheckpoint("run5", str(tmp_path / "runs"))
+    restored = resumed.restore()
+    notes = resumed.revalidate(restored, lambda name: "re-read")
+    assert restored["files_content"] == {"same.txt": "same.txt", "changed.txt": "re-read"}
+    assert len(notes) == 2
+
+
+def test_prune_spares_runs_in_progress(tmp_path):
+    active = RunCheckpoint("active", str(tmp_path))
+    active.start({})
+    os.utime(tmp_path / "active", (1, 1))  # the oldest directory
+    for n in range(3):
+        RunCheckpoint(f"done{n}", str(tmp_path)).start({})
+    token = start_journal(RunJournal("active", str(tmp_path / "journal")))
+    try:
+        prune_checkpoints(str(tmp_path), keep=1)
+    finally:
+        stop_journal(token)
+    assert len(os.listdir(tmp_path)) == 2  # the newest finished run, and the active one
+    assert (tmp_path / "active").exists()
+
+
+def test_usage_before_a_resume_counts_toward_the_cap(tmp_path):
+    checkpoint = RunCheckpoint("run1", str(tmp_path))
+    checkpoint.start({"task": "t"})
+    state = new_state()
+    state["usage_totals"] = {"calls": 3, "input_tokens": 300, "output_tokens": 30, "cost": 0.9}
+    run_loops(checkpoint, state, 1, lambda loop: [])
+
+    tracker = UsageTracker(pricing={"m": {"input": 1_000_000, "output": 0}}, max_cost=1.0)
+    tracker.carried.update(load_checkpoint("run1", str(tmp_path)).restore()["usage_totals"])
+    assert tracker.totals()["calls"] == 3
+    with pytest.raises(BudgetExceeded):
+        tracker.check_budget("m", 1, "actor")  # $1 more on top of the $0.90 already spent
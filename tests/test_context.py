@@ -0,0 +1,53 @@
+from g_wave import context
+from g_wave.context import build_context, dedupe_history, estimate_tokens, fit_history
+
+BODY = "def handler(event):\n    return process(event)\n" * 4
+
+
+def test_duplicate_file_bodies_become_a_reference():
+    history = [f"Action: read_file|filename=app.py, Result: {BODY}", "Action: list_files|path=., Result: app.py"]
+    deduped = dedupe_history(history, {"app.py": BODY})
+    assert deduped[0] == "Action: read_file|filename=app.py, Result: [contents of app.py shown in File Contents]"
+    assert deduped[1] == history[1]
+
+
+def test_short_bodies_are_left_in_history():
+    history = ["Action: read_file|filename=x.txt, Result: ok"]
+    assert dedupe_history(history, {"x.txt": "ok"}) == history
+
+
+def test_last_entries_are_kept_verbatim(monkeypatch):
+    monkeypatch.setattr(context, "RECENT_HISTORY", 3)
+    history = [f"Action {n}\nline two of {n}" for n in range(10)]
+    lines = fit_history(history, {}, 10_000).split("\n")
+    assert lines[:7] == [f"Action {n} ..." for n in range(7)]  # older entries compacted to their first line
+    assert "\n".join(lines[7:]) == "\n".join(history[7:])
+
+
+def test_oldest_history_is_dropped_first():
+    history = [f"Action {n}: " + "x" * 400 for n in range(20)]
+    text = fit_history(history, {}, 500)
+    assert estimate_tokens(text) <= 520
+    assert text.startswith("[") and "earlier actions omitted]" in text.split("\n")[0]
+    assert text.endswith(history[-1])
+
+
+def test_build_context_stays_within_budget():
+    state = {
+        "history": [f"Action {n}: " + "y" * 2000 for n in range(30)],
+        "files_content": {f"f{n}.py": "z" * 8000 for n in range(6)},
+    }
+    reserved = "task " * 200
+    result = build_context("planner", state, reserved=reserved, budgets={"planner": 4000})
+    usage = result["usage"]
+    assert usage["budget"] == 4000
+    assert usage["reserved"] == estimate_tokens(reserved)
+    assert usage["total"] <= 4000 * 1.05  # section headers and truncation markers are a few tokens each
+    assert usage["history"] > 0 and usage["files_content"] > 0
+
+
+def test_coder_gets_no_history_and_scoped_files():
+    state = {"history": ["Action 1"], "files_content": {"a.py": "a", "b.py": "b"}}
+    result = build_context("coder", state, files={"a.py": "a"})
+    assert result["history"] == ""
+    assert "a.py" in result["files_content"] and "b.py" not in result["files_content"]
@@ -0,0 +1,27 @@
+from g_wave.fsindex import WorkspaceIndex, list_entries
+
+
+def test_gitignore_rules(tmp_path):
+    (tmp_path / ".gitignore").write_text("build/\n*.log\n!keep.log\n")
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "out.o").write_text("x")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("x")
+    for name in ("debug.log", "keep.log"):
+        (tmp_path / name).write_text("x")
+    index = WorkspaceIndex(str(tmp_path))
+    assert sorted(index.entries) == [".gitignore", "keep.log", "src", "src/app.py"]
+
+
+def test_listing_an_ignored_directory_scans_it_on_demand(tmp_path, monkeypatch):
+    (tmp_path / ".gitignore").write_text("build/\n")
+    (tmp_path / "build" / "lib").mkdir(parents=True)
+    (tmp_path / "build" / "lib" / "out.o").write_text("x")
+    (tmp_path / "src").mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    listing = list_entries("build", recursive=True)
+    assert "is ignored by .gitignore" in listing
+    assert "lib/out.o (1 B)" in listing
+    assert "out.o (1 B)" in list_entries("build/lib")
+    assert list_entries("src") == "No files in directory."
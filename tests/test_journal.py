@@ -0,0 +1,40 @@
+import os
+
+from g_wave.journal import RunJournal, load_journal
+
+
+def test_rollback_restores_non_utf8_files_and_deletes_created_ones(tmp_path):
+    latin1 = tmp_path / "legacy.py"
+    latin1.write_bytes(b"# caf\xe9\n")
+    binary = tmp_path / "image.bin"
+    binary.write_bytes(bytes(range(256)))
+    created = tmp_path / "new.txt"
+    journal = RunJournal("run", str(tmp_path / "journal"))
+    for path in (latin1, binary, created):
+        journal.record(path)
+        path.write_text("changed by the run")
+
+    restored = load_journal("run", str(tmp_path / "journal")).rollback()
+    assert len(restored) == 3
+    assert latin1.read_bytes() == b"# caf\xe9\n"
+    assert binary.read_bytes() == bytes(range(256))
+    assert not created.exists()
+    assert not (tmp_path / "journal" / "run").exists()
+
+
+def test_rollback_continues_past_a_failed_file(tmp_path):
+    first, second = tmp_path / "a.txt", tmp_path / "locked" / "b.txt"
+    second.parent.mkdir()
+    first.write_text("a")
+    second.write_text("b")
+    journal = RunJournal("run", str(tmp_path / "journal"))
+    for path in (first, second):
+        journal.record(path)
+        path.write_text("changed")
+    os.remove(journal.dir / "000001.orig")  # b.txt's backup is gone
+
+    restored = journal.rollback()
+    assert restored == [str(first)]
+    assert first.read_text() == "a"
+    assert list(journal.failed) == [str(second)]
+    assert list(load_journal("run", str(tmp_path / "journal")).recorded) == [str(second)]
@@ -0,0 +1,59 @@
+import pytest
+
+from g_wave.patching import PatchError, apply_hunks, parse_patch, patch_file
+
+SOURCE = "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+
+def test_search_replace_block():
+    patch = "<<<<<<< SEARCH\n    return a - b\n=======\n    return a - b - 0\n>>>>>>> REPLACE\n"
+    text, notes = apply_hunks(SOURCE, parse_patch(patch))
+    assert text == SOURCE.replace("return a - b", "return a - b - 0")
+    assert notes == ["hunk 1: exact match at line 6"]
+
+
+def test_unified_diff_with_fence_and_wrong_line_hint():
+    patch = "```diff\n--- a/m.py\n+++ b/m.py\n@@ -40,2 +40,2 @@\n def add(a, b):\n-    return a + b\n+    return b + a\n```"
+    text, _ = apply_hunks(SOURCE, parse_patch(patch))
+    assert "return b + a" in text and "return a - b" in text
+
+
+def test_whitespace_only_difference_matches():
+    patch = "<<<<<<< SEARCH\nreturn a + b\n=======\n    return a + b + 1\n>>>>>>> REPLACE\n"
+    text, notes = apply_hunks(SOURCE, parse_patch(patch))
+    assert "return a + b + 1" in text
+    assert "whitespace" in notes[0]
+
+
+def test_crlf_and_trailing_newline_kept():
+    text, _ = apply_hunks("a\r\nb\r\n", parse_patch("<<<<<<< SEARCH\nb\n=======\nc\n>>>>>>> REPLACE\n"))
+    assert text == "a\r\nc\r\n"
+
+
+def test_unparseable_patch():
+    with pytest.raises(PatchError, match="Unrecognized patch format"):
+        parse_patch("just some prose")
+
+
+def test_failed_hunk_leaves_file_unchanged(tmp_path):
+    path = tmp_path / "m.py"
+    path.write_text(SOURCE)
+    patch = ("<<<<<<< SEARCH\n    return a + b\n=======\n    return 0\n>>>>>>> REPLACE\n"
+             "<<<<<<< SEARCH\nnothing like this\n=======\nx\n>>>>>>> REPLACE\n")
+    with pytest.raises(PatchError, match="Hunk 2/2 did not apply"):
+        patch_file(path, patch)
+    assert path.read_text() == SOURCE
+
+
+def test_patch_file_writes_every_hunk(tmp_path):
+    path = tmp_path / "m.py"
+    path.write_text(SOURCE)
+    patch = ("<<<<<<< SEARCH\n    return a + b\n=======\n    return 0\n>>>>>>> REPLACE\n"
+             "<<<<<<< SEARCH\n    return a - b\n=======\n    return 1\n>>>>>>> REPLACE\n")
+    assert patch_file(path, patch).startswith("Successfully patched")
+    assert path.read_text() == SOURCE.replace("a + b", "0").replace("a - b", "1")
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(PatchError, match="does not exist"):
+        patch_file(tmp_path / "missing.py", "<<<<<<< SEARCH\na\n=======\nb\n>>>>>>> REPLACE\n")
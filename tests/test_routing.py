@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from g_wave import routing
+from g_wave.ratelimit import call_with_retry, get_limiter, set_limits
+from g_wave.usage import UsageTracker
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_MIN_DELAY", 0.1)
+    routing.reset_health()
+    for _ in range(routing.HEDGE_MIN_SAMPLES):
+        routing.health("primary").record_success("actor", 0.01)
+    set_limits("primary")
+    set_limits("backup")
+    yield
+    routing.reset_health()
+
+
+def attempt_with(latencies):
+    async def attempt(provider, started):
+        async def call():
+            await asyncio.sleep(latencies[provider])
+            return provider
+        return await call_with_retry(provider, call, on_send=started)
+    return attempt
+
+
+def test_local_throttling_does_not_trigger_a_hedge():
+    set_limits("primary", rpm=60)
+    get_limiter("primary").requests.level = 0.0  # next request waits ~1 s locally
+    provider, _, info = asyncio.run(routing.route("actor", ["primary", "backup"],
+                                                  attempt_with({"primary": 0.01, "backup": 0.01})))
+    assert (provider, info["hedged"]) == ("primary", False)
+    assert max(routing.health("primary").latencies["actor"]) < 0.5  # the limiter wait isn't latency
+
+
+def test_slow_provider_is_hedged():
+    provider, _, info = asyncio.run(routing.route("actor", ["primary", "backup"],
+                                                  attempt_with({"primary": 2.0, "backup": 0.01})))
+    assert (provider, info["hedged"]) == ("backup", True)
+
+
+def test_failure_fails_over():
+    async def attempt(provider, started):
+        started()
+        if provider == "primary":
+            raise ValueError("boom")
+        return provider
+    provider, _, info = asyncio.run(routing.route("actor", ["primary", "backup"], attempt))
+    assert provider == "backup" and info["failed"] == ["primary"]
+
+
+def test_cancelled_hedge_loser_is_reported():
+    provider, _, info = asyncio.run(routing.route("actor", ["primary", "backup"],
+                                                  attempt_with({"primary": 2.0, "backup": 0.01})))
+    assert provider == "backup" and info["cancelled"] == ["primary"]
+
+
+def test_vetoed_hedge_is_not_sent_but_can_still_fail_over():
+    vetoed = []
+
+    def can_hedge(provider):
+        vetoed.append(provider)
+        return False
+
+    provider, _, info = asyncio.run(routing.route("actor", ["primary", "backup"],
+                                                  attempt_with({"primary": 0.3, "backup": 0.01}),
+                                                  can_hedge=can_hedge))
+    assert (provider, info["hedged"], vetoed) == ("primary", False, ["backup"])
+
+
+def test_cancelled_call_bills_its_prompt_only():
+    tracker = UsageTracker(pricing={"m": {"input": 1_000_000, "output": 0}})
+    tracker.record("actor", "actor", "m", {"input_tokens": 10, "output_tokens": 50})
+    entry = tracker.record("actor", "actor", "m", None, prompt_chars=40, cancelled=True)
+    assert (entry["input_tokens"], entry["output_tokens"], entry["cost"]) == (10, 0, 10.0)
+    assert tracker.expected_output_tokens("actor") == 50  # the cut-off reply doesn't drag the average down
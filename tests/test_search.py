@@ -0,0 +1,84 @@
+import os
+import re
+
+import pytest
+
+from g_wave.fsindex import WorkspaceIndex
+from g_wave.search import SearchIndex, query_fragments, search_workspace
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "a.py").write_text("def parse_config(path):\n    return load_yaml(path)\n")
+    (tmp_path / "b.py").write_text("class ConfigLoader:\n    pass\n")
+    (tmp_path / "c.txt").write_text("nothing relevant here\n")
+    (tmp_path / "blob.bin").write_bytes(b"\0parse_config")
+    index = SearchIndex(WorkspaceIndex(str(tmp_path)))
+    index.sync()
+    return index
+
+
+def paths(index, ids):
+    # Superseded file ids stay in the postings until compaction; search_workspace skips them too
+    return None if ids is None else {index.paths[i] for i in ids if index.paths[i] is not None}
+
+
+def test_whole_word_and_substring(index):
+    assert paths(index, index.candidates(["load_yaml"])) == {"a.py"}
+    assert paths(index, index.candidates(["config"])) == {"a.py", "b.py"}  # tokens are lowercased
+    assert paths(index, index.candidates(["onfigLoa"])) == {"b.py"}
+
+
+def test_every_fragment_must_match(index):
+    assert paths(index, index.candidates(["parse_config", "load_yaml"])) == {"a.py"}
+    assert paths(index, index.candidates(["parse_config", "ConfigLoader"])) == set()
+
+
+def test_word_boundaries_inside_a_fragment(index):
+    # "config(path" pins "config" as a token suffix and "path" as a token prefix
+    assert paths(index, index.candidates(["config(path"])) == {"a.py"}
+    assert paths(index, index.candidates(["loader(path"])) == set()
+
+
+def test_short_pieces_do_not_narrow(index):
+    assert index.candidates(["ab"]) is None
+
+
+def test_regex_fragments():
+    assert query_fragments(r"def \w+_config\(", True, 0) == ["def ", "_config("]
+    assert query_fragments(r"(foo|bar)", True, 0) == []
+    assert query_fragments("a.b", False, 0) == ["a.b"]
+
+
+def test_binary_files_are_skipped(index):
+    assert "blob.bin" in index.skipped
+    assert paths(index, index.candidates(["parse_config"])) == {"a.py"}
+
+
+def test_changed_and_deleted_files(tmp_path, index):
+    (tmp_path / "c.txt").write_text("now mentions parse_config too\n")
+    os.remove(tmp_path / "a.py")
+    os.utime(tmp_path / "c.txt", (1, 1))  # a different stamp even on coarse-mtime filesystems
+    index.fs.refresh()
+    assert index.sync() == (1, 1)
+    assert paths(index, index.candidates(["parse_config"])) == {"c.txt"}
+    assert index.dead == 2
+
+
+def test_search_workspace_output(tmp_path, monkeypatch, index):
+    monkeypatch.chdir(tmp_path)
+    result = search_workspace("load_yaml", context=0)
+    assert result.splitlines()[1] == "a.py:2:     return load_yaml(path)"
+    assert re.match(r"1 matches in 1 files", result)
+    assert search_workspace("missing_name").startswith("No matches")
+
+
+def test_search_inside_an_ignored_directory(tmp_path, monkeypatch):
+    (tmp_path / ".gitignore").write_text("vendor/\n")
+    (tmp_path / "vendor").mkdir()
+    (tmp_path / "vendor" / "lib.py").write_text("def vendored_helper():\n    pass\n")
+    monkeypatch.chdir(tmp_path)
+    assert search_workspace("vendored_helper").startswith("No matches")
+    result = search_workspace("vendored_helper", path="vendor", context=0)
+    assert result.splitlines()[1] == "lib.py:1: def vendored_helper():"
+    assert "ignored by .gitignore" in result.splitlines()[0]
@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from g_wave.toolbatch import run_tool_batch
+
+
+def test_command_waits_for_earlier_writes_and_holds_back_later_ones():
+    order = []
+
+    def save_file(filename):
+        time.sleep(0.05)
+        order.append(f"save {filename}")
+        return "saved"
+
+    async def run_command(command):
+        order.append(f"run {command}")
+        return "ran"
+
+    def read_file(filename):
+        order.append(f"read {filename}")
+        return "read"
+
+    tools = {"save_file": save_file, "run_command": run_command, "read_file": read_file}
+    calls = [("save_file", {"filename": "x.py"}), ("run_command", {"command": "python x.py"}),
+             ("read_file", {"filename": "y.txt"})]
+    results, _ = asyncio.run(run_tool_batch(tools, calls))
+    assert results == ["saved", "ran", "read"]
+    assert order == ["save x.py", "run python x.py", "read y.txt"]
+
+
+def test_independent_calls_run_concurrently():
+    def read_file(filename):
+        time.sleep(0.2)
+        return filename
+
+    calls = [("read_file", {"filename": f"f{n}.txt"}) for n in range(4)]
+    results, elapsed = asyncio.run(run_tool_batch({"read_file": read_file}, calls))
+    assert results == [f"f{n}.txt" for n in range(4)]
+    assert elapsed < 0.6
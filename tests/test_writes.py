@@ -0,0 +1,56 @@
+import os
+import stat
+
+from g_wave.writes import UMASK, copy_atomic, write_atomic
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_gets_umask_mode(tmp_path):
+    path = tmp_path / "new.txt"
+    write_atomic(path, "hello\n")
+    assert path.read_text() == "hello\n"
+    assert mode(path) == 0o666 & ~UMASK
+
+
+def test_existing_mode_is_kept(tmp_path):
+    path = tmp_path / "script.sh"
+    path.write_text("old")
+    os.chmod(path, 0o750)
+    write_atomic(path, "new")
+    assert path.read_text() == "new"
+    assert mode(path) == 0o750
+
+
+def test_symlink_target_is_replaced(tmp_path):
+    target = tmp_path / "target.txt"
+    target.write_text("old")
+    link = tmp_path / "link.txt"
+    link.symlink_to(target)
+    write_atomic(link, "new")
+    assert link.is_symlink()
+    assert target.read_text() == "new"
+
+
+def test_no_temp_files_left(tmp_path):
+    write_atomic(tmp_path / "a.txt", "x")
+    assert sorted(os.listdir(tmp_path)) == ["a.txt"]
+
+
+def test_newlines_are_not_translated(tmp_path):
+    path = tmp_path / "crlf.txt"
+    write_atomic(path, "a\r\nb\r\n")
+    assert path.read_bytes() == b"a\r\nb\r\n"
+
+
+def test_copy_atomic_copies_bytes_and_mode(tmp_path):
+    source = tmp_path / "backup.orig"
+    source.write_bytes(b"caf\xe9\x00\xff")
+    os.chmod(source, 0o741)
+    target = tmp_path / "target.bin"
+    target.write_text("new")
+    copy_atomic(source, target)
+    assert target.read_bytes() == b"caf\xe9\x00\xff"
+    assert mode(target) == 0o741